@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 
 import ui_widgets as ui
-from users import ensure_user_data_initialized
+from users import ensure_user_data_initialized, get_user_df
 from settings import initialize
 from ui_components import show_dual_metric_tiles
 import book_details_helpers as bdh
@@ -11,9 +11,9 @@ from books_helpers import truncate_csv
 initialize()
 ensure_user_data_initialized()
 
-df_book_summary    = st.session_state["df_cr_book_user_book_summary"]
-df_cr_book_cohorts = st.session_state["df_cr_book_user_cohorts"]
-df_cr_users        = st.session_state["df_cr_users"]
+df_book_summary    = get_user_df("df_cr_book_user_book_summary")
+df_cr_book_cohorts = get_user_df("df_cr_book_user_cohorts")
+df_cr_users        = get_user_df("df_cr_users")
 
 # -------------------------------------------------------
 # Helper: definition expander
@@ -3,7 +3,7 @@ import pandas as pd
 import plotly.express as px
 
 import ui_widgets as ui
-from users import ensure_user_data_initialized
+from users import ensure_user_data_initialized, get_user_df
 from settings import initialize
 
 from ui_components import plot_days_to_ra_by_tier, show_dual_metric_tiles, build_survival_curve_by_tier
@@ -12,8 +12,8 @@ import books_helpers as bh
 initialize()
 ensure_user_data_initialized()
 
-df_cr_book_user_cohorts = st.session_state["df_cr_book_user_cohorts"]
-df_cr_users = st.session_state["df_cr_users"]
+df_cr_book_user_cohorts = get_user_df("df_cr_book_user_cohorts")
+df_cr_users = get_user_df("df_cr_users")
 
 # -------------------------------------------------------
 # Helper: definition expander
@@ -0,0 +1,52 @@
+import streamlit as st
+import pandas as pd
+from millify import prettify
+import ui_widgets as ui
+from cache_keys import cache_key_stats
+from cache_stats import COMPUTE_SAMPLES, cache_report, source_report
+from result_cache import RESULT_CACHE, cache_usage
+from settings import initialize
+
+initialize()
+
+notes = pd.DataFrame(
+    [
+        ["Scope", "Counters are per server process and start at zero when it restarts."],
+        ["result cache", "cache_result functions: size-bounded, LRU, shared by all sessions (and across processes through the result store)."],
+        ["st.cache_data", "Chart functions and the BigQuery helpers; a hit is a call that did not recompute. Entries and evictions are not exposed by Streamlit."],
+        ["Compute times", f"Percentiles over the last {COMPUTE_SAMPLES} computes of each function (ms)."],
+    ],
+    columns=["Note", "Description"],
+)
+ui.display_definitions_table("Notes", notes)
+
+usage = cache_usage()
+key_stats = cache_key_stats()
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Result cache", f"{prettify(round(usage['bytes'] / 1e6, 1))} MB",
+            help=f"Budget {prettify(round(usage['max_bytes'] / 1e6))} MB")
+col2.metric("Cached results", prettify(usage["entries"]))
+col3.metric("Frames keyed by token", prettify(key_stats["token_keys"]),
+            help="DataFrame arguments keyed by dataset version instead of hashing their contents")
+saved = key_stats["estimated_seconds_saved"]
+col4.metric("Hashing time saved", "–" if saved is None else f"{saved:.2f}s")
+
+st.subheader("Cached functions")
+st.dataframe(cache_report(), hide_index=True, use_container_width=True)
+
+st.subheader("Data sources")
+st.dataframe(source_report(), hide_index=True, use_container_width=True)
+
+
+def clear_result_cache():
+    RESULT_CACHE.clear()
+    # Untick the confirmation, so the next clear has to be confirmed again
+    st.session_state["confirm_clear_result_cache"] = False
+
+
+confirmed = st.checkbox(
+    "Every session on this server recomputes its charts and metrics after the result cache is cleared",
+    key="confirm_clear_result_cache",
+)
+st.button("Clear result cache", disabled=not confirmed, on_click=clear_result_cache)
@@ -4,9 +4,8 @@ from millify import prettify
 import campaigns
 import ui_widgets as ui
 import pandas as pd
-settings.initialize()
-settings.init_campaign_data()
 from users import ensure_user_data_initialized
+settings.initialize()
 
 data_notes = pd.DataFrame(
     [
@@ -22,6 +21,7 @@ data_notes = pd.DataFrame(
 ## UI ##
 
 ensure_user_data_initialized()
+settings.init_campaign_data()
 
 ui.display_definitions_table("Campaign Data Notes",data_notes)
 
@@ -6,9 +6,11 @@ from users import (
     ensure_user_data_initialized,
     get_cohort_list,
     get_cohort_user_ids,
+    get_cohort_users,
     get_users_ftm_event_timeline,
     get_book_summary_for_cohort,
     get_books_for_user,
+    get_user_df,
 )
 from ui_components import (
     ftm_timeline_plot,
@@ -67,8 +69,8 @@ cohort = col1.selectbox("Select a cohort", cohorts)
 
 cohort_ids = get_cohort_user_ids(cohort_name=cohort)
 
-df_users_all = st.session_state["df_cr_users"].copy()
-cohort_users_df = df_users_all[df_users_all["cr_user_id"].isin(cohort_ids)].copy()
+df_users_all = get_user_df("df_cr_users")
+cohort_users_df = get_cohort_users(cohort)
 
 sort_options = {
     "User ID (A→Z)": ("cr_user_id", True),
@@ -1,7 +1,7 @@
 import streamlit as st
 from ui_components import create_engagement_funnel, show_dual_metric_tiles
 import ui_widgets as ui
-from metrics import get_filtered_users, get_engagement_metrics
+from filtered_cohort import filtered_cohort
 from users import ensure_user_data_initialized, get_language_list, get_country_list, get_cohort_list
 from settings import initialize
 
@@ -81,13 +81,13 @@ if (
     len(countries_listA) and len(countries_listB) and len(countries_listC)
     and len(daterangeA) == 2 and len(daterangeB) == 2 and len(daterangeC) == 2
 ):
-    user_dfA, cr_df_LR_A = get_filtered_users(appA, daterangeA, languageA, countries_listA, cohort=cohortA)
-    user_dfB, cr_df_LR_B = get_filtered_users(appB, daterangeB, languageB, countries_listB, cohort=cohortB)
-    user_dfC, cr_df_LR_C = get_filtered_users(appC, daterangeC, languageC, countries_listC, cohort=cohortC)
+    user_cohortA = filtered_cohort(appA, daterangeA, languageA, countries_listA, cohort=cohortA)
+    user_cohortB = filtered_cohort(appB, daterangeB, languageB, countries_listB, cohort=cohortB)
+    user_cohortC = filtered_cohort(appC, daterangeC, languageC, countries_listC, cohort=cohortC)
 
-    metrics_A = get_engagement_metrics(user_dfA)
-    metrics_B = get_engagement_metrics(user_dfB)
-    metrics_C = get_engagement_metrics(user_dfC)
+    metrics_A = user_cohortA.engagement_metrics()
+    metrics_B = user_cohortB.engagement_metrics()
+    metrics_C = user_cohortC.engagement_metrics()
     
     labelA = cohortA[0] if filter_modeA == "Cohort" else appA[0]
     labelB = cohortB[0] if filter_modeB == "Cohort" else appB[0]
@@ -96,19 +96,19 @@ if (
     funnel_size = "compact" if any(app == "Unity" for app in [appA, appB, appC]) else "large"
 
     with col1:
-        create_engagement_funnel(user_df=user_dfA, cr_df_LR=cr_df_LR_A, key_prefix="cf-11", funnel_size=funnel_size, app=appA)
+        create_engagement_funnel(cohort=user_cohortA, key_prefix="cf-11", funnel_size=funnel_size, app=appA)
         show_dual_metric_tiles(labelA, home_metrics=metrics_A, size="small")
-        csvA = ui.convert_for_download(user_dfA)
+        csvA = ui.convert_for_download(user_cohortA.users)
         st.download_button(label="Download", data=csvA, file_name="user_cohort_listA.csv", key="cf-12", icon=":material/download:", mime="text/csv")
 
     with col2:
-        create_engagement_funnel(user_df=user_dfB, cr_df_LR=cr_df_LR_B, key_prefix="cf-13", funnel_size=funnel_size, app=appB)
+        create_engagement_funnel(cohort=user_cohortB, key_prefix="cf-13", funnel_size=funnel_size, app=appB)
         show_dual_metric_tiles(labelB, home_metrics=metrics_B, size="small")
-        csvB = ui.convert_for_download(user_dfB)
+        csvB = ui.convert_for_download(user_cohortB.users)
         st.download_button(label="Download", data=csvB, file_name="user_cohort_listB.csv", key="cf-14", icon=":material/download:", mime="text/csv")
 
     with col3:
-        create_engagement_funnel(user_df=user_dfC, cr_df_LR=cr_df_LR_C, key_prefix="cf-15", funnel_size=funnel_size, app=appC)
+        create_engagement_funnel(cohort=user_cohortC, key_prefix="cf-15", funnel_size=funnel_size, app=appC)
         show_dual_metric_tiles(labelC, home_metrics=metrics_C, size="small")
-        csvC = ui.convert_for_download(user_dfC)
+        csvC = ui.convert_for_download(user_cohortC.users)
         st.download_button(label="Download", data=csvC, file_name="user_cohort_listC.csv", key="cf-16", icon=":material/download:", mime="text/csv")
\ No newline at end of file
@@ -5,7 +5,8 @@ import plotly.graph_objects as go
 import numpy as np
 import itertools
 
-from settings import get_gcp_credentials
+from settings import run_bq_query
+from cache_stats import observed_cache_data
 from ui_widgets import display_definitions_table, get_apps
 
 # =========================================================
@@ -118,12 +119,11 @@ def assign_hover(fig, df, group_col, custom_cols, title):
         )
 
 
-@st.cache_data(show_spinner=False)
+@observed_cache_data(show_spinner=False)
 def load_data():
     """
     Load difficulty data from BigQuery and cache for performance.
     """
-    _, client = get_gcp_credentials()
     query = """
     SELECT
       language, level_number, app,
@@ -136,7 +136,7 @@ def load_data():
     WHERE total_attempts >= 10
     ORDER BY language, level_number
     """
-    return client.query(query).to_dataframe()
+    return run_bq_query(query)
 
 
 # =========================================================
@@ -6,7 +6,8 @@ import ui_widgets as ui
 import datetime as dt
 import campaigns
 import pandas as pd
-from metrics import filter_campaigns,get_totals_per_month_from_cohort,get_all_apps_combined_session_and_cohort_df,apply_user_filters,get_metric_user_count,get_cohort_GC_avg,get_cohort_GPP_avg
+from metrics import filter_campaigns,get_totals_per_month_from_cohort,get_all_apps_combined_session_and_cohort_df
+from filtered_cohort import FilterSpec, FilteredCohort
 from users import ensure_user_data_initialized,get_language_list,get_country_list
 from settings import initialize,init_campaign_data
 from users import ensure_user_data_initialized
@@ -63,21 +64,17 @@ if len(daterange) == 2 and len(countries_list) > 0:
 
     col1, col2, col3 = st.columns(3)
     
-    #******* LR *******
-    session_df = get_all_apps_combined_session_and_cohort_df(
-        stat="LR"
+    # LA and later are counted on the progress rows of all apps, LR on the app-launch rows
+    user_cohort = FilteredCohort(
+        FilterSpec(daterange=daterange, languages=language, countries_list=countries_list),
+        source=get_all_apps_combined_session_and_cohort_df(stat="LA"),
+        lr_source=get_all_apps_combined_session_and_cohort_df(stat="LR"),
     )
 
-    user_df = apply_user_filters(
-        session_df=session_df,
-        daterange=daterange,
-        languages=language,
-        countries_list=countries_list,
-        )
-
  # --- COHORT METRICS ---
 
-LR = get_metric_user_count(user_df=user_df, stat="LR")
+#******* LR *******
+LR = user_cohort.count("LR")
 with col1:
     ui.metric_tile(
         label="Learners Reached",
@@ -87,16 +84,7 @@ with col1:
     )
 
 #******* LA *******
-session_df = get_all_apps_combined_session_and_cohort_df(stat="LA")
-
-user_df = apply_user_filters(
-    session_df=session_df,
-    daterange=daterange,
-    languages=language,
-    countries_list=countries_list,
-)
-
-LA = get_metric_user_count(user_df=user_df, stat="LA")
+LA = user_cohort.count("LA")
 with col2:
     ui.metric_tile(
         label="Learners Acquired",
@@ -105,7 +93,7 @@ with col2:
         size="small"
     )
 
-RA = get_metric_user_count(user_df=user_df, stat="RA")
+RA = user_cohort.count("RA")
 with col3:
     ui.metric_tile(
         label="Readers Acquired",
@@ -114,7 +102,7 @@ with col3:
         size="small"
     )
 
-GC = get_metric_user_count(user_df=user_df, stat="GC")
+GC = user_cohort.count("GC")
 with col1:
     ui.metric_tile(
         label="Games Completed",
@@ -123,7 +111,7 @@ with col1:
         size="small"
     )
 
-GPP = get_cohort_GPP_avg(user_df)
+GPP = user_cohort.gpp_avg()
 with col2:
     ui.metric_tile(
         label="Game Progress Percent",
@@ -132,7 +120,7 @@ with col2:
         size="small"
     )
 
-GC_AVG = get_cohort_GC_avg(user_df)
+GC_AVG = user_cohort.gc_avg()
 with col3:
     ui.metric_tile(
         label="Game Completion Avg",
@@ -170,7 +158,7 @@ with col3:
         size="small"
     )
     
-    csv = ui.convert_for_download(user_df) 
+    csv = ui.convert_for_download(user_cohort.users) 
     st.download_button(
             label="Download",
             data=csv,
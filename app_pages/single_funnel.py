@@ -3,7 +3,7 @@ import streamlit as st
 from rich import print as rprint
 from ui_components import create_engagement_funnel, show_dual_metric_tiles
 import ui_widgets as ui
-import metrics
+from filtered_cohort import filtered_cohort
 from users import ensure_user_data_initialized, get_cohort_list, get_language_list, get_country_list
 from settings import initialize
 
@@ -74,7 +74,7 @@ with col2:
 
 if len(countries_list) and len(daterange) == 2:
     # --- Cohort Dataframes ---
-    user_cohort_df, user_cr_df_LR = metrics.get_filtered_users(
+    user_cohort = filtered_cohort(
         app=app,
         daterange=daterange,
         language=language,
@@ -82,7 +82,7 @@ if len(countries_list) and len(daterange) == 2:
         cohort=cohort,
     )
 
-    metrics_home = metrics.get_engagement_metrics(user_cohort_df)
+    metrics_home = user_cohort.engagement_metrics()
 
     if app == "CR":
         funnel_size = "large"
@@ -91,8 +91,7 @@ if len(countries_list) and len(daterange) == 2:
 
     # --- Output Section ---
     create_engagement_funnel(
-        user_df=user_cohort_df,       # main progress cohort
-        cr_df_LR=user_cr_df_LR, # app_launch cohort for LR only
+        cohort=user_cohort,  # progress rows, and the app_launch rows for LR
         key_prefix="s5",
         funnel_size=funnel_size,
         app=app,
@@ -100,7 +99,7 @@ if len(countries_list) and len(daterange) == 2:
 
     show_dual_metric_tiles("Metrics", home_metrics=metrics_home, size="small")
 
-    csv = ui.convert_for_download(user_cohort_df)
+    csv = ui.convert_for_download(user_cohort.users)
     st.download_button(
         label="Download",
         data=csv,
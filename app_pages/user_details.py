@@ -2,7 +2,7 @@ import streamlit as st
 from rich import print as rprint
 from millify import prettify
 import pandas as pd
-from users import ensure_user_data_initialized
+from users import ensure_user_data_initialized, get_user_df
 from settings import initialize
 from ui_components import ftm_timeline_plot
 from users import get_users_ftm_event_timeline
@@ -43,12 +43,10 @@ elif not cr_user_id and "cr_user_id" in st.query_params:
     del st.query_params["cr_user_id"]
 
 if (len(cr_user_id) > 0):
-    df_cr_users = st.session_state.df_cr_users
-    df_cr_app_launch = st.session_state.df_cr_app_launch
+    # Shared, read-only frames - first_open is already a datetime column
+    df_cr_users = get_user_df("df_cr_users")
+    df_cr_app_launch = get_user_df("df_cr_app_launch")
 
-    df_cr_app_launch["first_open"] = pd.to_datetime(df_cr_app_launch["first_open"])
-    df_filtered = df_cr_app_launch[df_cr_app_launch['first_open'] >= pd.to_datetime('2025-01-01')]
-    
     user = df_cr_app_launch.loc[df_cr_app_launch['cr_user_id'] == cr_user_id]
     user_pseudo_id = None
 
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import uuid
+
+import pyarrow as pa
+
+# Post-processed user frames for a run_date, saved as uncompressed Arrow IPC files.
+# A restart, a second Streamlit worker process or another replica on the same host
+# memory-maps these instead of re-downloading and re-processing the parquet exports,
+# and the mapped pages are shared through the OS page cache.
+# Set USER_SNAPSHOT_DIR to an empty string to disable snapshots.
+SNAPSHOT_DIR = os.environ.get(
+    "USER_SNAPSHOT_DIR",
+    os.path.join(tempfile.gettempdir(), "cl_dashboard_user_snapshot"),
+)
+
+# Bump when init_user_data's post-processing changes shape or meaning, so snapshots
+# written by an older build are ignored rather than served.
+SNAPSHOT_VERSION = 5
+
+COMPLETE_MARKER = "_COMPLETE"
+
+
+class ArrowSnapshot:
+    """
+    One directory per run_date:
+
+        <root>/v<SNAPSHOT_VERSION>/run_date=YYYY-MM-DD/<frame name>.arrow
+        <root>/v<SNAPSHOT_VERSION>/run_date=YYYY-MM-DD/_COMPLETE
+
+    A snapshot is written to a staging directory and renamed into place, so a
+    reader either sees every frame or no snapshot at all.  When several processes
+    build the same run_date at once, the first rename wins and the others discard
+    their copy.
+
+    Frames are read back through pa.memory_map.  Numeric, datetime and
+    categorical-code columns without nulls are handed to pandas without a copy (as
+    read-only arrays - the shared frames must not be modified in place anyway);
+    string columns are still materialized as Python objects.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR, variant="", logger=None):
+        self.root = os.path.join(root, f"v{SNAPSHOT_VERSION}{variant}")
+        self.logger = logger
+
+    def run_dir(self, run_date):
+        return os.path.join(self.root, f"run_date={run_date}")
+
+    def exists(self, run_date):
+        return os.path.exists(os.path.join(self.run_dir(run_date), COMPLETE_MARKER))
+
+    def read(self, run_date):
+        """Return {name: DataFrame} for run_date, or None if there is no complete snapshot."""
+        if not self.exists(run_date):
+            return None
+
+        run_dir = self.run_dir(run_date)
+        frames = {}
+        for entry in sorted(os.listdir(run_dir)):
+            if not entry.endswith(".arrow"):
+                continue
+            with pa.memory_map(os.path.join(run_dir, entry)) as source:
+                table = pa.ipc.open_file(source).read_all()
+            # split_blocks keeps each column in its own block, so pandas does not
+            # consolidate (copy) the mapped buffers into 2-D blocks
+            frames[entry[: -len(".arrow")]] = table.to_pandas(split_blocks=True)
+        return frames
+
+    def discard(self, run_date):
+        """Remove run_date's snapshot (e.g. one that cannot be read), so the next write rebuilds it."""
+        run_dir = self.run_dir(run_date)
+        # Rename first, so no reader sees a half-deleted snapshot as complete
+        doomed = os.path.join(self.root, f".discard-{uuid.uuid4().hex[:8]}")
+        try:
+            os.rename(run_dir, doomed)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(doomed, ignore_errors=True)
+
+    def write(self, run_date, frames):
+        """Save {name: DataFrame} for run_date and drop snapshots of older run_dates."""
+        if self.exists(run_date):
+            return
+
+        os.makedirs(self.root, exist_ok=True)
+        staging_dir = os.path.join(self.root, f".staging-{uuid.uuid4().hex[:8]}")
+        os.makedirs(staging_dir)
+        try:
+            for name, df in frames.items():
+                table = pa.Table.from_pandas(df)
+                with pa.OSFile(os.path.join(staging_dir, f"{name}.arrow"), "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            open(os.path.join(staging_dir, COMPLETE_MARKER), "w").close()
+
+            try:
+                os.rename(staging_dir, self.run_dir(run_date))
+            except OSError:
+                # Another process promoted the same run_date first
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                return
+        except Exception:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+
+        self._remove_other_run_dates(keep=self.run_dir(run_date))
+        if self.logger:
+            self.logger.info(f"Arrow snapshot written for run_date={run_date}: {', '.join(frames)}")
+
+    def _remove_other_run_dates(self, keep):
+        for entry in os.listdir(self.root):
+            path = os.path.join(self.root, entry)
+            if entry.startswith("run_date=") and path != keep:
+                shutil.rmtree(path, ignore_errors=True)
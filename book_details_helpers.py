@@ -1,10 +1,11 @@
 import pandas as pd
 import numpy as np
-import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go
 
 from colors import PALETTE
+from result_cache import cache_result
+from user_keys import isin_keys
 
 # ============================================================
 # Constants
@@ -35,7 +36,7 @@ TIER_LABELS = {
 # Language helpers
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def get_book_languages_from_summary(df_book_summary: pd.DataFrame) -> list[str]:
     """Return sorted list of book languages from cr_book_user_book_summary."""
     langs = (
@@ -54,7 +55,7 @@ def get_book_languages_from_summary(df_book_summary: pd.DataFrame) -> list[str]:
 # Core filtered view
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def get_book_summary_for_language(
     df_book_summary: pd.DataFrame,
     languages: list[str],
@@ -74,7 +75,7 @@ def get_book_summary_for_language(
 # Per-book popularity aggregation
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def build_book_popularity(df_filtered: pd.DataFrame) -> pd.DataFrame:
     """
     Aggregate per-book popularity metrics.
@@ -129,7 +130,7 @@ def build_book_popularity(df_filtered: pd.DataFrame) -> pd.DataFrame:
 # Stickiness stacked bar chart
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def build_stickiness_chart(
     df_popularity: pd.DataFrame,
     min_readers: int = 10,
@@ -191,7 +192,7 @@ def build_stickiness_chart(
 # Per-book FTM outcomes (Hooked readers vs non-readers)
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def build_book_ftm_outcomes(
     df_filtered: pd.DataFrame,
     df_cr_users: pd.DataFrame,
@@ -223,22 +224,16 @@ def build_book_ftm_outcomes(
         | (ftm["ra_flag"].fillna(0).astype(int) == 1)
     )
 
-    all_reader_ids = set(
-        df[df["stickiness"] == stickiness_filter]["cr_user_id"].unique()
-    )
+    readers = df[df["stickiness"] == stickiness_filter]
+    # Membership on the integer user keys (see user_keys)
+    is_any_reader = isin_keys(ftm["cr_user_id"], readers["cr_user_id"])
 
     records = []
-    for book, grp in df.groupby("base_book_id"):
-        reader_ids = set(
-            grp[grp["stickiness"] == stickiness_filter]["cr_user_id"].unique()
-        )
-        if not reader_ids:
-            continue
-
-        non_reader_ids = all_reader_ids - reader_ids  # other book readers at same stickiness
+    for book, grp in readers.groupby("base_book_id"):
+        is_reader = isin_keys(ftm["cr_user_id"], grp["cr_user_id"])
 
-        readers_ftm    = ftm[ftm["cr_user_id"].isin(reader_ids)]
-        non_readers_ftm = ftm[ftm["cr_user_id"].isin(non_reader_ids)]
+        readers_ftm    = ftm[is_reader]
+        non_readers_ftm = ftm[is_any_reader & ~is_reader]  # other book readers at same stickiness
 
         def safe_mean(s): return float(s.mean()) if len(s) else 0.0
         def safe_pct(s):  return float(s.mean()) if len(s) else 0.0
@@ -250,7 +245,7 @@ def build_book_ftm_outcomes(
 
         records.append({
             "base_book_id":         book,
-            "readers":              len(reader_ids),
+            "readers":              grp["cr_user_id"].nunique(dropna=False),
             "avg_level_readers":    avg_lvl_r,
             "avg_level_others":     avg_lvl_nr,
             "lift_avg_level":       avg_lvl_r - avg_lvl_nr,
@@ -273,7 +268,7 @@ def build_book_ftm_outcomes(
 # Book drill-down: stickiness × user tier cross-tab
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def build_book_tier_crosstab(
     df_filtered: pd.DataFrame,
     df_cr_book_user_cohorts: pd.DataFrame,
@@ -315,7 +310,7 @@ def build_book_tier_crosstab(
     merged["tier_label"] = merged["book_engagement_tier"].map(TIER_LABELS).fillna("Unknown")
 
     crosstab = (
-        merged.groupby(["tier_label", "stickiness"])
+        merged.groupby(["tier_label", "stickiness"], observed=True)
         .size()
         .unstack(fill_value=0)
         .reindex(columns=STICKINESS_ORDER, fill_value=0)
@@ -334,7 +329,7 @@ def build_book_tier_crosstab(
 # Book drill-down: level (Lv1, Lv2, ...) reader counts
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def build_book_level_breakdown(
     df_filtered: pd.DataFrame,
     base_book_id: str,
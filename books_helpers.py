@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-import streamlit as st
+from result_cache import cache_result
 
 
 # ============================================================
@@ -12,6 +12,10 @@ def clean_str_aligned(s: pd.Series) -> pd.Series:
     Clean string series WITHOUT changing index alignment.
     Used for language matching.
     """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Clean each category once; code -1 (missing) lands on the leading ""
+        cleaned = np.concatenate([[""], s.cat.categories.astype(str).str.strip().to_numpy(dtype=object)])
+        return pd.Series(cleaned[s.cat.codes.to_numpy() + 1], index=s.index, name=s.name)
     return s.fillna("").astype(str).str.strip()
 
 
@@ -32,7 +36,7 @@ def truncate_csv(text: str, max_chars: int = 120) -> str:
 # Language selection + mapping
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def get_book_languages(df_cr_book_user_cohorts: pd.DataFrame) -> list[str]:
     """
     Return cleaned, sorted list of available book languages.
@@ -46,7 +50,7 @@ def get_book_languages(df_cr_book_user_cohorts: pd.DataFrame) -> list[str]:
     return sorted(langs)
 
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def compute_lang_map(df_cr_book_user_cohorts: pd.DataFrame) -> pd.DataFrame:
     """
     Build unique mapping table:
@@ -65,7 +69,7 @@ def compute_lang_map(df_cr_book_user_cohorts: pd.DataFrame) -> pd.DataFrame:
     return lang_map.drop_duplicates()
 
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def mapped_ftm_languages_for_books(
     lang_map: pd.DataFrame,
     effective_book_languages: list[str]
@@ -88,7 +92,7 @@ def mapped_ftm_languages_for_books(
 # Eligible universe
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def eligible_ftm_users(
     df_cr_users: pd.DataFrame,
     mapped_ftm_languages: list[str]
@@ -112,7 +116,7 @@ def eligible_ftm_users(
 # Tier mapping
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def tier_df_language_mapped(
     df_cr_book_user_cohorts: pd.DataFrame,
     effective_book_languages: list[str]
@@ -150,7 +154,7 @@ def tier_df_language_mapped(
 # FTM comparison (LA-only universe)
 # ============================================================
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def build_ftm_compare_la_only(
     df_cr_users: pd.DataFrame,
     eligible_users_df: pd.DataFrame,
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+import pyarrow as pa
+
+# Query results saved on local disk as Arrow IPC files, keyed by the SQL, its
+# parameters and the last_modified time of every table it reads.  The source
+# tables are rewritten nightly, so after a restart or a st.cache_data expiry the
+# same query is answered from disk until one of its tables changes.
+#
+# Set BQ_CACHE_DIR to an empty string to always query BigQuery.
+BQ_CACHE_DIR = os.environ.get(
+    "BQ_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "cl_dashboard_bq_cache"),
+)
+
+# How long a table's last_modified is trusted before asking BigQuery again, so a
+# burst of queries costs one metadata call per table rather than one per query
+TABLE_CHECK_SECONDS = int(os.environ.get("BQ_TABLE_CHECK_SECONDS", "300"))
+
+# Result files not read for this long are deleted
+MAX_AGE_DAYS = 7
+
+# project.dataset.table, with or without backticks
+TABLE_RE = re.compile(r"`?\b([a-z][a-z0-9-]*\.[A-Za-z_][A-Za-z0-9_]*\.[A-Za-z_][A-Za-z0-9_$*]*)`?")
+
+
+class BigQueryCache:
+    """
+    query(client, sql, job_config) returns the same DataFrame as
+    client.query(sql, job_config=job_config).to_dataframe(), from disk when all
+    tables the SQL references are unchanged since it was saved.
+
+    Queries are run live (and not saved) when no table can be found in the SQL,
+    a table is a view (its last_modified does not change with its data), or the
+    SQL uses a wildcard table.  client only needs query() and get_table(), so a
+    fake client can stand in for BigQuery.
+    """
+
+    def __init__(self, root=BQ_CACHE_DIR, logger=None):
+        self.root = root
+        self.logger = logger
+        self._modified = {}  # table id -> (last_modified or None if not cacheable, checked at)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "uncacheable": 0}
+
+    def query(self, client, sql, job_config=None):
+        key = self.cache_key(client, sql, job_config)
+        if key is None:
+            self._count("uncacheable")
+            return client.query(sql, job_config=job_config).to_dataframe()
+
+        path = os.path.join(self.root, f"{key}.arrow")
+        df = self._read(path)
+        if df is not None:
+            self._count("hits")
+            return df
+
+        self._count("misses")
+        df = client.query(sql, job_config=job_config).to_dataframe()
+        try:
+            self._write(path, df)
+        except Exception as e:
+            if self.logger:
+                self.logger.warning(f"BigQuery result not cached: {e}")
+        return df
+
+    def _count(self, outcome):
+        # Queries run on many script threads at once; += on a dict entry is not atomic
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def cache_key(self, client, sql, job_config=None):
+        """Digest of the normalized SQL, its parameters and its tables' last_modified, or None."""
+        tables = sorted(set(TABLE_RE.findall(sql)))
+        if not tables or any("*" in table for table in tables):
+            return None
+
+        versions = []
+        for table in tables:
+            modified = self._last_modified(client, table)
+            if modified is None:
+                return None
+            versions.append((table, modified))
+
+        normalized_sql = "\n".join(line.strip() for line in sql.strip().splitlines() if line.strip())
+        parameters = job_config.to_api_repr() if job_config is not None else None
+        payload = json.dumps([normalized_sql, parameters, versions], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _last_modified(self, client, table):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._modified.get(table)
+        if cached is not None and now - cached[1] < TABLE_CHECK_SECONDS:
+            return cached[0]
+
+        try:
+            info = client.get_table(table)
+            modified = None if info.table_type == "VIEW" else info.modified.isoformat()
+        except Exception:
+            # Not a table after all (or no metadata access): run the query live
+            modified = None
+        with self._lock:
+            self._modified[table] = (modified, now)
+        return modified
+
+    def _read(self, path):
+        try:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        os.utime(path)  # last read, for _prune
+        # The pandas metadata restores the dtypes to_dataframe produced (Int64, boolean, dbdate...)
+        return table.to_pandas()
+
+    def _write(self, path, df):
+        os.makedirs(self.root, exist_ok=True)
+        table = pa.Table.from_pandas(df)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)  # atomic, so readers never see a partial file
+        self._prune()
+
+    def _prune(self):
+        cutoff = time.time() - MAX_AGE_DAYS * 86400
+        for entry in os.listdir(self.root):
+            path = os.path.join(self.root, entry)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,170 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from cache_stats import observed_cache_data
+
+# st.cache_data hashes every DataFrame argument on every call: shape, dtypes and a
+# 10k-row sample for large frames, all rows for smaller ones.  For the user frames
+# that hashing often costs more than the cached computation.
+#
+# Frames whose contents are fixed by where they came from get a cheap token
+# instead: the shared dataset frames are tagged with (run_date, name) when they
+# are loaded, and apply_user_filters tags its result with the parent's token plus
+# the filter spec.  cache_frames() is st.cache_data with a hash function that
+# uses the token when a frame has one and hashes the contents (as Streamlit would)
+# when it does not.
+#
+# Tagged frames must not be modified in place afterwards; the shared frames are
+# read-only anyway, and a filtered frame that gains or loses columns gets a new
+# key because the column names are part of it.
+
+_tokens = {}  # id(df) -> (weakref to df, token)
+_stats_lock = threading.Lock()
+_stats = {
+    "token_keys": 0,
+    "token_rows": 0,
+    "hashed_keys": 0,
+    "hashed_rows": 0,
+    "hashed_seconds": 0.0,
+}
+
+# Same thresholds as Streamlit's own DataFrame hashing
+_ROWS_LARGE = 50_000
+_SAMPLE_SIZE = 10_000
+
+
+def tag_frame(df, token):
+    """Register token as df's cache key and return df."""
+    key = id(df)
+    _tokens[key] = (weakref.ref(df, lambda _, key=key: _tokens.pop(key, None)), token)
+    return df
+
+
+def frame_token(df):
+    """Return df's registered token, or None if it has none."""
+    entry = _tokens.get(id(df))
+    if entry is None or entry[0]() is not df:
+        return None
+    return entry[1]
+
+
+def derive_token(parent, *spec):
+    """Token for a frame computed from parent by spec, or None if parent is untagged."""
+    token = frame_token(parent)
+    if token is None:
+        return None
+    return (token, spec)
+
+
+def hash_frame(df):
+    """hash_funcs entry for pd.DataFrame: the frame's token if it has one, else a content hash."""
+    token = frame_token(df)
+    if token is not None:
+        with _stats_lock:
+            _stats["token_keys"] += 1
+            _stats["token_rows"] += _hashed_rows(df)
+        return repr((token, tuple(df.columns))).encode()
+
+    started = time.perf_counter()
+    digest = _content_hash(df)
+    with _stats_lock:
+        _stats["hashed_keys"] += 1
+        _stats["hashed_rows"] += _hashed_rows(df)
+        _stats["hashed_seconds"] += time.perf_counter() - started
+    return digest
+
+
+def _hashed_rows(df):
+    return _SAMPLE_SIZE if len(df) >= _ROWS_LARGE else len(df)
+
+
+def _content_hash(df):
+    h = hashlib.new("md5", usedforsecurity=False)
+    h.update(repr(df.shape).encode())
+    sample = df.sample(n=_SAMPLE_SIZE, random_state=0) if len(df) >= _ROWS_LARGE else df
+    try:
+        h.update(pd.util.hash_pandas_object(sample.dtypes).to_numpy().tobytes())
+        # pandas hashes a categorical's whole dictionary; for one larger than the
+        # sample (user keys, see user_keys) hash the sampled values instead
+        wide = [
+            column for column, dtype in sample.dtypes.items()
+            if isinstance(dtype, pd.CategoricalDtype) and len(dtype.categories) > len(sample)
+        ]
+        if wide:
+            sample = sample.astype({column: object for column in wide})
+        h.update(pd.util.hash_pandas_object(sample).to_numpy().tobytes())
+    except TypeError:
+        # Unhashable cells (lists, dicts) - fall back to pickling, as Streamlit does
+        h.update(pickle.dumps(sample, pickle.HIGHEST_PROTOCOL))
+    return h.digest()
+
+
+def hash_args(value):
+    """Hex digest of a (nested) argument value, with DataFrames keyed by hash_frame."""
+    h = hashlib.new("md5", usedforsecurity=False)
+    _update(h, value)
+    return h.hexdigest()
+
+
+def _update(h, value):
+    h.update(type(value).__qualname__.encode())
+    if isinstance(value, pd.DataFrame):
+        h.update(hash_frame(value))
+    elif isinstance(value, pd.Series):
+        h.update(_content_hash(value.to_frame()))
+    elif hasattr(type(value), "__cache_key__"):
+        # Objects that know their own key, e.g. cohort_view.CohortView
+        h.update(value.__cache_key__())
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.dtype, value.shape)).encode())
+        h.update(value.tobytes() if value.dtype != object else pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    elif isinstance(value, (list, tuple)):
+        h.update(str(len(value)).encode())
+        for item in value:
+            _update(h, item)
+    elif isinstance(value, (set, frozenset)):
+        h.update(str(len(value)).encode())
+        for item in sorted(value, key=repr):
+            _update(h, item)
+    elif isinstance(value, dict):
+        h.update(str(len(value)).encode())
+        for k, v in value.items():
+            _update(h, k)
+            _update(h, v)
+    else:
+        h.update(repr(value).encode())
+
+
+# Functions that draw Streamlit elements stay on st.cache_data (which replays the
+# elements on a hit); this bounds how many filter combinations each one keeps.
+CHART_CACHE_MAX_ENTRIES = int(os.environ.get("CHART_CACHE_MAX_ENTRIES", "64"))
+
+
+def cache_frames(**kwargs):
+    """Drop-in for st.cache_data(...) that keys DataFrame arguments by token where possible."""
+    kwargs.setdefault("max_entries", CHART_CACHE_MAX_ENTRIES)
+    return observed_cache_data(hash_funcs={pd.DataFrame: hash_frame}, **kwargs)
+
+
+def cache_key_stats():
+    """
+    Counters for the hashing done by cache_frames and cache_result functions.  Rows count what a
+    content hash would have read (large frames are sampled), and
+    estimated_seconds_saved is the token-keyed rows times the measured per-row
+    cost of content hashing (None until at least one frame has been hashed).
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    if stats["hashed_rows"]:
+        stats["estimated_seconds_saved"] = stats["token_rows"] * stats["hashed_seconds"] / stats["hashed_rows"]
+    else:
+        stats["estimated_seconds_saved"] = None
+    return stats
@@ -0,0 +1,153 @@
+import functools
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Counters behind the Cache Statistics admin page (app_pages/cache_stats.py):
+#  - compute times of every cached function, recorded when it actually runs
+#  - calls and computes of st.cache_data functions wrapped by observed_cache_data
+#    (a call that did not compute was a hit)
+#  - hits and misses of the data sources behind the shared dataset: the Arrow
+#    snapshot, the derived parquet frames and the local parquet mirror
+# Hits, misses, sizes and evictions of cache_result functions come from
+# result_cache itself.  Everything is per process and starts at zero on restart.
+
+# Compute times kept per function for the percentiles
+COMPUTE_SAMPLES = 500
+
+_lock = threading.Lock()
+_compute_times = {}   # function -> deque of seconds
+_cache_data_calls = {}  # function -> {"calls", "computes"}
+_sources = {}         # source -> {"hits", "misses"}
+
+
+def record_compute(function, seconds):
+    with _lock:
+        samples = _compute_times.get(function)
+        if samples is None:
+            samples = _compute_times[function] = deque(maxlen=COMPUTE_SAMPLES)
+        samples.append(seconds)
+
+
+def record_source(source, hits=0, misses=0):
+    with _lock:
+        counts = _sources.setdefault(source, {"hits": 0, "misses": 0})
+        counts["hits"] += hits
+        counts["misses"] += misses
+
+
+def observed_cache_data(**kwargs):
+    """st.cache_data(**kwargs) that also counts calls, computes and compute time."""
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def compute(*args, **kw):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kw)
+            finally:
+                record_compute(name, time.perf_counter() - started)
+                with _lock:
+                    _cache_data_calls.setdefault(name, {"calls": 0, "computes": 0})["computes"] += 1
+
+        cached = st.cache_data(**kwargs)(compute)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kw):
+            with _lock:
+                _cache_data_calls.setdefault(name, {"calls": 0, "computes": 0})["calls"] += 1
+            return cached(*args, **kw)
+
+        wrapper.clear = cached.clear
+        return wrapper
+
+    return decorator
+
+
+def _cache_data_bytes():
+    """Bytes held per st.cache_data function, from the Streamlit runtime (empty outside it)."""
+    try:
+        from streamlit.runtime import Runtime
+        if not Runtime.exists():
+            return {}
+        stats = Runtime.instance().stats_mgr.get_stats()
+    except Exception:
+        return {}
+    sizes = {}
+    for stat in stats:
+        if stat.category_name == "st_cache_data":
+            sizes[stat.cache_name] = sizes.get(stat.cache_name, 0) + stat.byte_length
+    return sizes
+
+
+def cache_report():
+    """
+    One row per cached function: hits, misses, hit rate, compute-time
+    percentiles (ms), entries, bytes and evictions.  Entries and evictions are
+    only known for cache_result functions; st.cache_data does not expose them.
+    """
+    from result_cache import cache_usage
+
+    with _lock:
+        compute_times = {name: list(samples) for name, samples in _compute_times.items()}
+        cache_data_calls = {name: dict(counts) for name, counts in _cache_data_calls.items()}
+
+    rows = []
+    for name, stats in cache_usage()["functions"].items():
+        rows.append({
+            "function": name, "cache": "result cache",
+            "hits": stats["hits"], "misses": stats["misses"],
+            "entries": stats["entries"], "bytes": stats["bytes"], "evictions": stats["evictions"],
+        })
+    cache_data_bytes = _cache_data_bytes()
+    for name, counts in cache_data_calls.items():
+        rows.append({
+            "function": name, "cache": "st.cache_data",
+            "hits": counts["calls"] - counts["computes"], "misses": counts["computes"],
+            "entries": None, "bytes": cache_data_bytes.get(name), "evictions": None,
+        })
+
+    columns = ["function", "cache", "hits", "misses", "hit_rate", "p50_ms", "p90_ms", "p99_ms",
+               "max_ms", "entries", "bytes", "evictions"]
+    if not rows:
+        return pd.DataFrame(columns=columns)
+
+    df = pd.DataFrame(rows)
+    df[["entries", "bytes", "evictions"]] = df[["entries", "bytes", "evictions"]].astype("Int64")
+    calls = df["hits"] + df["misses"]
+    df["hit_rate"] = (df["hits"] / calls.where(calls > 0)).round(3)
+    for column, q in [("p50_ms", 50), ("p90_ms", 90), ("p99_ms", 99), ("max_ms", 100)]:
+        df[column] = [
+            round(float(np.percentile(compute_times[name], q)) * 1000, 1) if compute_times.get(name) else None
+            for name in df["function"]
+        ]
+    return df[columns].sort_values(["misses", "function"], ascending=[False, True]).reset_index(drop=True)
+
+
+def source_report():
+    """Hits and misses of the data sources behind the shared dataset and of the BigQuery helpers."""
+    from result_cache import cache_usage
+    import settings
+
+    with _lock:
+        rows = [{"source": source, **counts} for source, counts in _sources.items()]
+    for label, stats in [
+        ("cache_result single-flight", cache_usage()["single_flight"]),
+        ("BigQuery single-flight", settings.bq_flight_stats()),
+    ]:
+        # A follower reused the leader's in-flight result
+        rows.append({"source": label, "hits": stats["followers"], "misses": stats["leaders"]})
+
+    bq_cache = settings.bq_cache_stats()
+    if bq_cache is not None:
+        rows.append({"source": "BigQuery result cache", "hits": bq_cache["hits"], "misses": bq_cache["misses"]})
+
+    df = pd.DataFrame(rows, columns=["source", "hits", "misses"])
+    total = df["hits"] + df["misses"]
+    df["hit_rate"] = (df["hits"] / total.where(total > 0)).round(3)
+    return df
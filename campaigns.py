@@ -1,72 +1,98 @@
 import streamlit as st
 import pandas as pd
 from rich import print as print
-import asyncio
-from pyinstrument import Profiler
+from concurrent.futures import ThreadPoolExecutor
 import settings
 import metrics
+from cache_keys import hash_frame, tag_frame
+from result_cache import cache_result
+from user_index import select_date_range
 
 start_date = '2024-05-01'
 # Starting 05/01/2024, campaign names were changed to support an indication of 
 # both language and country through a naming convention.  So we are only collecting
 # and reporting on daily campaign segment data from that day forward.
 
-# Combined function to fetch Google and Facebook campaign data concurrently
-
-async def get_campaign_data():
-    p = Profiler(async_mode="disabled")
-    with p:
-        _, bq_client = settings.get_gcp_credentials()
-
-        # Helper function to run BigQuery queries asynchronously
-        async def run_query(query):
-            return await asyncio.to_thread(bq_client.query(query).to_dataframe)
-
-        # Google Ads Query
-        google_ads_query = f"""
-            SELECT
-                metrics.campaign_id,
-                metrics.segments_date as segment_date,
-                campaigns.campaign_name,
-                metrics_cost_micros as cost,
-                campaigns.campaign_start_date,
-                "Google" as source
-            FROM dataexploration-193817.marketing_data.p_ads_CampaignStats_6687569935 as metrics
-            INNER JOIN dataexploration-193817.marketing_data.ads_Campaign_6687569935 as campaigns
-            ON metrics.campaign_id = campaigns.campaign_id
-            AND metrics.segments_date >= '{start_date}'
-           GROUP BY 1,2,3,4,5
-        """
-
-        # Facebook Ads Query
-        facebook_ads_query = f"""
-            SELECT 
-                d.campaign_id,
-                d.data_date_start as segment_date,
-                d.campaign_name,
-                d.spend as cost,
-                d.start_time as campaign_start_date, 
-                "Facebook" as source
-            FROM dataexploration-193817.marketing_data.facebook_ads_data as d
-            WHERE d.data_date_start >= '{start_date}'
-            ORDER BY d.data_date_start DESC;
-        """
-
-        # Run both queries concurrently using asyncio.gather
-        google_ads_data, facebook_ads_data = await asyncio.gather(
-            run_query(google_ads_query),
-            run_query(facebook_ads_query)
-        )
-
-        # Process Google Ads Data
-        google_ads_data["campaign_id"] = google_ads_data["campaign_id"].astype(str).str.replace(",", "")
-        google_ads_data["cost"] = google_ads_data["cost"].divide(1000000).round(2)
-  #      google_ads_data["segment_date"] = pd.to_datetime
-        google_ads_data["segment_date"] = pd.to_datetime(google_ads_data["segment_date"])
-    p.print(color="red")
-    return google_ads_data, facebook_ads_data
-
-@st.cache_data(ttl="1d", show_spinner=False)
+# Campaign data is loaded on its own, not with the user dataset: a BigQuery error
+# here only leaves the marketing pages without spend data, and it is refetched
+# on its own daily ttl rather than with each new run_date.  The frame keeps plain
+# strings: it is small and lrc_scatter_chart outer-merges on country/app_language
+# groupbys over it.
+CAMPAIGN_COLUMNS = [
+    "campaign_id", "segment_date", "campaign_name", "cost", "campaign_start_date", "source",
+    "country", "app_language",
+]
+
+def get_google_ads_data():
+    # Google Ads Query
+    google_ads_query = f"""
+        SELECT
+            metrics.campaign_id,
+            metrics.segments_date as segment_date,
+            campaigns.campaign_name,
+            metrics_cost_micros as cost,
+            campaigns.campaign_start_date,
+            "Google" as source
+        FROM dataexploration-193817.marketing_data.p_ads_CampaignStats_6687569935 as metrics
+        INNER JOIN dataexploration-193817.marketing_data.ads_Campaign_6687569935 as campaigns
+        ON metrics.campaign_id = campaigns.campaign_id
+        AND metrics.segments_date >= '{start_date}'
+       GROUP BY 1,2,3,4,5
+    """
+    google_ads_data = settings.run_bq_query(google_ads_query)
+
+    # Process Google Ads Data
+    google_ads_data["campaign_id"] = google_ads_data["campaign_id"].astype(str).str.replace(",", "")
+    google_ads_data["cost"] = google_ads_data["cost"].divide(1000000).round(2)
+    google_ads_data["segment_date"] = pd.to_datetime(google_ads_data["segment_date"])
+    return google_ads_data
+
+
+def get_facebook_ads_data():
+    # Facebook Ads Query
+    facebook_ads_query = f"""
+        SELECT 
+            d.campaign_id,
+            d.data_date_start as segment_date,
+            d.campaign_name,
+            d.spend as cost,
+            d.start_time as campaign_start_date, 
+            "Facebook" as source
+        FROM dataexploration-193817.marketing_data.facebook_ads_data as d
+        WHERE d.data_date_start >= '{start_date}'
+        ORDER BY d.data_date_start DESC;
+    """
+    return settings.run_bq_query(facebook_ads_query)
+
+
+# All campaign data by segment_date, with country and language parsed from the campaign name
+def combine_campaign_data(df_goog_all, df_fb_all):
+    df_campaigns_all = pd.concat([df_goog_all, df_fb_all])
+    df_campaigns_all = add_country_and_language(df_campaigns_all)
+    return df_campaigns_all.reset_index(drop=True)
+
+
+@st.cache_resource(ttl="1d", show_spinner="Gathering Marketing Data")
+def get_campaign_data():
+    """
+    Google and Facebook campaign segments combined, fetched concurrently and
+    shared read-only by every session.  Raises if a query fails (nothing is
+    cached then, so the next call tries again).
+    """
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="campaign-loader") as pool:
+        df_goog_all = pool.submit(get_google_ads_data)
+        df_fb_all = pool.submit(get_facebook_ads_data)
+        df_campaigns_all = combine_campaign_data(df_goog_all.result(), df_fb_all.result())
+    # Keyed by content, so every process fetching the same data shares cache keys
+    return tag_frame(df_campaigns_all, ("campaigns", hash_frame(df_campaigns_all).hex()))
+
+
+def empty_campaign_data():
+    """A campaign frame with no rows, for when the campaign data cannot be loaded."""
+    df = pd.DataFrame({column: pd.Series(dtype=object) for column in CAMPAIGN_COLUMNS})
+    return df.astype({"segment_date": "datetime64[ns]", "cost": float})
+
+@cache_result(ttl="1d", show_spinner=False)
 # Looks for the string following the dash and makes that the associated country.
 # This requires a strict naming convention of "[anything without dashes] - [country]]"
 def add_country_and_language(df):
@@ -147,16 +173,14 @@ def rollup_campaign_data(df):
     return df
 
 
-@st.cache_data(ttl="1d", show_spinner=True)
+@cache_result(ttl="1d", show_spinner=True)
 def build_campaign_table(df_campaigns, session_df, daterange):
     group_cols = ["country", "app_language"]
 
     # 1. Apply date filter once upfront
     start = pd.to_datetime(daterange[0])
     end = pd.to_datetime(daterange[1])
-    filtered_df = session_df[
-        (session_df["first_open"] >= start) & (session_df["first_open"] <= end)
-    ].copy()
+    filtered_df = select_date_range(session_df, start, end).copy()
 
     # 2. Limit to only country/language pairs that exist in campaign data
     campaign_keys = df_campaigns[group_cols].drop_duplicates()
@@ -171,7 +195,11 @@ def build_campaign_table(df_campaigns, session_df, daterange):
             "RA": (group["max_user_level"] >= 25).sum(),
         })
 
-    metrics_df = filtered_df.groupby(group_cols).apply(group_metrics).reset_index()
+    if filtered_df.empty:
+        # groupby.apply over no groups does not produce the metric columns
+        metrics_df = pd.DataFrame(columns=group_cols + ["LR", "PC", "LA", "RA"])
+    else:
+        metrics_df = filtered_df.groupby(group_cols, observed=True).apply(group_metrics).reset_index()
 
     # 4. Aggregate campaign costs
     cost_df = df_campaigns.groupby(group_cols)["cost"].sum().reset_index()
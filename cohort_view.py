@@ -0,0 +1,127 @@
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cache_keys import hash_frame
+from user_keys import memory_usage
+
+
+class CohortView:
+    """
+    Read-only selection of rows of a shared user frame, as returned by
+    metrics.select_users.  Nothing is copied when it is made: a column is
+    materialized for the selected rows the first time it is read (and kept), so
+    a consumer that reads three columns of the user table copies three columns,
+    not all of them.
+
+    It supports what the metric helpers use on a filtered cohort - len, .empty,
+    .columns, view["col"] for a Series, view[["a", "b"]] for a DataFrame and
+    view[boolean mask] for a narrower view - and refuses writes.  frame() returns
+    an ordinary DataFrame the caller owns (for charts, downloads, merges).
+
+    rows is None for every row, a slice, or sorted row positions.
+    """
+
+    def __init__(self, source, rows=None, token=None):
+        self._source = source
+        self._rows = rows
+        self.token = token
+        self._materialized = {}
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self):
+        return self._source.columns
+
+    @property
+    def empty(self):
+        return len(self) == 0
+
+    @property
+    def shape(self):
+        return (len(self), len(self.columns))
+
+    def __len__(self):
+        if self._rows is None:
+            return len(self._source)
+        if isinstance(self._rows, slice):
+            return len(range(*self._rows.indices(len(self._source))))
+        return len(self._rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        if isinstance(key, list):
+            return self.frame(key)
+        return self.narrow(key)
+
+    def column(self, name):
+        """The selected rows of one column (materialized once per view)."""
+        series = self._materialized.get(name)
+        if series is None:
+            with self._lock:
+                series = self._materialized.get(name)
+                if series is None:
+                    series = self._materialized[name] = self._select(self._source[name])
+        return series
+
+    def frame(self, columns=None):
+        """The selected rows as a new DataFrame, of columns (default: all of them)."""
+        source = self._source if columns is None else self._source[list(columns)]
+        return self._select(source)
+
+    def positions(self):
+        """Row positions of the selection in the source frame."""
+        if self._rows is None:
+            return np.arange(len(self._source))
+        if isinstance(self._rows, slice):
+            return np.arange(*self._rows.indices(len(self._source)))
+        return self._rows
+
+    def nbytes(self):
+        """Memory held by the view itself: its row positions and materialized columns."""
+        rows = self._rows.nbytes if isinstance(self._rows, np.ndarray) else 0
+        return rows + sum(memory_usage(s) for s in list(self._materialized.values()))
+
+    def narrow(self, mask):
+        """The view of the selected rows where mask (aligned with them) is True."""
+        mask = np.asarray(mask, dtype=bool)
+        if len(mask) != len(self):
+            raise ValueError(f"Mask of length {len(mask)} does not match a view of {len(self)} rows")
+        return CohortView(self._source, self.positions()[mask])
+
+    def _select(self, data):
+        if self._rows is None:
+            return data.copy(deep=not pd.options.mode.copy_on_write)
+        if isinstance(self._rows, slice):
+            return data.iloc[self._rows].copy(deep=not pd.options.mode.copy_on_write)
+        return data.take(self._rows)
+
+    def __cache_key__(self):
+        """Cache key for cache_keys.hash_args: the token, else the source's key and the row positions."""
+        if self.token is not None:
+            return repr(("CohortView", self.token)).encode()
+        h = hashlib.new("md5", usedforsecurity=False)
+        h.update(hash_frame(self._source))
+        if isinstance(self._rows, slice):
+            h.update(repr(self._rows.indices(len(self._source))).encode())
+        elif self._rows is not None:
+            h.update(np.ascontiguousarray(self._rows).tobytes())
+        return h.digest()
+
+    def __setitem__(self, key, value):
+        raise TypeError("CohortView is read-only; call .frame() for a DataFrame you can modify")
+
+    def __delitem__(self, key):
+        raise TypeError("CohortView is read-only; call .frame() for a DataFrame you can modify")
+
+    def __getattr__(self, name):
+        # DataFrame methods (rename, drop, merge, groupby...) are not proxied
+        raise AttributeError(
+            f"CohortView has no attribute {name!r}; call .frame() for a DataFrame"
+        )
+
+    def __repr__(self):
+        return f"<CohortView {len(self)} of {len(self._source)} rows, token={self.token!r}>"
@@ -0,0 +1,205 @@
+import os
+import pandas as pd
+import pyarrow as pa
+
+# Columns each GCS parquet dataset is projected to on load.  The lists are the
+# columns referenced by metrics, books_helpers, book_details_helpers,
+# ui_components and the pages; everything else in the nightly export is never
+# decoded.  Set PARQUET_FULL_LOAD=1 to read every column (e.g. when debugging
+# or when a page starts using a new column before it is added here).
+FULL_LOAD = os.environ.get("PARQUET_FULL_LOAD", "") == "1"
+
+# The three user-level frames go through the same filter/funnel/engagement code
+# (and are concatenated on the Marketing page), so they share one allowlist.
+# Columns missing from a dataset are simply skipped.
+USER_COLUMNS = [
+    "cr_user_id",
+    "user_pseudo_id",
+    "app",
+    "app_language",
+    "language",
+    "country",
+    "first_open",
+    "la_date",
+    "last_event_date",
+    "furthest_event",
+    "max_user_level",
+    "gpc",
+    "lr_flag",
+    "la_flag",
+    "ra_flag",
+    "gc_flag",
+    "engagement_event_count",
+    "total_time_minutes",
+    "avg_session_length_minutes",
+    "active_span",
+    "days_to_ra",
+]
+
+DATASET_COLUMNS = {
+    "cr_user_progress": USER_COLUMNS,
+    "unity_user_progress": USER_COLUMNS,
+    "cr_app_launch": USER_COLUMNS,
+    "cr_book_user_cohorts": [
+        "cr_user_id",
+        "app_language",
+        "app_language_book",
+        "is_book_user",
+        "book_engagement_tier",
+    ],
+    "cr_cohorts": [
+        "cr_user_id",
+        "cohort_name",
+    ],
+    "cr_book_user_book_summary": [
+        "cr_user_id",
+        "book_id",
+        "base_book_id",
+        "book_language",
+        "book_level",
+        "total_events",
+        "active_days_for_book",
+        "stickiness",
+    ],
+}
+
+
+def dataset_columns(dataset):
+    """Column allowlist for a dataset, or None (all columns) in full-load mode."""
+    if FULL_LOAD:
+        return None
+    return DATASET_COLUMNS[dataset]
+
+
+# Arrow types each dataset's columns are cast to while the parquet table is still
+# in Arrow form (apply_dtypes), so pandas receives datetime64 instead of
+# datetime.date objects and narrow numeric columns instead of int64/float64.
+#  - Dates become timestamp[ns] (tz-aware sources keep their tz), which makes the
+#    pd.to_datetime in fix_date_columns a no-op.
+#  - The measures the pages average (max_user_level, engagement_event_count,
+#    total_time_minutes, avg_session_length_minutes, active_span, days_to_ra) stay
+#    float64, as pandas loaded them: float32 would change the displayed averages.
+#    engagement_event_count and active_span are null for some users, so they are
+#    float (NaN) rather than int.
+#  - gpc stays float64: it is compared against the 90% Game Completed threshold and
+#    float32 rounding could move values just under 90 onto it.
+TIMESTAMP = pa.timestamp("ns")
+
+USER_DTYPES = {
+    "first_open": TIMESTAMP,
+    "la_date": TIMESTAMP,
+    "last_event_date": TIMESTAMP,
+    "max_user_level": pa.float64(),
+    "gpc": pa.float64(),
+    "lr_flag": pa.int8(),
+    "la_flag": pa.int8(),
+    "ra_flag": pa.int8(),
+    "gc_flag": pa.int8(),
+    "engagement_event_count": pa.float64(),
+    "total_time_minutes": pa.float64(),
+    "avg_session_length_minutes": pa.float64(),
+    "active_span": pa.float64(),
+    "days_to_ra": pa.float64(),
+}
+
+DATASET_DTYPES = {
+    "cr_user_progress": USER_DTYPES,
+    "unity_user_progress": USER_DTYPES,
+    "cr_app_launch": USER_DTYPES,
+    "cr_book_user_cohorts": {},
+    "cr_cohorts": {},
+    "cr_book_user_book_summary": {
+        "book_level": pa.float32(),
+        "total_events": pa.int32(),
+        "active_days_for_book": pa.int16(),
+    },
+}
+
+
+def dataset_dtypes(dataset):
+    return DATASET_DTYPES[dataset]
+
+
+def apply_dtypes(table, dtypes):
+    """
+    Cast the columns of an Arrow table that are declared in dtypes.
+
+    Returns (table, drift) where drift lists every declared column that could
+    not be cast safely (an unexpected source type, nulls in an integer column, a
+    value out of range, an unparseable date).  Those columns are left exactly as
+    exported, so the frame still loads and the pandas-side clean-up handles them
+    as before.  Declared columns missing from the table are skipped, like the
+    column allowlist does.
+    """
+    drift = []
+    for name, target in dtypes.items():
+        if name not in table.column_names:
+            continue
+
+        index = table.column_names.index(name)
+        column = table.column(index)
+        source = column.type
+        if source == target:
+            continue
+
+        if pa.types.is_timestamp(target):
+            if pa.types.is_timestamp(source) and source.tz is not None:
+                target = pa.timestamp(target.unit, tz=source.tz)
+            compatible = pa.types.is_timestamp(source) or pa.types.is_date(source) or pa.types.is_string(source)
+        elif pa.types.is_integer(target):
+            compatible = pa.types.is_integer(source) and column.null_count == 0
+        else:
+            compatible = pa.types.is_integer(source) or pa.types.is_floating(source)
+
+        if not compatible:
+            nulls = f" with {column.null_count} nulls" if column.null_count else ""
+            drift.append(f"{name}: exported as {source}{nulls}, expected {target}")
+            continue
+
+        try:
+            table = table.set_column(index, name, column.cast(target, safe=True))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            drift.append(f"{name}: cannot cast {source} to {target} ({e})")
+    return table, drift
+
+
+# Low-cardinality string columns held as pandas categoricals once a run_date is
+# loaded.  Each column is one dimension with a single sorted category list shared
+# by every user frame, so isin/==/groupby compare integer codes and frames that
+# are concatenated (All apps) or merged keep the categorical dtype.  Categories
+# are sorted so groupby/sort_values order matches the old object columns; any
+# groupby on these columns needs observed=True.
+CATEGORICAL_COLUMNS = [
+    "app_language",
+    "country",
+    "app",
+    "furthest_event",
+    "book_language",
+    "stickiness",
+    "cohort_name",
+]
+
+
+def encode_categoricals(frames):
+    """
+    Encode CATEGORICAL_COLUMNS in place across frames ({name: DataFrame}), one
+    shared CategoricalDtype per column.  Returns {column: CategoricalDtype}.
+    """
+    dtypes = {}
+    for column in CATEGORICAL_COLUMNS:
+        present = [df for df in frames.values() if column in df.columns]
+        if not present:
+            continue
+
+        values = set()
+        for df in present:
+            values.update(df[column].dropna().unique())
+        dtype = pd.CategoricalDtype(sorted(values))
+
+        for df in present:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].cat.set_categories(dtype.categories)
+            else:
+                df[column] = df[column].astype(dtype)
+        dtypes[column] = dtype
+    return dtypes
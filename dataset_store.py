@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+
+# How often the watcher checks GCS for a newer run_date.  0 disables the watcher,
+# in which case the process keeps the run_date it first loaded until it restarts.
+RUN_DATE_POLL_SECONDS = int(os.environ.get("RUN_DATE_POLL_SECONDS", "900"))
+
+
+class DatasetStore:
+    """
+    Version pointer for the shared user dataset.
+
+    Readers get the current (run_date, dataset) without taking a lock.  Only the
+    first version is built on a request thread - concurrent first callers wait
+    on one build instead of each starting their own.  After that, new run_dates
+    are built by the watcher thread, off the request path, and published with a
+    single reference assignment, so a reader sees either the old version or the
+    new one, never a mix.
+
+    The version being replaced stays reachable (as `previous`) until the watcher's
+    next poll, so a script run that pinned it just before the swap can finish on
+    consistent data.  After that only sessions still holding it keep it alive.
+
+    on_publish(run_date), if given, is called after each version is published
+    (the first one included); it should return quickly.
+    """
+
+    def __init__(self, find_latest, build, logger=None, on_publish=None):
+        self._find_latest = find_latest
+        self._build = build
+        self._logger = logger
+        self._on_publish = on_publish
+        self._current = None   # (run_date, dataset)
+        self._previous = None  # (run_date, dataset) replaced by the last swap
+        self._build_lock = threading.Lock()
+        self._watcher = None
+
+    def current(self):
+        """Return (run_date, dataset), building the first version on this thread if there is none yet."""
+        current = self._current
+        if current is not None:
+            return current
+        with self._build_lock:
+            if self._current is not None:
+                return self._current
+            run_date = self._find_latest()
+            self._current = current = (run_date, self._build(run_date))
+        self._published(run_date)
+        return current
+
+    def get(self, run_date):
+        """Return the dataset for run_date if it is the current or previous version, else the current one."""
+        for version in (self._current, self._previous):
+            if version is not None and version[0] == run_date:
+                return version[1]
+        return self.current()[1]
+
+    def refresh(self):
+        """Build and publish the latest run_date if it is newer than the current one.  Returns True on a swap."""
+        latest = self._find_latest()
+        current = self._current
+        if current is not None and latest <= current[0]:  # YYYY-MM-DD sorts correctly
+            return False
+
+        with self._build_lock:
+            current = self._current
+            if current is not None and latest <= current[0]:
+                return False
+            started = time.perf_counter()
+            dataset = self._build(latest)
+            self._previous, self._current = current, (latest, dataset)
+
+        if self._logger:
+            previous_run_date = current[0] if current else None
+            self._logger.info(
+                f"User dataset swapped from run_date={previous_run_date} to run_date={latest} "
+                f"(built in {time.perf_counter() - started:.1f}s)"
+            )
+        self._published(latest)
+        return True
+
+    def _published(self, run_date):
+        if self._on_publish is None:
+            return
+        try:
+            self._on_publish(run_date)
+        except Exception:
+            # The new version is served either way
+            if self._logger:
+                self._logger.exception(f"on_publish failed for run_date={run_date}")
+
+    def start_watcher(self, interval=RUN_DATE_POLL_SECONDS):
+        """Poll for a new run_date every interval seconds on a daemon thread (once per store)."""
+        if interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(
+            target=self._watch, args=(interval,), name="run-date-watcher", daemon=True
+        )
+        self._watcher.start()
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            # A run pinned to the version replaced last poll has long finished
+            self._previous = None
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the current version; try again next poll
+                if self._logger:
+                    self._logger.exception("Checking for a new run_date failed")
@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Offline derive step: reads the raw user_data_parquet_cache exports for one
+# run_date, runs the dashboard's clean-up (users.derive_user_frames - language
+# names, date columns, Unity dedupe, clean_cr_users_to_single_language, active_span
+# clipping, categorical encoding) once, and writes the cleaned frames to
+#
+#     gs://<users.DERIVED_PATH>/<frame name>/run_date=YYYY-MM-DD/<frame name>.parquet
+#
+# Dashboard processes that find all of them for the current run_date download
+# those instead of the raw exports and skip the clean-up entirely.  Schedule it
+# after the nightly exports have landed:
+#
+#     python derive.py                          # latest run_date, written to GCS
+#     python derive.py --run-date 2025-01-31
+#     python derive.py --output-dir ./derived   # local copy, e.g. to inspect the output
+
+
+def derive(run_date=None, output_dir=None):
+    import settings
+    import users
+
+    settings.initialize()
+    logger = settings.get_logger()
+    run_date = run_date or users.get_latest_run_date()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users.LOADER_MAX_WORKERS, thread_name_prefix="derive") as pool:
+        futures = {
+            name: pool.submit(load, run_date)
+            for name, (load, _) in users.USER_DATASET_LOADERS.items()
+        }
+        raw_frames = {name: future.result() for name, future in futures.items()}
+    loaded = time.perf_counter()
+
+    frames = users.derive_user_frames(raw_frames)
+    derived = time.perf_counter()
+
+    fs = None if output_dir else users.get_gcs_filesystem()
+    for name, df in frames.items():
+        path = users.derived_object_path(name, run_date)
+        if output_dir:
+            path = os.path.join(output_dir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_parquet(path)
+        else:
+            with fs.open(path, "wb") as f:
+                df.to_parquet(f)
+
+    logger.info(
+        f"Derived user frames for run_date={run_date}: "
+        f"load {loaded - started:.1f}s, derive {derived - loaded:.1f}s, "
+        f"write {time.perf_counter() - derived:.1f}s ("
+        + ", ".join(f"{name}={len(df)}" for name, df in frames.items())
+        + ")"
+    )
+    return frames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize the cleaned user frames for a run_date.")
+    parser.add_argument("--run-date", help="YYYY-MM-DD; defaults to the latest cr_user_progress export")
+    parser.add_argument("--output-dir", help="write under this local directory instead of GCS")
+    args = parser.parse_args()
+
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+
+    derive(run_date=args.run_date, output_dir=args.output_dir)
+    sys.exit(0)
@@ -2,4 +2,9 @@
 set -e
 
 python add_ga.py
+
+# Fetch and process the latest data before the server starts accepting traffic.
+# A failed warm-up is not fatal: the first page view loads the data instead.
+python -u warmup.py || echo "Warm-up did not complete; starting the dashboard anyway"
+
 exec python -u -m streamlit run main.py --server.port=8501 --server.address=0.0.0.0
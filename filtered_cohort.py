@@ -0,0 +1,160 @@
+import threading
+
+import pandas as pd
+
+import metrics
+
+# A page's user cohort, built once from its filters.  FilterSpec puts the filters
+# of apply_user_filters in one canonical form, and FilteredCohort computes from it -
+# lazily, once each - what the page's consumers read: the progress rows, the
+# app-launch (LR) rows, the funnel counts and the engagement means.  Every
+# consumer on the page is handed the same object, so the rows are selected once
+# per frame and each count once per page run.
+#
+# Rows are CohortViews (see cohort_view): counting and averaging read a few
+# columns without copying the cohort; users / users_LR are the DataFrames
+# apply_user_filters returns, for charts and downloads.  The counts and means go
+# through the cache_result functions of metrics, keyed by the views' filter
+# tokens, so they are computed once per dataset version rather than once per run.
+
+
+def _as_tuple(value):
+    if value is None:
+        return None
+    return (value,) if isinstance(value, str) else tuple(value)
+
+
+class FilterSpec:
+    """
+    The filters of apply_user_filters in canonical form: apps, languages,
+    countries and cohorts as tuples, the date range as two Timestamps.  Specs
+    that select the same rows compare equal, whether the page passed strings or
+    lists, so they also give the same filter tokens (and cache keys).
+    """
+
+    def __init__(self, app=None, daterange=None, languages=("All",), countries_list=("All",), cohort=None):
+        self.apps = _as_tuple(app)
+        self.daterange = (
+            tuple(pd.to_datetime(d) for d in daterange) if daterange is not None and len(daterange) == 2 else None
+        )
+        self.languages = _as_tuple(languages) or ("All",)
+        self.countries = _as_tuple(countries_list) or ("All",)
+        self.cohorts = _as_tuple(cohort) or None
+
+    def key(self):
+        return (self.apps, self.daterange, self.languages, self.countries, self.cohorts)
+
+    def __eq__(self, other):
+        return isinstance(other, FilterSpec) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"FilterSpec{self.key()!r}"
+
+    def filters(self):
+        """Keyword arguments of apply_user_filters / select_users for this spec."""
+        return {
+            "daterange": list(self.daterange) if self.daterange is not None else None,
+            "languages": list(self.languages),
+            "countries_list": list(self.countries),
+            "app": list(self.apps) if self.apps is not None else None,
+            "cohort": list(self.cohorts) if self.cohorts is not None else None,
+        }
+
+
+class FilteredCohort:
+    """
+    The users of source (and of lr_source, the app-launch frame the LR step is
+    counted on, if any) matching spec.  Nothing is computed until it is read.
+    """
+
+    def __init__(self, spec, source, lr_source=None):
+        self.spec = spec
+        self._source = source
+        self._lr_source = lr_source
+        self._memo = {}
+        self._lock = threading.RLock()
+
+    def _memoized(self, key, compute):
+        with self._lock:
+            if key not in self._memo:
+                self._memo[key] = compute()
+            return self._memo[key]
+
+    @property
+    def view(self):
+        """Progress rows as a read-only CohortView."""
+        return self._memoized("view", lambda: metrics.select_users(self._source, **self.spec.filters()))
+
+    @property
+    def view_LR(self):
+        """App-launch (LR) rows as a read-only CohortView, or None without an LR frame."""
+        if self._lr_source is None:
+            return None
+        return self._memoized("view_LR", lambda: metrics.select_users(self._lr_source, **self.spec.filters()))
+
+    @property
+    def users(self):
+        """Progress rows as a DataFrame (see apply_user_filters)."""
+        return self._memoized("users", lambda: metrics.apply_user_filters(self._source, **self.spec.filters()))
+
+    @property
+    def users_LR(self):
+        """App-launch (LR) rows as a DataFrame, or None without an LR frame."""
+        if self._lr_source is None:
+            return None
+        return self._memoized("users_LR", lambda: metrics.apply_user_filters(self._lr_source, **self.spec.filters()))
+
+    def stage_counts(self):
+        """get_metric_user_count of the progress rows for every stat of metrics.FUNNEL_STATS, in one pass."""
+        return self._memoized("stage_counts", lambda: metrics.get_funnel_counts(self.view))
+
+    def count(self, stat):
+        """get_metric_user_count for stat; LR is counted on the LR rows when there are any."""
+        if stat == "LR" and self.view_LR is not None:
+            return self._memoized(("count", stat), lambda: metrics.get_metric_user_count(self.view_LR, stat=stat))
+        return self.stage_counts().get(stat, 0)
+
+    def distinct_users(self, user_key, LR=False):
+        """Distinct user_key values of the progress rows (LR=True: of the LR rows if there are any)."""
+        def compute():
+            rows = self.view_LR if LR and self.view_LR is not None and user_key in self.view_LR.columns else self.view
+            return metrics.get_distinct_user_count(rows, user_key)
+        return self._memoized(("distinct_users", user_key, LR), compute)
+
+    def funnel_counts(self, stats, user_key="cr_user_id"):
+        """
+        Counts of the engagement funnel steps in stats: LR is the distinct users
+        reached (of the LR rows when there are any), every other step its
+        get_metric_user_count.
+        """
+        return [
+            self.distinct_users(user_key, LR=True) if stat == "LR" else self.count(stat)
+            for stat in stats
+        ]
+
+    def engagement_metrics(self):
+        return self._memoized("engagement_metrics", lambda: metrics.get_engagement_metrics(self.view))
+
+    def gpp_avg(self):
+        return self._memoized("gpp_avg", lambda: metrics.get_cohort_GPP_avg(self.view))
+
+    def gc_avg(self):
+        return self._memoized("gc_avg", lambda: metrics.get_cohort_GC_avg(self.view))
+
+
+def filtered_cohort(app, daterange, language, countries_list, cohort=None):
+    """
+    The cohort of get_filtered_users: progress rows of the app's user frame (CR
+    users for a cohort) and, for CR data, the app-launch rows LR is counted on.
+    """
+    spec = FilterSpec(app, daterange, language, countries_list, cohort)
+    is_cr_data = "Unity" not in spec.apps and spec.cohorts in (("All",), None)
+
+    # Cohorts are always CR users — never pull from Unity/All df
+    effective_app = "CR" if spec.cohorts else list(spec.apps)
+    source = metrics.select_user_dataframe(app=effective_app)
+    lr_source = metrics.select_user_dataframe(app="CR", stat="LR") if is_cr_data else None
+    return FilteredCohort(spec, source, lr_source)
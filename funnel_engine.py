@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+# Engagement funnel counts in one pass.  When a run_date is loaded, every user
+# frame gets two small columns (add_funnel_columns):
+#
+#   funnel_rank   int8  how far down the funnel furthest_event is: 0 for any other
+#                       (or no) event, then download_completed=1 < tapped_start <
+#                       selected_level < puzzle_completed < level_completed=5
+#   funnel_flags  int8  bit 0 LA (max_user_level >= 1), bit 1 RA (>= 25),
+#                       bit 2 GC (LA and gpc >= 90)
+#
+# A funnel step counts the users at its rank or further, so one np.bincount of
+# funnel_rank and a reverse cumulative sum give DC, TS, SL and PC at once, and a
+# bincount of funnel_flags gives LA, RA and GC; grouped counts are the same with
+# group * width + value as the bin.  The columns are taken along with the rows
+# by every filter, so a filtered cohort still has them; frames without them
+# (not from the dataset) have them computed on the fly.
+
+FUNNEL_EVENTS = ["download_completed", "tapped_start", "selected_level", "puzzle_completed", "level_completed"]
+
+# Funnel step -> the funnel_rank a user needs to count for it
+RANK_STEPS = {"DC": 1, "TS": 2, "SL": 3, "PC": 4}
+N_RANKS = len(FUNNEL_EVENTS) + 1
+
+# Funnel step -> its bit in funnel_flags
+FLAG_STEPS = {"LA": 1, "RA": 2, "GC": 4}
+N_FLAGS = 8
+
+FUNNEL_COLUMNS = ["funnel_rank", "funnel_flags"]
+
+
+def funnel_rank(furthest_event):
+    """funnel_rank (int8 array) of a furthest_event Series."""
+    if isinstance(furthest_event.dtype, pd.CategoricalDtype):
+        # Rank per category, then one lookup per row; the last slot is null (code -1)
+        ranks = pd.Categorical(furthest_event.cat.categories, categories=FUNNEL_EVENTS).codes + 1
+        lookup = np.append(ranks, 0).astype(np.int8)
+        return lookup[furthest_event.cat.codes.to_numpy()]
+    return (pd.Categorical(furthest_event, categories=FUNNEL_EVENTS).codes + 1).astype(np.int8)
+
+
+def funnel_flags(max_user_level, gpc):
+    """funnel_flags (int8 array) from max_user_level and gpc Series; a null compares False."""
+    la = (max_user_level >= 1).to_numpy(dtype=bool, na_value=False)
+    ra = (max_user_level >= 25).to_numpy(dtype=bool, na_value=False)
+    gc = la & (gpc >= 90).to_numpy(dtype=bool, na_value=False)
+    return (la * FLAG_STEPS["LA"] | ra * FLAG_STEPS["RA"] | gc * FLAG_STEPS["GC"]).astype(np.int8)
+
+
+def add_funnel_columns(frames):
+    """Add FUNNEL_COLUMNS, in place, to the frames ({name: DataFrame}) holding the columns they derive from."""
+    for df in frames.values():
+        if "furthest_event" in df.columns:
+            df["funnel_rank"] = funnel_rank(df["furthest_event"])
+        if "max_user_level" in df.columns and "gpc" in df.columns:
+            df["funnel_flags"] = funnel_flags(df["max_user_level"], df["gpc"])
+    return frames
+
+
+def _funnel_arrays(user_df, steps):
+    """(funnel_rank, funnel_flags) of user_df, each None unless a step in steps needs it."""
+    rank = flags = None
+    if any(step in RANK_STEPS for step in steps):
+        rank = (
+            user_df["funnel_rank"].to_numpy() if "funnel_rank" in user_df.columns
+            else funnel_rank(user_df["furthest_event"])
+        )
+    if any(step in FLAG_STEPS for step in steps):
+        flags = (
+            user_df["funnel_flags"].to_numpy() if "funnel_flags" in user_df.columns
+            else funnel_flags(user_df["max_user_level"], user_df["gpc"])
+        )
+    return rank, flags
+
+
+def _step_counts(by_rank, by_flags, steps, n_users):
+    """{step: counts} from per-rank and per-flags bincounts (last axis); LR is n_users."""
+    counts = {}
+    if by_rank is not None:
+        # reached[..., r]: users at rank r or further
+        reached = np.flip(np.cumsum(np.flip(by_rank, axis=-1), axis=-1), axis=-1)
+    for step in steps:
+        if step == "LR":
+            counts[step] = n_users
+        elif step in RANK_STEPS:
+            counts[step] = reached[..., RANK_STEPS[step]]
+        elif step in FLAG_STEPS:
+            with_flag = (np.arange(N_FLAGS) & FLAG_STEPS[step]) != 0
+            counts[step] = by_flags[..., with_flag].sum(axis=-1)
+        else:
+            counts[step] = 0
+    return counts
+
+
+def funnel_counts(user_df, steps):
+    """
+    {step: users counted for it} for the funnel steps ("LR", "DC", "TS", "SL",
+    "PC", "LA", "RA", "GC") of a filtered cohort (one row per user), as
+    get_metric_user_count counts them.
+    """
+    rank, flags = _funnel_arrays(user_df, steps)
+    by_rank = np.bincount(rank, minlength=N_RANKS) if rank is not None else None
+    by_flags = np.bincount(flags, minlength=N_FLAGS) if flags is not None else None
+    return _step_counts(by_rank, by_flags, steps, len(user_df))
+
+
+def funnel_counts_by_group(user_df, groupby_col, groups, steps):
+    """
+    funnel_counts for the rows of each of groups (values of groupby_col; a
+    group with no rows counts 0), as a DataFrame with one row per group and
+    one column per step.
+    """
+    values = user_df[groupby_col]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Category code -> position in groups (-1 for categories not asked for)
+        positions = pd.Index(groups).get_indexer(values.cat.categories)
+        codes = values.cat.codes.to_numpy()
+        group_of = np.where(codes >= 0, positions[codes], -1)
+    else:
+        group_of = pd.Index(groups).get_indexer(values)
+    in_group = group_of >= 0
+    group_of = group_of[in_group]
+    n_groups = len(groups)
+
+    rank, flags = _funnel_arrays(user_df, steps)
+    by_rank = by_flags = None
+    if rank is not None:
+        bins = group_of * N_RANKS + rank[in_group]
+        by_rank = np.bincount(bins, minlength=n_groups * N_RANKS).reshape(n_groups, N_RANKS)
+    if flags is not None:
+        bins = group_of * N_FLAGS + flags[in_group]
+        by_flags = np.bincount(bins, minlength=n_groups * N_FLAGS).reshape(n_groups, N_FLAGS)
+    n_users = np.bincount(group_of, minlength=n_groups)
+
+    counts = _step_counts(by_rank, by_flags, steps, n_users)
+    return pd.DataFrame(
+        {step: np.broadcast_to(count, n_groups) for step, count in counts.items()},
+        index=pd.Index(groups, name=groupby_col),
+    )
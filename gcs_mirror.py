@@ -0,0 +1,220 @@
+import contextlib
+import fcntl
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+from cache_stats import record_source
+
+# Local copy of the user_data_parquet_cache exports, so a container restart or a
+# cache expiry reads parquet from disk instead of pulling every file from GCS again.
+# Set PARQUET_MIRROR_DIR to an empty string to read straight from GCS.
+MIRROR_DIR = os.environ.get(
+    "PARQUET_MIRROR_DIR",
+    os.path.join(tempfile.gettempdir(), "cl_dashboard_parquet_mirror"),
+)
+MANIFEST_NAME = "manifest.json"
+# Held while a sync promotes its version and removes old ones
+LOCK_NAME = ".lock"
+
+# Staging directories (and manifest temp files) older than this are left over from
+# a crashed sync and removed by the next one; younger ones may be another
+# process's sync in progress
+STALE_STAGING_SECONDS = 24 * 3600
+
+OBJECT_PATH_RE = re.compile(
+    r"^(?P<dataset_path>.+)/run_date=(?P<run_date>\d{4}-\d{2}-\d{2})/(?P<name>[^/]+)$"
+)
+
+
+def object_generation(info):
+    """
+    Version marker of a remote object.  GCS objects carry a generation number;
+    other fsspec filesystems (e.g. the memory filesystem used as a fake) fall
+    back to mtime or size.
+    """
+    for key in ("generation", "mtime", "LastModified", "size"):
+        if info.get(key) is not None:
+            return str(info[key])
+    return ""
+
+
+class ParquetMirror:
+    """
+    Mirrors one run_date of each dataset to local disk.
+
+    Layout per dataset (the remote prefix, e.g. user_data_parquet_cache/cr_user_progress):
+
+        <root>/<dataset>/v-<id>/run_date=YYYY-MM-DD/<object name>
+        <root>/<dataset>/manifest.json
+
+    The run_date=YYYY-MM-DD folder name is kept as-is so pyarrow's hive
+    partitioning yields the same run_date column as reading from GCS.
+
+    The manifest records the run_date, the promoted directory and the generation
+    of every object in it.  A sync downloads only objects the manifest does not
+    already hold at the same generation into a staging directory, then promotes
+    it by atomically replacing the manifest.  Readers always follow the manifest,
+    so they never see a half-written run.  The version the manifest pointed to
+    before is kept until the next sync, so a reader that read the old manifest
+    (another worker or thread) can still finish reading it.  Promoting and
+    removing old versions happen under a lock file, so two processes syncing
+    the same dataset (a server worker and the warmup CLI, replicas sharing a
+    volume) never remove the version the other one just promoted.
+
+    remote_fs can be any fsspec filesystem: gcsfs in production, fsspec's
+    MemoryFileSystem as a fake backend.
+    """
+
+    def __init__(self, remote_fs, root=MIRROR_DIR, logger=None):
+        self.remote_fs = remote_fs
+        self.root = root
+        self.logger = logger
+
+    def fetch(self, remote_objects):
+        """
+        remote_objects: {remote path: fsspec info dict} for a single dataset and run_date,
+        as returned by fs.glob(pattern, detail=True).
+
+        Returns the local paths of the mirrored objects, in the same order.
+        """
+        if not remote_objects:
+            return []
+
+        parsed = {}
+        for path in remote_objects:
+            match = OBJECT_PATH_RE.match(path)
+            if match is None:
+                raise ValueError(f"Not a run_date object path: {path}")
+            parsed[path] = match
+
+        dataset_paths = {m.group("dataset_path") for m in parsed.values()}
+        run_dates = {m.group("run_date") for m in parsed.values()}
+        if len(dataset_paths) != 1 or len(run_dates) != 1:
+            raise ValueError("ParquetMirror.fetch expects objects from one dataset and one run_date")
+
+        dataset_dir = os.path.join(self.root, dataset_paths.pop().lstrip("/"))
+        run_date = run_dates.pop()
+        wanted = {
+            parsed[path].group("name"): object_generation(info)
+            for path, info in remote_objects.items()
+        }
+
+        manifest = self.read_manifest(dataset_dir)
+        if not self._is_current(dataset_dir, manifest, run_date, wanted):
+            manifest = self._sync(dataset_dir, manifest, run_date, wanted, parsed)
+        else:
+            record_source("parquet mirror", hits=len(wanted))
+
+        run_dir = os.path.join(dataset_dir, manifest["dir"])
+        return [os.path.join(run_dir, parsed[path].group("name")) for path in remote_objects]
+
+    def read_manifest(self, dataset_dir):
+        try:
+            with open(os.path.join(dataset_dir, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _is_current(self, dataset_dir, manifest, run_date, wanted):
+        if manifest.get("run_date") != run_date or manifest.get("objects") != wanted:
+            return False
+        run_dir = os.path.join(dataset_dir, manifest["dir"])
+        return all(os.path.exists(os.path.join(run_dir, name)) for name in wanted)
+
+    def _sync(self, dataset_dir, manifest, run_date, wanted, parsed):
+        os.makedirs(dataset_dir, exist_ok=True)
+        self._remove_stale_staging(dataset_dir)
+
+        # Objects already mirrored at the same generation are hard-linked, not re-downloaded
+        current_dir = os.path.join(dataset_dir, manifest["dir"]) if manifest.get("dir") else None
+        current_objects = manifest.get("objects", {}) if manifest.get("run_date") == run_date else {}
+
+        version = uuid.uuid4().hex[:8]
+        run_dir_name = f"v-{version}/run_date={run_date}"
+        staging_root = os.path.join(dataset_dir, f".staging-{version}")
+        staging_dir = os.path.join(staging_root, f"run_date={run_date}")
+        os.makedirs(staging_dir)
+
+        downloaded = 0
+        try:
+            for remote_path, match in parsed.items():
+                name = match.group("name")
+                target = os.path.join(staging_dir, name)
+                existing = os.path.join(current_dir, name) if current_dir else None
+
+                if existing and current_objects.get(name) == wanted[name] and os.path.exists(existing):
+                    try:
+                        os.link(existing, target)
+                    except OSError:
+                        shutil.copy2(existing, target)
+                else:
+                    self.remote_fs.get_file(remote_path, target)
+                    downloaded += 1
+
+            os.rename(staging_root, os.path.join(dataset_dir, f"v-{version}"))
+        except Exception:
+            shutil.rmtree(staging_root, ignore_errors=True)
+            raise
+
+        new_manifest = {"run_date": run_date, "dir": run_dir_name, "objects": wanted}
+        with self._locked(dataset_dir):
+            # Another process may have promoted its own version since manifest was read:
+            # that one (on disk now) is the previous version a reader may be using
+            promoted = self.read_manifest(dataset_dir)
+            self._write_manifest(dataset_dir, new_manifest)
+            previous = promoted["dir"].split("/")[0] if promoted.get("dir") else None
+            self._remove_stale_versions(dataset_dir, keep={f"v-{version}", previous})
+
+        record_source("parquet mirror", hits=len(wanted) - downloaded, misses=downloaded)
+        if self.logger:
+            self.logger.info(
+                f"Parquet mirror {dataset_dir}: run_date={run_date}, "
+                f"downloaded {downloaded} of {len(wanted)} objects"
+            )
+        return new_manifest
+
+    @contextlib.contextmanager
+    def _locked(self, dataset_dir):
+        """Exclusive lock on dataset_dir across processes sharing the mirror (flock on LOCK_NAME)."""
+        with open(os.path.join(dataset_dir, LOCK_NAME), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_manifest(self, dataset_dir, manifest):
+        tmp_path = os.path.join(dataset_dir, f".{MANIFEST_NAME}.{uuid.uuid4().hex[:8]}")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, os.path.join(dataset_dir, MANIFEST_NAME))  # atomic promote
+
+    def _remove_stale_versions(self, dataset_dir, keep):
+        """Remove every v-* directory but those in keep (the current and previous versions)."""
+        for entry in os.listdir(dataset_dir):
+            if entry.startswith("v-") and entry not in keep:
+                shutil.rmtree(os.path.join(dataset_dir, entry), ignore_errors=True)
+
+    def _remove_stale_staging(self, dataset_dir):
+        cutoff = time.time() - STALE_STAGING_SECONDS
+        for entry in os.listdir(dataset_dir):
+            if not (entry.startswith(".staging-") or entry.startswith(f".{MANIFEST_NAME}.")):
+                continue
+            path = os.path.join(dataset_dir, entry)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -1,9 +1,12 @@
 import streamlit as st
 from st_pages import add_page_title, get_nav_from_toml
 import sys
+from warmup import start_background_warmup
 
 st.set_page_config(layout="wide")
 
+start_background_warmup()
+
 # If you want to use the no-sections version, this
 # defaults to looking in .streamlit/pages.toml, so you can
 # just call `get_nav_from_toml()`
@@ -3,11 +3,20 @@ from rich import print
 import pandas as pd
 import numpy as np
 import datetime as dt
+from cache_keys import derive_token, tag_frame
+from cohort_view import CohortView
+from funnel_engine import funnel_counts, funnel_counts_by_group
+from user_index import cohort_index, date_bounds, frame_index, sort_by_date
+from user_keys import isin_keys
+from result_cache import RESULT_FLIGHTS, cache_result, share
 
 
 default_daterange = [dt.datetime(2021, 1, 1).date(), dt.date.today()]
 
-@st.cache_data(ttl="1d", show_spinner=False)
+FUNNEL_STATS = ["LR", "DC", "TS", "SL", "PC", "LA", "RA", "GC"]
+
+
+@cache_result(ttl="1d", show_spinner=False)
 def get_metric_user_count(
     user_df,
     stat="LR"
@@ -18,71 +27,43 @@ def get_metric_user_count(
     - stat: string, which funnel metric to count ("LR", "DC", "TS", "SL", "PC", "LA", "RA", "GC")
     """
 
-    # Stat-specific filters (formerly in filter_user_data)
-    if stat == "LA":
-        # Learners Acquired: max_user_level >= 1
-        return (user_df['max_user_level'] >= 1).sum()
-    elif stat == "RA":
-        # Readers Acquired: max_user_level >= 25
-        return (user_df['max_user_level'] >= 25).sum()
-    elif stat == "GC":
-        # Game Completed: max_user_level >= 1 AND gpc >= 90
-        return ((user_df['max_user_level'] >= 1) & (user_df['gpc'] >= 90)).sum()
-    elif stat == "LR":
-        # Learner Reached: all users in cohort
-        return len(user_df)
-
-    # Otherwise: classic funnel by furthest_event
-    furthest = user_df["furthest_event"]
-
-    download_completed_count = (furthest == "download_completed").sum()
-    tapped_start_count      = (furthest == "tapped_start").sum()
-    selected_level_count    = (furthest == "selected_level").sum()
-    puzzle_completed_count  = (furthest == "puzzle_completed").sum()
-    level_completed_count   = (furthest == "level_completed").sum()
-
-    if stat == "DC":
-        return (
-            download_completed_count
-            + tapped_start_count
-            + selected_level_count
-            + puzzle_completed_count
-            + level_completed_count
-        )
-    if stat == "TS":
-        return (
-            tapped_start_count
-            + selected_level_count
-            + puzzle_completed_count
-            + level_completed_count
-        )
-    if stat == "SL":
-        return (
-            selected_level_count
-            + puzzle_completed_count
-            + level_completed_count
-        )
-    if stat == "PC":
-        return (
-            puzzle_completed_count
-            + level_completed_count
-        )
-
-    return 0  # default fallback
+    # One bincount over the precomputed funnel_rank / funnel_flags (see funnel_engine):
+    # LA, RA, GC are max_user_level >= 1, >= 25 and >= 1 with gpc >= 90, LR is
+    # every user, and DC..PC count the users whose furthest_event is that step or
+    # further down the funnel
+    return funnel_counts(user_df, [stat])[stat]
 
 
-def select_user_dataframe(app, stat=None):
+@cache_result(ttl="1d", show_spinner=False)
+def get_funnel_counts(user_df, stats=tuple(FUNNEL_STATS)):
+    """{stat: get_metric_user_count(user_df, stat)} for every stat in stats, in one pass."""
+    return funnel_counts(user_df, list(stats))
+
+
+@cache_result(ttl="1d", show_spinner=False)
+def get_distinct_user_count(user_df, user_key="cr_user_id"):
+    """Distinct users in an already-filtered cohort, by user_key (the LR step of the engagement funnel)."""
+    return user_df[user_key].nunique()
+
+
+def user_frame_name(app, stat=None):
+    """Name of the user frame holding app's rows for stat (see select_user_dataframe)."""
     apps = [app] if isinstance(app, str) else app
 
     if "Unity" in apps:
-        return st.session_state["df_unity_users"]
+        return "df_unity_users"
     elif apps == ["CR"] and stat == "LR":
-        return st.session_state["df_cr_app_launch"]
+        return "df_cr_app_launch"
     else:
-        return st.session_state["df_cr_users"]
+        return "df_cr_users"
+
+
+def select_user_dataframe(app, stat=None):
+    from users import get_user_df
+    return get_user_df(user_frame_name(app, stat))
 
 
-@st.cache_data(ttl="1d", show_spinner=False)
+@cache_result(ttl="1d", show_spinner=False)
 def get_cohort_GPP_avg(cohort_df):
     """
     Calculates average 'gpc' for the LA cohort only (furthest_event == 'level_completed').
@@ -96,7 +77,7 @@ def get_cohort_GPP_avg(cohort_df):
     return np.average(la_df["gpc"].fillna(0))
 
 
-@st.cache_data(ttl="1d", show_spinner=False)
+@cache_result(ttl="1d", show_spinner=False)
 def get_cohort_GC_avg(cohort_df):
     """
     Returns the percentage of LA users (furthest_event == 'level_completed') with gpc >= 90.
@@ -127,7 +108,7 @@ def get_counts(
     user_cohort_df,          # DataFrame with all the new columns
     groupby_col="app_language",  # or "country", or any grouping column you want
 ):
-    grouped = user_cohort_df.groupby(groupby_col)
+    grouped = user_cohort_df.groupby(groupby_col, observed=True)
 
     summary = grouped.agg(
         LR=("lr_flag", "sum"),
@@ -148,7 +129,7 @@ def get_counts(
 
 
 # Get the campaign data and filter by date, language, and country selections
-@st.cache_data(ttl="1d", show_spinner=False)
+@cache_result(ttl="1d", show_spinner=False)
 def filter_campaigns(df_campaigns_all,daterange,selected_languages,countries_list):
 
     # Drop the campaigns that don't meet the naming convention
@@ -195,27 +176,30 @@ def get_month_ranges(start_date, end_date):
 def get_totals_per_month_from_cohort(cohort_df, stat, daterange, date_col="first_open"):
     """
     Calculates totals per month by slicing a pre-built cohort_df on date_col for each month.
+    cohort_df is not modified.
     """
     month_ranges = get_month_ranges(daterange[0], daterange[1])
     df_campaigns_all = st.session_state["df_campaigns_all"]
+    languages = cohort_df["app_language"].unique().tolist()
+    countries = cohort_df["country"].unique().tolist()
     totals_by_month = []
 
+    # Sort once by date_col (a no-op for the shared user frames), so each month
+    # is a searchsorted slice instead of two masks over the whole column
+    sorted_df, dates = sort_by_date(cohort_df, date_col)
+
     for start_date, end_date in month_ranges:
         clipped_start_date = start_date
         clipped_end_date = end_date
         clipped_range = [clipped_start_date, clipped_end_date]
 
         # Slice the cohort_df by date_col for this month
-        start = pd.to_datetime(clipped_start_date)
-        end = pd.to_datetime(clipped_end_date)
-        cohort_df[date_col] = pd.to_datetime(cohort_df[date_col])  # Ensures column type
-        df_month = cohort_df[
-            (cohort_df[date_col] >= start) & (cohort_df[date_col] <= end)
-        ]
+        lo, hi = date_bounds(dates, pd.to_datetime(clipped_start_date), pd.to_datetime(clipped_end_date))
+        df_month = sorted_df.iloc[lo:hi]
         total = get_metric_user_count(df_month, stat=stat)
 
         # Filter campaigns based on the clipped date range
-        df_campaigns = filter_campaigns(df_campaigns_all, clipped_range, cohort_df["app_language"].unique(), cohort_df["country"].unique())
+        df_campaigns = filter_campaigns(df_campaigns_all, clipped_range, languages, countries)
         cost = df_campaigns["cost"].sum()
         lrc = (cost / total).round(2) if total != 0 else 0
 
@@ -253,37 +237,138 @@ def     apply_user_filters(
     app : str or list[str]
         Filters by app name (e.g. "CR", "Unity").
     cohort : str or list[str]
-        Filters by named cohort via cr_cohorts lookup.
+        Filters by named cohort via the cohort index of df_cr_cohorts.
+
+    When session_df is a tagged dataset frame, sessions asking for the same
+    filters at the same time share one filtering pass (see single_flight).
     """
-    df = session_df.copy()
+    # Key the result by the source frame's token plus the filters, so cached
+    # functions called with it skip hashing its contents
+    token = _filter_token(session_df, daterange, languages, countries_list, app, cohort)
+    if token is None:
+        return _filter_users(session_df, daterange, languages, countries_list, app, cohort)
+
+    def filter_and_tag():
+        return tag_frame(_filter_users(session_df, daterange, languages, countries_list, app, cohort), token)
+
+    # Every caller gets its own (lazy, copy-on-write) copy of the shared result
+    return share(RESULT_FLIGHTS.do(token, filter_and_tag))
+
+
+def select_users(
+    session_df,
+    daterange=None,
+    languages=["All"],
+    countries_list=["All"],
+    app=None,
+    cohort=None,
+):
+    """
+    The rows of session_df matching the filters (see apply_user_filters) as a
+    read-only CohortView: nothing is copied until a consumer reads a column.
+    Use it where only a few columns of the cohort are read (metric tiles,
+    funnel counts); apply_user_filters returns the same rows as a DataFrame.
+    """
+    token = _filter_token(session_df, daterange, languages, countries_list, app, cohort)
+    if token is None:
+        return CohortView(session_df, _select_rows(session_df, daterange, languages, countries_list, app, cohort))
+
+    # Views are read-only, so concurrent callers can share one
+    return RESULT_FLIGHTS.do(
+        ("select_users", token),
+        lambda: CohortView(
+            session_df, _select_rows(session_df, daterange, languages, countries_list, app, cohort), token=token
+        ),
+    )
+
+
+def _filter_token(session_df, daterange, languages, countries_list, app, cohort):
+    return derive_token(
+        session_df,
+        "apply_user_filters",
+        tuple(str(pd.to_datetime(d)) for d in daterange) if daterange is not None and len(daterange) == 2 else None,
+        tuple(languages or ()),
+        tuple(countries_list or ()),
+        app if app is None or isinstance(app, str) else tuple(app),
+        cohort if cohort is None or isinstance(cohort, str) else tuple(cohort),
+    )
+
+
+def _filter_users(session_df, daterange, languages, countries_list, app, cohort):
+    rows = _select_rows(session_df, daterange, languages, countries_list, app, cohort)
+    return CohortView(session_df, rows).frame()
+
+
+def _select_rows(session_df, daterange, languages, countries_list, app, cohort):
+    """Rows matching the filters: None for all rows, a slice, or sorted row positions."""
+    index = frame_index(session_df)
+    if index is None:
+        return _mask_rows(session_df, daterange, languages, countries_list, app, cohort)
+
+    # Narrow row positions with the dataset's row-id index
+    rows = None  # all rows
+
+    if countries_list and countries_list != ["All"]:
+        rows = index.select(rows, "country", countries_list)
+
+    if languages and languages != ["All"]:
+        lang_col = "app_language" if "app_language" in session_df.columns else "language"
+        rows = index.select(rows, lang_col, languages)
+
+    if app and app not in (["All"], "All") and "app" in session_df.columns:
+        apps = [app] if isinstance(app, str) else app
+        rows = index.select(rows, "app", apps)
+
+    if cohort and "cr_user_id" in session_df.columns:
+        cohorts = [cohort] if isinstance(cohort, str) else cohort
+        rows = index.select_cohorts(rows, cohorts)
+
+    if daterange is not None and len(daterange) == 2:
+        start = pd.to_datetime(daterange[0])
+        end = pd.to_datetime(daterange[1])
+        if index.first_open is not None:
+            # The frame is sorted by first_open: the range is one slice of it
+            lo, hi = index.date_bounds(start, end)
+            if rows is None:
+                return slice(lo, hi)
+            rows = rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)]
+        else:
+            first_open = session_df["first_open"] if rows is None else session_df["first_open"].take(rows)
+            in_range = ((first_open >= start) & (first_open <= end)).to_numpy()
+            rows = np.flatnonzero(in_range) if rows is None else rows[in_range]
+
+    return rows
+
+
+def _mask_rows(session_df, daterange, languages, countries_list, app, cohort):
+    """_select_rows for frames without a row index: one combined mask over whole columns."""
+    df = session_df
+    mask = np.ones(len(df), dtype=bool)
 
     if daterange is not None and len(daterange) == 2:
         start = pd.to_datetime(daterange[0])
         end = pd.to_datetime(daterange[1])
-        df = df[(df["first_open"] >= start) & (df["first_open"] <= end)]
+        mask &= ((df["first_open"] >= start) & (df["first_open"] <= end)).to_numpy()
 
     if countries_list and countries_list != ["All"]:
-        df = df[df["country"].isin(countries_list)]
+        mask &= df["country"].isin(countries_list).to_numpy()
 
     if languages and languages != ["All"]:
         lang_col = "app_language" if "app_language" in df.columns else "language"
-        df = df[df[lang_col].isin(languages)]
+        mask &= df[lang_col].isin(languages).to_numpy()
 
     if app and app not in (["All"], "All") and "app" in df.columns:
         apps = [app] if isinstance(app, str) else app
-        df = df[df["app"].isin(apps)]
-        
-        # --- Cohort filter ---
+        mask &= df["app"].isin(apps).to_numpy()
+
+    # --- Cohort filter ---
     if cohort and "cr_user_id" in df.columns:
-        df_cr_cohorts = st.session_state.get("df_cr_cohorts")
-        if df_cr_cohorts is not None:
-            cohorts = [cohort] if isinstance(cohort, str) else cohort
-            valid_user_ids = df_cr_cohorts.loc[
-                df_cr_cohorts["cohort_name"].isin(cohorts), "cr_user_id"
-            ]
-            df = df[df["cr_user_id"].isin(valid_user_ids)]    
-        
-    return df
+        from users import get_user_df
+        cohorts = [cohort] if isinstance(cohort, str) else cohort
+        valid_user_ids = cohort_index(get_user_df("df_cr_cohorts")).members_of(cohorts)
+        mask &= isin_keys(df["cr_user_id"], valid_user_ids).to_numpy()
+
+    return np.flatnonzero(mask)
 
 
 
@@ -310,7 +395,7 @@ def calculate_average_metric_per_user(user_cohort_df, column_name):
     return average
 
 
-@st.cache_data(ttl="1d", show_spinner="Calculating metrics")
+@cache_result(ttl="1d", show_spinner="Calculating metrics")
 def get_engagement_metrics(user_cohort_df):
     if user_cohort_df.empty:
         zero = {k: 0 for k in ["Avg Level Reached", "Avg # Sessions / User",
@@ -338,53 +423,51 @@ def get_engagement_metrics(user_cohort_df):
         "Avg Days to RA":             days_to_ra if not pd.isna(days_to_ra) else 0,
     }
 
-def get_all_apps_combined_session_and_cohort_df(stat=None):
-    session_dfs = []
-    
+def all_apps_frame_name(stat=None):
+    """Name of the prebuilt all-apps union for stat: only CR's LR rows come from another frame."""
+    return "df_all_apps_LR" if user_frame_name("CR", stat) == "df_cr_app_launch" else "df_all_apps"
+
+
+def build_all_apps_frame(frames, stat=None):
+    """
+    The user frame of every app of get_apps for stat, stacked, from one
+    version's frames ({name: DataFrame}), sorted by first_open (stable, NaT
+    last) and with a source_app column naming the app each row was selected for.
+    """
     from ui_widgets import get_apps
-    all_apps = get_apps()
-    
-    for app in all_apps:
-        session_df = select_user_dataframe(app=app, stat=stat)
-        session_dfs.append(session_df)
+    apps = get_apps()
 
-    # Combine all the session dataframes
-    combined_session_df = pd.concat(session_dfs, ignore_index=True)
+    parts = [frames[user_frame_name(app, stat)] for app in apps]
+    combined = pd.concat(parts, ignore_index=True)
+    combined["source_app"] = pd.Categorical.from_codes(
+        np.repeat(np.arange(len(apps), dtype=np.int8), [len(part) for part in parts]),
+        categories=apps,
+    )
+    return combined.sort_values("first_open", kind="stable", na_position="last", ignore_index=True)
 
-    return combined_session_df
 
+def get_all_apps_combined_session_and_cohort_df(stat=None):
+    """
+    Every app's user frame for stat in one frame (see build_all_apps_frame).
+    The unions are built once per dataset version when it is loaded, so this is
+    a lookup: the frame is shared and must not be modified in place.
+    """
+    from users import get_user_df
+    return get_user_df(all_apps_frame_name(stat))
 
-def get_filtered_users(app, daterange, language, countries_list, cohort=None):
-    is_cr_data = "Unity" not in app and cohort in ("All", ["All"], None)
 
-    user_cr_df_LR = None
-    
-    # Cohorts are always CR users — never pull from Unity/All df
-    effective_app = "CR" if cohort else app
-    
-    session_df = select_user_dataframe(app=effective_app)
-    
-    user_cohort_df = apply_user_filters(
-        session_df=session_df,
-        daterange=daterange,
-        languages=language,
-        countries_list=countries_list,
-        app=app,
-        cohort=cohort
-    )
-    if is_cr_data:
-        session_df_LR = select_user_dataframe(app="CR", stat="LR")
-        user_cr_df_LR = apply_user_filters(
-            session_df=session_df_LR,
-            daterange=daterange,
-            languages=language,
-            countries_list=countries_list,
-            app=app,
-            cohort=cohort
-        )
-    return user_cohort_df, user_cr_df_LR
+def get_filtered_users(app, daterange, language, countries_list, cohort=None):
+    """
+    (progress rows, app-launch rows for LR or None) of the cohort matching the
+    filters, as DataFrames.  Pages that hand one cohort to several consumers use
+    filtered_cohort.filtered_cohort directly.
+    """
+    from filtered_cohort import filtered_cohort
+    user_cohort = filtered_cohort(app, daterange, language, countries_list, cohort=cohort)
+    return user_cohort.users, user_cohort.users_LR
 
 
+@cache_result(ttl="1d", show_spinner=False)
 def funnel_percent_by_group(
     cohort_df,
     cr_df_LR=None,
@@ -415,22 +498,18 @@ def funnel_percent_by_group(
     if cr_df_LR is not None:
         group_vals = group_vals | set(cr_df_LR[groupby_col].dropna().unique())
 
-    records = []
-    for group in sorted(group_vals):
-        if is_cr and cr_df_LR is not None:
-            group_LR = cr_df_LR[cr_df_LR[groupby_col] == group]
-            count_LR = group_LR[user_key].nunique() if user_key in group_LR else len(group_LR)
-        else:
-            group_LR = cohort_df[cohort_df[groupby_col] == group]
-            count_LR = group_LR[user_key].nunique() if user_key in group_LR else len(group_LR)
+    groups = sorted(group_vals)
 
-        row = {groupby_col: group, "LR": count_LR}
-        group_df = cohort_df[cohort_df[groupby_col] == group]
-        for step in funnel_steps[1:]:
-            row[step] = get_metric_user_count(group_df, stat=step)
-        records.append(row)
+    # LR: distinct users per group; every other step: one grouped bincount pass
+    LR_df = cr_df_LR if is_cr and cr_df_LR is not None else cohort_df
+    if user_key in LR_df.columns:
+        count_LR = LR_df[user_key].groupby(LR_df[groupby_col], observed=True, sort=False).nunique()
+    else:
+        count_LR = LR_df[groupby_col].value_counts()
+    counts = funnel_counts_by_group(cohort_df, groupby_col, groups, funnel_steps[1:])
+    counts.insert(0, "LR", count_LR.reindex(groups, fill_value=0).to_numpy())
 
-    df = pd.DataFrame(records)
+    df = counts.reset_index()
 
     # Add percent-normalized columns with _pct suffix
     norm_steps = [s for s in funnel_steps if s != "LR"]
@@ -446,7 +525,7 @@ def funnel_percent_by_group(
 
     return df, funnel_steps
 
-@st.cache_data(ttl="1d", show_spinner=False)
+@cache_result(ttl="1d", show_spinner=False)
 def get_sorted_funnel_df(
     cohort_df,
     cr_df_LR=None,
@@ -515,7 +594,7 @@ def get_sorted_funnel_df(
 
     return df, funnel_steps
 
-@st.cache_data(ttl="1d", show_spinner=False)
+@cache_result(ttl="1d", show_spinner=False)
 def get_top_and_bottom_funnel_groups(
     cohort_df,
     cr_df_LR=None,
@@ -0,0 +1,268 @@
+import os
+import threading
+import time
+
+from single_flight import SingleFlight
+
+# Computes the default view of every page in .streamlit/pages.toml - "All time",
+# all languages and countries, the page's default app/cohort and presets - right
+# after a user dataset is published (first load and every nightly hot-swap), so
+# the first analyst to open a page finds its funnels, engagement tiles, level
+# survival and LR series in the result cache instead of computing them.
+#
+# Each view calls the same cache_result functions with the same arguments as its
+# page, so the cache keys match.  Only the pure computations are warmed: chart
+# functions that draw Streamlit elements stay on st.cache_data, which has to run
+# them inside a session to record those elements.  The results also go to the
+# result store, so a run from the warm-up CLI serves the server processes too.
+#
+# The "All time" range ends today, so a view precomputed before midnight is
+# recomputed by its first visitor the next day.
+#
+# Set PRECOMPUTE_DEFAULT_VIEWS=0 to turn it off.
+PRECOMPUTE_ENABLED = os.environ.get("PRECOMPUTE_DEFAULT_VIEWS", "1") != "0"
+
+# One run per run_date: the warm-up stage and the on_publish thread share it
+_flights = SingleFlight()
+_done = set()
+
+
+def _all_time():
+    """The range calendar_selector's default "All time" option produces."""
+    import datetime as dt
+    return [dt.date(2021, 1, 1), dt.date.today()]
+
+
+def _engagement_funnel(user_cohort):
+    """What create_engagement_funnel and show_dual_metric_tiles compute, for any funnel size."""
+    user_key = "user_pseudo_id" if "Unity" in user_cohort.spec.apps else "cr_user_id"
+    user_cohort.funnel_counts(["LR", "DC", "TS", "SL", "PC", "LA", "RA", "GC"], user_key)
+    user_cohort.engagement_metrics()
+
+
+def single_funnel():
+    from filtered_cohort import filtered_cohort
+    import users
+
+    user_cohort = filtered_cohort(
+        app=["CR"], daterange=_all_time(), language=["All"],
+        countries_list=users.get_country_list(), cohort=None,
+    )
+    _engagement_funnel(user_cohort)
+
+
+def compare_funnels():
+    from filtered_cohort import filtered_cohort
+    import users
+
+    countries_list = users.get_country_list()
+    cohorts = users.get_cohort_list()
+    funnels = [(["Unity"], None), (["CR"], None)]
+    if cohorts:
+        funnels.append(("All", [cohorts[0]]))
+    for app, cohort in funnels:
+        _engagement_funnel(filtered_cohort(app, _all_time(), ["All"], countries_list, cohort=cohort))
+
+
+def sideways_funnel():
+    import metrics
+    import ui_components as uic
+
+    user_df, cr_df_LR = metrics.get_filtered_users(["CR"], _all_time(), ["All"], ["All"], cohort=None)
+    uic.get_sorted_funnel_df(
+        cohort_df=user_df, cr_df_LR=cr_df_LR, groupby_col="app_language", app=["CR"],
+        min_funnel=False, stat="LA", sort_by="Total", ascending=False, use_top_ten=True,
+    )
+
+
+def best_languages():
+    import metrics
+    import settings
+    import ui_components as uic
+    import users
+
+    user_df, cr_df_LR = metrics.get_filtered_users(
+        app=["CR"], language=users.get_language_list(),
+        countries_list=users.get_country_list(), daterange=settings.default_daterange,
+    )
+    uic.get_sorted_funnel_df(
+        cohort_df=user_df, cr_df_LR=cr_df_LR, groupby_col="app_language", app=["CR"],
+        min_funnel=True, stat="LR", sort_by="Percent", ascending=False, use_top_ten=True,
+    )
+
+
+def time_to_ra():
+    import metrics
+    import settings
+    import users
+
+    metrics.get_filtered_users(
+        app=["CR"], daterange=settings.default_daterange, language=users.get_language_list(),
+        countries_list=["All"], cohort=None,
+    )
+
+
+def levels_reached():
+    import metrics
+    import ui_components as uic
+
+    for app in ["Unity", "CR"]:
+        user_df, _ = metrics.get_filtered_users(
+            app=app, language=["All"], countries_list=["All"], daterange=uic.default_daterange,
+        )
+        if user_df is not None and not user_df.empty:
+            uic.get_level_survival(user_df, max_plot_level=80)
+
+
+def acquisition():
+    import datetime as dt
+    import metrics
+    import ui_components as uic
+    import users
+
+    # The page's date selector defaults to "Select year", i.e. this year so far
+    today = dt.date.today()
+    daterange = [dt.date(today.year, 1, 1), today]
+
+    # For CR the page charts the app_launch (LR) cohort
+    _, user_df = metrics.get_filtered_users(["CR"], daterange, users.get_language_list(), users.get_country_list())
+    metrics.get_metric_user_count(user_df, stat="LR")
+    for aggregate in (False, True):
+        uic.get_learners_reached_over_time(user_df, display_category="Language", aggregate=aggregate)
+
+
+def marketing_data():
+    import datetime as dt
+    from filtered_cohort import FilterSpec, FilteredCohort
+    import metrics
+    import users
+
+    # Costs are only reliable from May 2024, so the page starts "All time" there
+    daterange = [dt.date(2024, 5, 1), dt.date.today()]
+
+    user_cohort = FilteredCohort(
+        FilterSpec(daterange=daterange, languages=["All"], countries_list=users.get_country_list()),
+        source=metrics.get_all_apps_combined_session_and_cohort_df(stat="LA"),
+        lr_source=metrics.get_all_apps_combined_session_and_cohort_df(stat="LR"),
+    )
+    for stat in ["LR", "LA", "RA", "GC"]:
+        user_cohort.count(stat)
+    user_cohort.gpp_avg()
+    user_cohort.gc_avg()
+
+
+def books():
+    import books_helpers as bh
+    import ui_components as uic
+    import users
+
+    df_cr_book_user_cohorts = users.get_user_df("df_cr_book_user_cohorts")
+    df_cr_users = users.get_user_df("df_cr_users")
+
+    book_languages = bh.get_book_languages(df_cr_book_user_cohorts)
+    lang_map = bh.compute_lang_map(df_cr_book_user_cohorts)
+    mapped_ftm_languages = bh.mapped_ftm_languages_for_books(lang_map, book_languages)
+    cr_users_book_universe = bh.eligible_ftm_users(df_cr_users, mapped_ftm_languages)
+    tier_df_mapped = bh.tier_df_language_mapped(df_cr_book_user_cohorts, book_languages)
+    df_ftm_base, _ = bh.build_ftm_compare_la_only(
+        df_cr_users=df_cr_users,
+        eligible_users_df=cr_users_book_universe,
+        tier_df_mapped=tier_df_mapped,
+        ra_level_threshold=25,
+    )
+    uic.build_survival_curve_by_tier(
+        df_ftm_base=df_ftm_base, max_level=35, tiers_to_plot=[0, 1, 2, 3], include_overall_baseline=True,
+    )
+
+
+def book_details():
+    import book_details_helpers as bdh
+    import users
+
+    df_book_summary = users.get_user_df("df_cr_book_user_book_summary")
+    book_languages = bdh.get_book_languages_from_summary(df_book_summary)
+    df_filtered = bdh.get_book_summary_for_language(df_book_summary, book_languages)
+    if df_filtered.empty:
+        return
+    df_popularity = bdh.build_book_popularity(df_filtered)
+    bdh.build_stickiness_chart(df_popularity, min_readers=100, sort_by="Hooked")
+    bdh.build_book_ftm_outcomes(
+        df_filtered=df_filtered,
+        df_cr_users=users.get_user_df("df_cr_users"),
+        ra_level_threshold=25,
+        stickiness_filter="Hooked",
+    )
+
+
+# Page -> default view.  Language Difficulty (st.cache_data over BigQuery), the
+# user lookups and the admin page have no shared default worth computing ahead.
+DEFAULT_VIEWS = [
+    ("app_pages/single_funnel.py", single_funnel),
+    ("app_pages/compare_funnels.py", compare_funnels),
+    ("app_pages/sideways_funnel.py", sideways_funnel),
+    ("app_pages/best_languages.py", best_languages),
+    ("app_pages/time_to_ra.py", time_to_ra),
+    ("app_pages/levels_reached.py", levels_reached),
+    ("app_pages/acquisition.py", acquisition),
+    ("app_pages/marketing_data.py", marketing_data),
+    ("app_pages/books.py", books),
+    ("app_pages/book_details.py", book_details),
+]
+
+
+def precompute_default_views(run_date=None):
+    """
+    Compute every page's default view for run_date (the current one if None),
+    once per process, and log how long each took.  Returns True if all succeeded.
+    """
+    import settings
+    import users
+
+    if not PRECOMPUTE_ENABLED:
+        return True
+    if run_date is None:
+        run_date = users.get_dataset_store().current()[0]
+    if run_date in _done:
+        return True
+    return _flights.do(run_date, lambda: _run(run_date, settings.get_logger()))
+
+
+def _run(run_date, logger):
+    import users
+
+    if run_date in _done:  # finished just before this call
+        return True
+    ok = True
+    timings = []
+    started = time.perf_counter()
+    for page, view in DEFAULT_VIEWS:
+        if users.get_dataset_store().current()[0] != run_date:
+            # A newer run_date was published meanwhile; its own run takes over
+            logger.info(f"Precompute for run_date={run_date} stopped: no longer current")
+            return ok
+        view_started = time.perf_counter()
+        try:
+            view()
+            status = "ok"
+        except Exception as e:
+            # Best effort: the page computes whatever is missing on its first view
+            logger.exception(f"Precomputing the default view of {page} failed")
+            status = f"failed: {e}"
+            ok = False
+        timings.append(f"  {page:<36} {time.perf_counter() - view_started:7.2f}s  {status}")
+
+    _done.add(run_date)
+    logger.info(
+        f"Default views for run_date={run_date} precomputed in {time.perf_counter() - started:.2f}s\n"
+        + "\n".join(timings)
+    )
+    return ok
+
+
+def start_precompute(run_date):
+    """DatasetStore on_publish hook: precompute run_date's default views on a daemon thread."""
+    if not PRECOMPUTE_ENABLED or run_date in _done:
+        return
+    threading.Thread(
+        target=precompute_default_views, args=(run_date,), name=f"precompute-{run_date}", daemon=True
+    ).start()
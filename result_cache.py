@@ -0,0 +1,299 @@
+import contextlib
+import copy
+import datetime as dt
+import functools
+import inspect
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from cache_keys import frame_token, hash_args, tag_frame
+from cache_stats import record_compute
+from cohort_view import CohortView
+from result_store import CODE_VERSION, UnsupportedValue, decode, encode, open_result_store
+from single_flight import SingleFlight
+from user_keys import memory_usage
+
+# Process-wide cache for the pure computations (metrics, funnel/engagement frames,
+# campaign and book tables) shared by every session.  Unlike st.cache_data, which
+# keeps every distinct filter combination for its whole ttl, it holds at most
+# RESULT_CACHE_MB of results: each entry's size is measured when it is stored, a
+# function's entries beyond its quota are evicted first, and then the least
+# recently used entries of any function until the total fits the budget.
+#
+# On a miss the second tier (result_store, shared between processes) is tried
+# before computing, and freshly computed results are written to it.
+#
+# Functions that draw Streamlit elements (st.plotly_chart, st.metric...) must stay
+# on st.cache_data, which replays those elements on a hit; this cache only returns
+# the value.
+RESULT_CACHE_MB = int(os.environ.get("RESULT_CACHE_MB", "512"))
+
+# Default per-function quota, as a share of the budget, so one function with many
+# filter combinations cannot push everyone else's results out
+DEFAULT_QUOTA_FRACTION = 0.25
+
+
+class ResultCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (function, key) -> (value, size, expires_at), oldest first
+        self._functions = {}           # function -> usage counters
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, function, key):
+        """Return (True, value) for a live entry, else (False, None)."""
+        with self._lock:
+            stats = self._function_stats(function)
+            entry = self._entries.get((function, key))
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self._remove((function, key))
+                entry = None
+            if entry is None:
+                stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end((function, key))
+            stats["hits"] += 1
+            return True, entry[0]
+
+    def put(self, function, key, value, ttl=None, quota=None):
+        size = sizeof(value)
+        quota = quota or int(self.max_bytes * DEFAULT_QUOTA_FRACTION)
+        with self._lock:
+            stats = self._function_stats(function)
+            stats["quota"] = quota
+            if size > quota or size > self.max_bytes:
+                stats["too_large"] += 1
+                return
+            if (function, key) in self._entries:
+                self._remove((function, key))
+
+            expires_at = time.monotonic() + ttl if ttl else None
+            self._entries[(function, key)] = (value, size, expires_at)
+            self._bytes += size
+            stats["entries"] += 1
+            stats["bytes"] += size
+
+            # The function's own oldest entries go first, then anyone's
+            for entry_key in [k for k in self._entries if k[0] == function]:
+                if stats["bytes"] <= quota:
+                    break
+                self._evict(entry_key)
+            while self._bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def clear(self, function=None):
+        with self._lock:
+            for entry_key in [k for k in self._entries if function is None or k[0] == function]:
+                self._remove(entry_key)
+
+    def usage(self):
+        """Total and per-function entries, bytes, hits, misses and evictions."""
+        with self._lock:
+            return {
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "entries": len(self._entries),
+                "functions": {name: dict(stats) for name, stats in self._functions.items()},
+            }
+
+    def _function_stats(self, function):
+        stats = self._functions.get(function)
+        if stats is None:
+            stats = self._functions[function] = {
+                "entries": 0, "bytes": 0, "quota": None,
+                "hits": 0, "misses": 0, "evictions": 0, "too_large": 0,
+            }
+        return stats
+
+    def _evict(self, entry_key):
+        self._remove(entry_key)
+        self._functions[entry_key[0]]["evictions"] += 1
+
+    def _remove(self, entry_key):
+        _, size, _ = self._entries.pop(entry_key)
+        self._bytes -= size
+        stats = self._functions[entry_key[0]]
+        stats["entries"] -= 1
+        stats["bytes"] -= size
+
+
+def sizeof(value):
+    """Approximate memory held by a cached value, in bytes."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        return memory_usage(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, CohortView):
+        return value.nbytes()
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k) + sizeof(v) for k, v in value.items())
+    if value is None or isinstance(value, (str, bytes, int, float, np.generic, dt.date)):
+        return sys.getsizeof(value)
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def share(value):
+    """
+    Copy of a cached value that the caller may modify without changing the
+    cache.  With copy-on-write enabled (settings.initialize) frames are only
+    copied lazily, when the caller actually writes to them.  A frame's cache
+    key token carries over to its copy.
+    """
+    if isinstance(value, pd.DataFrame):
+        token = frame_token(value)
+        value = value.copy(deep=not pd.options.mode.copy_on_write)
+        return value if token is None else tag_frame(value, token)
+    if isinstance(value, pd.Series):
+        return value.copy(deep=not pd.options.mode.copy_on_write)
+    if isinstance(value, CohortView):
+        return value  # read-only
+    if isinstance(value, tuple):
+        return tuple(share(v) for v in value)
+    if isinstance(value, list):
+        return [share(v) for v in value]
+    if isinstance(value, dict):
+        return {k: share(v) for k, v in value.items()}
+    if value is None or isinstance(value, (str, bytes, int, float, np.generic, dt.date)):
+        return value
+    return copy.deepcopy(value)
+
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_MB * 1024 * 1024)
+RESULT_FLIGHTS = SingleFlight()
+
+_store = None
+_store_opened = False
+_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """The second-tier store, opened on first use; None if disabled or it cannot be opened."""
+    global _store, _store_opened
+    if not _store_opened:
+        with _store_lock:
+            if not _store_opened:
+                try:
+                    _store = open_result_store()
+                except Exception:
+                    _log_store_error("Opening the result store failed; continuing without it")
+                _store_opened = True
+    return _store
+
+
+def _log_store_error(message):
+    import settings
+    settings.get_logger().warning(message, exc_info=True)
+
+
+def _load_from_store(store_key):
+    store = get_result_store()
+    if store is None:
+        return False, None
+    try:
+        data = store.get(store_key)
+        return (False, None) if data is None else (True, decode(data))
+    except Exception:
+        _log_store_error(f"Reading {store_key} from the result store failed")
+        return False, None
+
+
+def _save_to_store(store_key, function, value, ttl):
+    store = get_result_store()
+    if store is None:
+        return
+    try:
+        store.put(store_key, function, encode(value), ttl=ttl)
+    except UnsupportedValue:
+        pass  # kept in RESULT_CACHE only
+    except Exception:
+        _log_store_error(f"Writing {store_key} to the result store failed")
+
+
+def cache_result(ttl=None, show_spinner=False, max_bytes=None):
+    """
+    Cache a pure function in RESULT_CACHE.  Arguments are keyed like
+    cache_keys.cache_frames (DataFrames by dataset token where they have one),
+    after binding them to the signature so positional and keyword calls share
+    entries.  ttl takes st.cache_data's forms ("1d", seconds); max_bytes is the
+    function's quota.
+
+    Results are also shared through the second-tier store under a key that adds
+    result_store.CODE_VERSION, so after a deploy that changes the function or
+    anything it calls (helpers, dtypes, DERIVED_VERSION...) old results are not read.
+
+    Concurrent misses on the same key (e.g. several sessions opening a page
+    right after a new run_date) are coalesced: one computes, the others wait
+    for its result.
+    """
+    if isinstance(ttl, str):
+        ttl = pd.Timedelta(ttl).total_seconds()
+    elif isinstance(ttl, dt.timedelta):
+        ttl = ttl.total_seconds()
+
+    def decorator(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+        signature = inspect.signature(fn)
+        store_prefix = f"{name}:{CODE_VERSION}:"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = hash_args(bound.arguments)
+
+            hit, value = RESULT_CACHE.get(name, key)
+            if not hit:
+                def load_or_compute():
+                    # A leader that finished just before this one started may have stored it
+                    hit, value = RESULT_CACHE.get(name, key)
+                    if hit:
+                        return value
+                    hit, value = _load_from_store(store_prefix + key)
+                    if not hit:
+                        started = time.perf_counter()
+                        value = fn(*args, **kwargs)
+                        record_compute(name, time.perf_counter() - started)
+                        _save_to_store(store_prefix + key, name, value, ttl)
+                    RESULT_CACHE.put(name, key, value, ttl=ttl, quota=max_bytes)
+                    return value
+
+                with _spinner(show_spinner, fn):
+                    value = RESULT_FLIGHTS.do((name, key), load_or_compute)
+            return share(value)
+
+        wrapper.clear = lambda: RESULT_CACHE.clear(name)
+        return wrapper
+
+    return decorator
+
+
+def _spinner(show_spinner, fn):
+    if get_script_run_ctx() is None:
+        # Background work (warm-up, precompute) has no page to show it on
+        return contextlib.nullcontext()
+    if isinstance(show_spinner, str):
+        return st.spinner(show_spinner)
+    if show_spinner:
+        return st.spinner(f"Running `{fn.__name__}(...)`.")
+    return contextlib.nullcontext()
+
+
+def cache_usage():
+    usage = RESULT_CACHE.usage()
+    usage["single_flight"] = dict(RESULT_FLIGHTS.stats)
+    return usage
@@ -0,0 +1,317 @@
+import abc
+import datetime as dt
+import glob
+import hashlib
+import io
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from user_keys import compact_keys, restore_keys
+
+# Second tier behind result_cache.RESULT_CACHE, shared by every dashboard process
+# that can reach it: a restarted process, a second Streamlit worker or another
+# replica reuses funnels, engagement metrics and campaign tables that one of them
+# already computed.  Keys are stable across processes - the function's name, the
+# CODE_VERSION and the arguments, with dataset frames keyed by (run_date, name) -
+# so a new nightly run_date or a deploy simply misses.
+#
+# RESULT_STORE selects the store: a path to a local SQLite file (the default,
+# in a private directory of the user's cache dir), "sqlite:///<path>", or an
+# empty string to disable it.  Another backend only needs get/put/clear (see
+# ResultStore).
+DEFAULT_RESULT_STORE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "cl_dashboard",
+    "results.sqlite",
+)
+RESULT_STORE = os.environ.get("RESULT_STORE", DEFAULT_RESULT_STORE)
+
+
+def _code_version():
+    """
+    Digest of everything a stored result depends on besides its arguments: the
+    app's Python sources and queries (helpers, DERIVED_VERSION, SNAPSHOT_VERSION,
+    dataset_schema's dtypes...), PARQUET_FULL_LOAD and APP_RELEASE, if set.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.md5(usedforsecurity=False)
+    h.update(f"release={os.environ.get('APP_RELEASE', '')}\n".encode())
+    h.update(f"full_load={os.environ.get('PARQUET_FULL_LOAD', '')}\n".encode())
+    paths = glob.glob(os.path.join(root, "*.py")) + glob.glob(os.path.join(root, "app_pages", "*.py"))
+    paths += glob.glob(os.path.join(root, "queries", "*.sql"))
+    for path in sorted(paths):
+        h.update(os.path.relpath(path, root).encode())
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()[:12]
+
+
+CODE_VERSION = _code_version()
+
+# Oldest-accessed entries are removed once the store grows past this
+RESULT_STORE_MB = int(os.environ.get("RESULT_STORE_MB", "2048"))
+
+
+class ResultStore(abc.ABC):
+    """Interface of a second-tier result store.  Values are bytes (see encode/decode)."""
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Return the stored bytes for key, or None if missing or expired."""
+
+    @abc.abstractmethod
+    def put(self, key, function, data, ttl=None):
+        """Store data for key (a result of function), expiring after ttl seconds if given."""
+
+    @abc.abstractmethod
+    def clear(self, function=None):
+        """Remove every entry, or only function's."""
+
+
+class SQLiteResultStore(ResultStore):
+    """
+    One SQLite file, safe to share between processes on a host (or on a shared
+    volume that supports file locks).  WAL mode lets readers proceed while
+    another process writes.
+    """
+
+    def __init__(self, path, max_bytes=RESULT_STORE_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        _private_dir(os.path.dirname(os.path.abspath(path)))
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, function TEXT, value BLOB, size INTEGER,"
+                " expires_at REAL, accessed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+
+    def _connect(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5)
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        with conn:
+            if expires_at is not None and expires_at <= now:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def put(self, key, function, data, ttl=None):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, function, data, len(data), expires_at, now),
+            )
+            self._trim(conn)
+
+    def _trim(self, conn):
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()
+        if total <= self.max_bytes:
+            return
+        conn.execute("DELETE FROM results WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        # Drop the least recently used entries until the store is under budget
+        excess = total - self.max_bytes
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed_at").fetchall():
+            if excess <= 0:
+                break
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            excess -= size
+
+    def clear(self, function=None):
+        conn = self._connect()
+        with conn:
+            if function is None:
+                conn.execute("DELETE FROM results")
+            else:
+                conn.execute("DELETE FROM results WHERE function = ?", (function,))
+
+
+def _private_dir(path):
+    """
+    Create path readable by this user only, or check an existing one is: a
+    store another user can write to could hand this process any payload.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.stat(path)
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"Result store directory {path} is not owned by this user")
+    if st.st_mode & 0o077:
+        os.chmod(path, 0o700)
+
+
+def open_result_store(url=RESULT_STORE):
+    """Return the ResultStore configured by url, or None when it is empty."""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteResultStore(url[len("sqlite:///"):])
+    if "://" in url:
+        raise ValueError(f"Unsupported RESULT_STORE: {url}")
+    return SQLiteResultStore(url)
+
+
+class _Parquet:
+    """A DataFrame or Series stored as parquet bytes inside an encoded value."""
+
+    def __init__(self, data, series_name=None, is_series=False):
+        self.data = data
+        self.series_name = series_name
+        self.is_series = is_series
+
+
+class _Scalar:
+    """A numpy scalar as its dtype name and Python value, so it decodes to the same type."""
+
+    def __init__(self, dtype, value):
+        self.dtype = dtype
+        self.value = value
+
+
+class _Array:
+    """An ndarray: np.save bytes (no pickles), or for object arrays its encoded items."""
+
+    def __init__(self, data=None, items=None, shape=None):
+        self.data = data
+        self.items = items
+        self.shape = shape
+
+
+class _Figure:
+    """A plotly figure as its JSON."""
+
+    def __init__(self, json):
+        self.json = json
+
+
+class UnsupportedValue(TypeError):
+    """A value encode cannot store as parquet, containers and plain scalars."""
+
+
+# The only classes an encoded value may name; anything else fails to decode
+_DECODABLE = {
+    (__name__, "_Parquet"): _Parquet,
+    (__name__, "_Scalar"): _Scalar,
+    (__name__, "_Array"): _Array,
+    (__name__, "_Figure"): _Figure,
+    ("datetime", "date"): dt.date,
+    ("datetime", "datetime"): dt.datetime,
+    ("datetime", "timedelta"): dt.timedelta,
+}
+
+
+class _Unpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        try:
+            return _DECODABLE[(module, name)]
+        except KeyError:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a stored result") from None
+
+
+def encode(value):
+    """
+    Serialize a cached value.  DataFrames and Series (also inside tuples, lists
+    and dicts) are written as parquet, ndarrays with np.save and plotly figures
+    as JSON; besides them only containers, numpy and plain scalars, strings and
+    dates are allowed.  Anything else, including frames parquet cannot hold
+    (e.g. mixed-type object columns), raises UnsupportedValue: it stays in the
+    in-process cache only.
+    """
+    return pickle.dumps(_to_parquet(value), pickle.HIGHEST_PROTOCOL)
+
+
+def decode(data):
+    """Inverse of encode; refuses payloads naming any class encode does not write."""
+    return _from_parquet(_Unpickler(io.BytesIO(data)).load())
+
+
+def _to_parquet(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        is_series = isinstance(value, pd.Series)
+        # Key columns are stored with the ids they use, not the dataset's whole dictionary
+        value = compact_keys(value)
+        df = value.to_frame(name="__value__") if is_series else value
+        buffer = io.BytesIO()
+        try:
+            df.to_parquet(buffer, engine="pyarrow", compression="zstd")
+        except (ValueError, TypeError, NotImplementedError) as e:
+            # pyarrow's ArrowInvalid/ArrowTypeError/ArrowNotImplementedError derive from these
+            raise UnsupportedValue(f"Cannot store {type(value).__name__} as parquet: {e}") from e
+        series_name = value.name if is_series else None
+        if series_name is not None and not isinstance(series_name, (str, int, float)):
+            raise UnsupportedValue(f"Cannot store a Series named {series_name!r}")
+        return _Parquet(buffer.getvalue(), series_name=series_name, is_series=is_series)
+    if isinstance(value, tuple):
+        return tuple(_to_parquet(v) for v in value)
+    if isinstance(value, list):
+        return [_to_parquet(v) for v in value]
+    if isinstance(value, dict):
+        return {_to_parquet(k): _to_parquet(v) for k, v in value.items()}
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return _Array(items=[_to_parquet(v) for v in value.ravel().tolist()], shape=value.shape)
+        buffer = io.BytesIO()
+        np.save(buffer, value, allow_pickle=False)
+        return _Array(data=buffer.getvalue())
+    if type(value).__module__.startswith("plotly.") and hasattr(value, "to_json"):
+        return _Figure(value.to_json())
+    if isinstance(value, (np.datetime64, np.timedelta64)):
+        return _Scalar(value.dtype.str, int(value.view(np.int64)))
+    if isinstance(value, np.generic) and not isinstance(value, (np.object_, np.void)):
+        return _Scalar(value.dtype.str, value.item())
+    if value is None or type(value) in (bool, int, float, str, bytes, dt.date, dt.datetime, dt.timedelta):
+        return value
+    raise UnsupportedValue(f"Cannot store a {type(value).__name__} in the result store")
+
+
+def _from_parquet(value):
+    if isinstance(value, _Parquet):
+        df = pd.read_parquet(io.BytesIO(value.data), engine="pyarrow")
+        if value.is_series:
+            return restore_keys(df["__value__"].rename(value.series_name))
+        return restore_keys(df)
+    if isinstance(value, tuple):
+        return tuple(_from_parquet(v) for v in value)
+    if isinstance(value, list):
+        return [_from_parquet(v) for v in value]
+    if isinstance(value, dict):
+        return {_from_parquet(k): _from_parquet(v) for k, v in value.items()}
+    if isinstance(value, _Array):
+        if value.data is not None:
+            return np.load(io.BytesIO(value.data), allow_pickle=False)
+        array = np.empty(len(value.items), dtype=object)
+        array[:] = [_from_parquet(v) for v in value.items]
+        return array.reshape(value.shape)
+    if isinstance(value, _Figure):
+        import plotly.io as pio
+        return pio.from_json(value.json)
+    if isinstance(value, _Scalar):
+        dtype = np.dtype(value.dtype)
+        if dtype.kind in "mM":
+            return np.int64(value.value).view(dtype)
+        return dtype.type(value.value)
+    return value
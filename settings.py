@@ -7,8 +7,9 @@ import pandas as pd
 import datetime as dt
 from google.cloud import secretmanager
 import json
-import asyncio
 import logging
+from single_flight import SingleFlight
+from bq_cache import BQ_CACHE_DIR, BigQueryCache
 
 default_daterange = [dt.datetime(2021, 1, 1).date(), dt.date.today()]
 
@@ -53,6 +54,46 @@ def get_gcp_credentials():
 
     return gcp_credentials, bq_client
 
+
+# Identical queries issued while one is already running wait for it instead of
+# starting a second BigQuery job
+_bq_flights = SingleFlight()
+
+
+@st.cache_resource(show_spinner=False)
+def get_bq_cache():
+    """On-disk query result cache (see bq_cache), or None when BQ_CACHE_DIR is empty."""
+    if not BQ_CACHE_DIR:
+        return None
+    return BigQueryCache(root=BQ_CACHE_DIR, logger=get_logger())
+
+
+def run_bq_query(sql, job_config=None):
+    """
+    Run sql on the shared BigQuery client and return the result as a DataFrame.
+    Results are reused from disk while the tables the query reads are unchanged.
+    """
+    def query():
+        _, bq_client = get_gcp_credentials()
+        bq_cache = get_bq_cache()
+        if bq_cache is not None:
+            return bq_cache.query(bq_client, sql, job_config=job_config)
+        return bq_client.query(sql, job_config=job_config).to_dataframe()
+
+    key = (sql, json.dumps(job_config.to_api_repr(), sort_keys=True, default=str) if job_config else None)
+    df = _bq_flights.do(key, query)
+    # Every waiter gets the same frame; give each caller its own
+    return df.copy(deep=not pd.options.mode.copy_on_write)
+
+
+def bq_flight_stats():
+    return dict(_bq_flights.stats)
+
+
+def bq_cache_stats():
+    bq_cache = get_bq_cache()
+    return dict(bq_cache.stats) if bq_cache is not None else None
+
 def initialize():  
     pd.options.mode.copy_on_write = True
     pd.set_option("display.max_columns", 20)            
@@ -65,23 +106,13 @@ def init_cr_app_version_list():
         st.session_state.cr_app_versions_list = cr_app_versions_list
 
 
-# Get the campaign data from BigQuery, roll it up per campaign
+# Campaign data is shared by every session (see campaigns.get_campaign_data); the
+# session only keeps a reference to it.  If it cannot be loaded the marketing
+# pages show no spend rather than failing.
 def init_campaign_data():
-# Call the combined asynchronous campaign data function
-    df_goog_all, df_fb_all = cache_marketing_data()
-
-    #Get all campaign data by segment_date
-    df_campaigns_all = pd.concat([df_goog_all, df_fb_all])
-    df_campaigns_all = campaigns.add_country_and_language(df_campaigns_all)
-    df_campaigns_all = df_campaigns_all.reset_index(drop=True)
-
-    if "df_campaigns_all" not in st.session_state:
-        st.session_state["df_campaigns_all"] = df_campaigns_all
-
-@st.cache_data(ttl="1d", show_spinner="Gathering Marketing Data")
-def cache_marketing_data():
-    # Execute the async function and return its result synchronously
-    return asyncio.run(campaigns.get_campaign_data())
-
-
-
+    try:
+        df_campaigns_all = campaigns.get_campaign_data()
+    except Exception:
+        get_logger().exception("Loading campaign data failed; showing no campaign spend")
+        df_campaigns_all = campaigns.empty_campaign_data()
+    st.session_state["df_campaigns_all"] = df_campaigns_all
@@ -0,0 +1,67 @@
+import threading
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the leader)
+    runs the function, callers arriving while it runs wait for it and get the
+    same result - or the same exception.  If the leader is interrupted by a
+    BaseException that is not an Exception (a Streamlit stop or rerun), the
+    followers are not: they call again and one of them leads.  Once the call finishes the key is
+    forgotten, so later calls run again (normally to find the value in a cache).
+
+    The value is shared, not copied; callers that may modify it must copy it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Call
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def do(self, key, fn):
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None and call.thread is not threading.current_thread():
+                    self.stats["followers"] += 1
+                    leader = False
+                else:
+                    # A call re-entering its own key on the leader's thread runs directly
+                    call = self._calls[key] = _Call()
+                    self.stats["leaders"] += 1
+                    leader = True
+
+            if leader:
+                return self._lead(key, call, fn)
+
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if call.finished:
+                return call.value
+            # The leader was interrupted (Streamlit stop/rerun, KeyboardInterrupt):
+            # that belongs to its session, so try again, one follower leading
+
+    def _lead(self, key, call, fn):
+        try:
+            call.value = fn()
+            call.finished = True
+        except Exception as e:
+            # Only errors are shared; other BaseExceptions are control flow of the leader's session
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.value
+
+
+class _Call:
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.finished = False
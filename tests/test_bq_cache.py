@@ -0,0 +1,66 @@
+import datetime
+import threading
+from types import SimpleNamespace
+
+import pandas as pd
+
+from bq_cache import BigQueryCache
+
+TABLE_SQL = "SELECT * FROM `project.dataset.table`"
+VIEW_SQL = "SELECT * FROM `project.dataset.view`"
+
+
+class _FakeClient:
+    """Answers query() with a small frame and get_table() with fixed metadata."""
+
+    def __init__(self):
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def query(self, sql, job_config=None):
+        with self._lock:
+            self.queries += 1
+        return SimpleNamespace(to_dataframe=lambda: pd.DataFrame({"x": [1, 2, 3]}))
+
+    def get_table(self, table):
+        table_type = "VIEW" if table.endswith(".view") else "TABLE"
+        return SimpleNamespace(table_type=table_type, modified=datetime.datetime(2025, 1, 1))
+
+
+def test_saved_result_is_read_back(tmp_path):
+    cache, client = BigQueryCache(root=str(tmp_path)), _FakeClient()
+
+    first = cache.query(client, TABLE_SQL)
+    second = cache.query(client, TABLE_SQL)
+
+    pd.testing.assert_frame_equal(first, second)
+    assert client.queries == 1
+    assert cache.stats == {"hits": 1, "misses": 1, "uncacheable": 0}
+
+
+def test_views_run_live(tmp_path):
+    cache, client = BigQueryCache(root=str(tmp_path)), _FakeClient()
+
+    cache.query(client, VIEW_SQL)
+    cache.query(client, VIEW_SQL)
+
+    assert client.queries == 2
+    assert cache.stats == {"hits": 0, "misses": 0, "uncacheable": 2}
+
+
+def test_concurrent_queries_are_all_counted(tmp_path):
+    cache, client = BigQueryCache(root=str(tmp_path)), _FakeClient()
+    cache.query(client, TABLE_SQL)
+
+    def run():
+        for _ in range(50):
+            cache.query(client, TABLE_SQL)
+            cache.query(client, VIEW_SQL)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.stats == {"hits": 400, "misses": 1, "uncacheable": 400}
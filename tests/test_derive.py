@@ -0,0 +1,183 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+# users imports the app's GCP and Streamlit component dependencies
+users = pytest.importorskip("users")
+
+
+def _raw_frames():
+    """Raw exports hitting each clean-up step: misspelled languages, string dates, users with several rows."""
+    cr_users = pd.DataFrame({
+        "cr_user_id": ["c1", "c1", "c2", "c3", "c3", "c4", "c5"],
+        "user_pseudo_id": ["p1", "p1b", "p2", "p3", "p3b", "p4", "p5"],
+        "app": ["CR", "CR", "FTM-standalone", "CR", "CR", "CR", "CR"],
+        "app_language": ["ukranian", "english", "farsitest", "hindi", "hindi", "malgache", "english"],
+        "country": ["Ukraine", "India", "Iran", "India", "Kenya", "Madagascar", "Kenya"],
+        "first_open": ["2024-01-05", "2024-01-03", "2024-02-01", "2024-03-01", "2024-03-02", "bad date", "2024-01-01"],
+        "last_event_date": ["2024-02-01"] * 7,
+        "furthest_event": ["level_completed", "tapped_start", None, "selected_level", "puzzle_completed", "app_open", "level_completed"],
+        "max_user_level": [3.0, 0.0, np.nan, 0.0, 0.0, 1.0, 30.0],
+        "gpc": [10.0, 0.0, np.nan, 0.0, 0.0, 50.0, 95.0],
+        "active_span": [5, -2, -4, -1, 3, 7, 12],
+    })
+    app_launch = pd.DataFrame({
+        "cr_user_id": ["c1", "c1", "c3", "c4", "c5", "c6"],
+        "user_pseudo_id": ["p1", "p1", "p3", "p4", "p5", "p6"],
+        "app_language": ["ukranian", "english", "english", "malgache", "english", "arabictest"],
+        "country": ["Ukraine", "India", "India", "Madagascar", "Kenya", "Egypt"],
+        "first_open": ["2024-01-04", "2024-01-02", "2024-02-20", "2024-04-01", "2023-12-31", "2024-05-01"],
+    })
+    unity = pd.DataFrame({
+        "user_pseudo_id": ["u1", "u1", "u2", "u3", "u3"],
+        "app": "Unity",
+        "app_language": ["english", "english", "hindi", "swahili", "swahili"],
+        "country": ["India", "India", "India", "Kenya", "Kenya"],
+        "first_open": ["2024-01-01", "2024-01-02", "2024-01-03", "2024-01-04", "2024-01-05"],
+        "la_date": ["2024-01-02", None, "2024-01-04", "2024-01-05", "2024-01-06"],
+        "last_event_date": ["2024-02-01"] * 5,
+        "max_user_level": [2.0, 7.0, 1.0, 4.0, 4.0],
+    })
+    book_cohorts = pd.DataFrame({
+        "cr_user_id": ["c1", "c5"],
+        "app_language": ["english", "english"],
+        "first_access_date": ["2024-01-10", None],
+        "last_access_date": ["2024-01-20", "2024-02-01"],
+    })
+    cohorts = pd.DataFrame({"cr_user_id": ["c1", "c3", "c5"], "cohort_name": ["Alpha", "Alpha", "beta"]})
+    book_summary = pd.DataFrame({
+        "cr_user_id": ["c1", "c1", "c5"],
+        "book_id": ["b1", "b2", "b1"],
+        "first_access_date": ["2024-01-10", "2024-01-11", None],
+        "last_access_date": ["2024-01-20", "2024-01-11", "2024-02-01"],
+    })
+    return {
+        "df_cr_users": cr_users,
+        "df_unity_users": unity,
+        "df_cr_app_launch": app_launch,
+        "df_cr_book_user_cohorts": book_cohorts,
+        "df_cr_cohorts": cohorts,
+        "df_cr_book_user_book_summary": book_summary,
+    }
+
+
+# The clean-up as init_user_data ran it in the page before derive_user_frames existed
+
+
+def _previous_fix_date_columns(df, columns):
+    for col in columns:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    return df
+
+
+def _previous_clean_language_column(df):
+    return df["app_language"].replace({
+        "ukranian": "ukrainian",
+        "malgache": "malagasy",
+        "arabictest": "arabic",
+        "farsitest": "farsi"
+    })
+
+
+def _previous_single_language(df_app_launch, df_cr_users):
+    duplicate_user_ids = df_app_launch[df_app_launch.duplicated(subset="user_pseudo_id", keep=False)]
+    df_app_launch = df_app_launch[~df_app_launch["cr_user_id"].isin(duplicate_user_ids["cr_user_id"])]
+    unique_duplicate_ids = duplicate_user_ids["cr_user_id"].unique().tolist()
+
+    event_order = ["download_completed", "tapped_start", "selected_level", "puzzle_completed", "level_completed"]
+    event_rank = {event: rank for rank, event in enumerate(event_order)}
+    df_cr_users["furthest_event"] = df_cr_users["furthest_event"].fillna("unknown")
+    df_cr_users["event_rank"] = df_cr_users["furthest_event"].map(event_rank)
+    df_cr_users["is_level_completed"] = df_cr_users["furthest_event"] == "level_completed"
+    df_cr_users = df_cr_users.sort_values(["cr_user_id", "is_level_completed", "max_user_level", "event_rank"],
+                                          ascending=[True, False, False, False])
+    df_cr_users = df_cr_users.drop_duplicates(subset=["cr_user_id"], keep="first")
+
+    users_to_update = df_cr_users[["cr_user_id", "app_language", "country"]].merge(
+        df_app_launch[["cr_user_id", "app_language", "country"]],
+        on="cr_user_id",
+        how="left",
+        suffixes=("_cr", "_app")
+    )
+    language_mismatch = users_to_update[users_to_update["app_language_cr"] != users_to_update["app_language_app"]]
+    if not language_mismatch.empty:
+        df_app_launch.loc[df_app_launch["cr_user_id"].isin(language_mismatch["cr_user_id"]), "app_language"] = \
+            df_app_launch["cr_user_id"].map(df_cr_users.set_index("cr_user_id")["app_language"])
+
+    missing_users = set(unique_duplicate_ids) - set(df_cr_users["cr_user_id"])
+    users_to_add_back = duplicate_user_ids.merge(
+        df_cr_users[["cr_user_id", "app_language", "country"]],
+        on=["cr_user_id", "app_language", "country"],
+        how="left"
+    )
+    users_to_add_back = users_to_add_back.dropna(subset=["app_language"])
+    fallback_users = duplicate_user_ids[duplicate_user_ids["cr_user_id"].isin(missing_users)]
+    fallback_users = fallback_users.drop_duplicates(subset="cr_user_id", keep="first")
+    users_to_add_back = pd.concat([users_to_add_back, fallback_users])
+    users_to_add_back = users_to_add_back.drop_duplicates(subset="cr_user_id", keep="first")
+    df_app_launch = pd.concat([df_app_launch, users_to_add_back])
+    df_app_launch = df_app_launch.drop_duplicates(subset="cr_user_id", keep="first")
+
+    mask_cr = df_cr_users["app"] == "CR"
+    df_cr_users.loc[mask_cr, "first_open"] = df_cr_users.loc[mask_cr, "cr_user_id"].map(
+        df_app_launch.set_index("cr_user_id")["first_open"]
+    )
+    return df_app_launch, df_cr_users
+
+
+def _previous_clean_up(raw):
+    df_cr_users = _previous_fix_date_columns(raw["df_cr_users"], ["first_open", "last_event_date"])
+    df_unity_users = _previous_fix_date_columns(raw["df_unity_users"], ["first_open", "la_date", "last_event_date"])
+    df_cr_app_launch = _previous_fix_date_columns(raw["df_cr_app_launch"], ["first_open"])
+    dates = ["first_access_date", "last_access_date"]
+    df_cr_book_user_cohorts = _previous_fix_date_columns(raw["df_cr_book_user_cohorts"], dates)
+    df_cr_book_user_book_summary = _previous_fix_date_columns(raw["df_cr_book_user_book_summary"], dates)
+
+    max_level_indices = df_unity_users.groupby("user_pseudo_id")["max_user_level"].idxmax()
+    df_unity_users = df_unity_users.loc[max_level_indices].reset_index(drop=True)
+
+    df_cr_app_launch["app_language"] = _previous_clean_language_column(df_cr_app_launch)
+    df_cr_users["app_language"] = _previous_clean_language_column(df_cr_users)
+    df_cr_app_launch, df_cr_users = _previous_single_language(df_cr_app_launch, df_cr_users)
+    df_cr_users["active_span"] = df_cr_users["active_span"].clip(lower=0)
+
+    return {
+        "df_cr_users": df_cr_users,
+        "df_unity_users": df_unity_users,
+        "df_cr_app_launch": df_cr_app_launch,
+        "df_cr_book_user_cohorts": df_cr_book_user_cohorts,
+        "df_cr_cohorts": raw["df_cr_cohorts"],
+        "df_cr_book_user_book_summary": df_cr_book_user_book_summary,
+    }
+
+
+def _comparable(df, columns):
+    """df's columns as plain values (categoricals decoded, nulls as None), in a row order independent of sorting."""
+    df = df[columns].copy()
+    for column in columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype) or df[column].dtype == object:
+            df[column] = df[column].astype(object).where(df[column].notna(), None)
+    return df.sort_values(columns, key=lambda s: s.astype(str), ignore_index=True)
+
+
+def test_derived_frames_match_the_previous_clean_up():
+    derived = users.derive_user_frames(_raw_frames())
+    previous = _previous_clean_up(_raw_frames())
+
+    assert derived.keys() == previous.keys()
+    for name, expected in previous.items():
+        columns = [column for column in expected.columns if column in derived[name].columns]
+        assert len(derived[name]) == len(expected), name
+        pd.testing.assert_frame_equal(
+            _comparable(derived[name], columns), _comparable(expected, columns), check_dtype=False, obj=name
+        )
+
+
+def test_derived_user_frames_are_sorted_by_first_open():
+    derived = users.derive_user_frames(_raw_frames())
+
+    for name in users.INDEXED_USER_FRAMES:
+        first_open = derived[name]["first_open"]
+        assert first_open.dropna().is_monotonic_increasing, name
+        assert first_open.isna().sum() == 0 or first_open.iloc[-first_open.isna().sum():].isna().all(), name
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from funnel_engine import FUNNEL_EVENTS, add_funnel_columns, funnel_counts, funnel_counts_by_group
+
+STEPS = ["LR", "DC", "TS", "SL", "PC", "LA", "RA", "GC"]
+
+
+def _reference_count(user_df, stat):
+    """get_metric_user_count as it counted before funnel_engine: string comparisons per step."""
+    if stat == "LA":
+        return (user_df["max_user_level"] >= 1).sum()
+    if stat == "RA":
+        return (user_df["max_user_level"] >= 25).sum()
+    if stat == "GC":
+        return ((user_df["max_user_level"] >= 1) & (user_df["gpc"] >= 90)).sum()
+    if stat == "LR":
+        return len(user_df)
+    furthest = user_df["furthest_event"]
+    reached = {"DC": FUNNEL_EVENTS, "TS": FUNNEL_EVENTS[1:], "SL": FUNNEL_EVENTS[2:], "PC": FUNNEL_EVENTS[3:]}
+    return sum((furthest == event).sum() for event in reached[stat])
+
+
+def _users(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    # Null and unknown events rank below the funnel; levels and gpc are sometimes null
+    events = FUNNEL_EVENTS + [None, "app_open", "Level_Completed"]
+    return pd.DataFrame({
+        "furthest_event": pd.Series(rng.choice(np.array(events, dtype=object), n), dtype=object),
+        "max_user_level": rng.choice([np.nan, 0, 1, 2, 24, 25, 60], n),
+        "gpc": rng.choice([np.nan, 0.0, 89.999, 90.0, 100.0], n),
+        "country": rng.choice(np.array(["India", "Kenya", "Brazil", None], dtype=object), n),
+    })
+
+
+@pytest.fixture(params=["object", "category"])
+def users(request):
+    df = _users()
+    if request.param == "category":
+        # Categories include an event no row has and one outside the funnel
+        df["furthest_event"] = df["furthest_event"].astype(
+            pd.CategoricalDtype(sorted({e for e in df["furthest_event"].dropna()} | {"unused"}))
+        )
+        df["country"] = df["country"].astype("category")
+    return df
+
+
+@pytest.mark.parametrize("precomputed", [False, True])
+def test_counts_match_string_comparisons(users, precomputed):
+    if precomputed:
+        add_funnel_columns({"users": users})
+
+    counts = funnel_counts(users, STEPS)
+
+    assert {step: int(counts[step]) for step in STEPS} == {step: int(_reference_count(users, step)) for step in STEPS}
+
+
+def test_counts_of_a_filtered_subset(users):
+    add_funnel_columns({"users": users})
+    subset = users[users["max_user_level"] >= 1]
+
+    counts = funnel_counts(subset, STEPS)
+
+    assert {step: int(counts[step]) for step in STEPS} == {step: int(_reference_count(subset, step)) for step in STEPS}
+
+
+def test_grouped_counts_match_per_group_counts(users):
+    groups = ["Brazil", "India", "Kenya", "Nowhere"]
+
+    counts = funnel_counts_by_group(users, "country", groups, STEPS)
+
+    for group in groups:
+        rows = users[users["country"] == group]
+        expected = {step: int(_reference_count(rows, step)) for step in STEPS}
+        assert counts.loc[group].astype(int).to_dict() == expected
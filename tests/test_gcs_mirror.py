@@ -0,0 +1,78 @@
+import os
+
+import fsspec
+import pytest
+
+from gcs_mirror import ParquetMirror
+
+DATASET = "user_data_parquet_cache/cr_user_progress"
+RUN_DATE = "2025-01-01"
+
+
+@pytest.fixture
+def remote_fs():
+    fs = fsspec.filesystem("memory")
+    fs.store.clear()
+    fs.pseudo_dirs.clear()
+    fs.pseudo_dirs.append("")
+    return fs
+
+
+def _publish(fs, content):
+    fs.pipe(f"/{DATASET}/run_date={RUN_DATE}/part-0.parquet", content)
+    return fs.glob(f"/{DATASET}/run_date={RUN_DATE}/*.parquet", detail=True)
+
+
+def _versions(root):
+    return sorted(entry for entry in os.listdir(os.path.join(root, DATASET)) if entry.startswith("v-"))
+
+
+def test_fetch_mirrors_and_reuses_objects(remote_fs, tmp_path):
+    mirror = ParquetMirror(remote_fs, root=str(tmp_path))
+    objects = _publish(remote_fs, b"first")
+
+    (path,) = mirror.fetch(objects)
+    assert open(path, "rb").read() == b"first"
+    assert mirror.fetch(objects) == [path]
+    assert len(_versions(tmp_path)) == 1
+
+
+def test_previous_version_is_kept_for_readers(remote_fs, tmp_path):
+    mirror = ParquetMirror(remote_fs, root=str(tmp_path))
+    (first,) = mirror.fetch(_publish(remote_fs, b"first"))
+    (second,) = mirror.fetch(_publish(remote_fs, b"second!"))
+    (third,) = mirror.fetch(_publish(remote_fs, b"third!!!"))
+
+    assert not os.path.exists(first)
+    assert open(second, "rb").read() == b"second!"
+    assert open(third, "rb").read() == b"third!!!"
+
+
+def _sees_stale_manifest(mirror, manifest):
+    """Make mirror's fetch start from manifest, as if it read it before another process promoted."""
+    read_manifest = mirror.read_manifest
+    reads = []
+
+    def read_once_stale(dataset_dir):
+        reads.append(dataset_dir)
+        return manifest if len(reads) == 1 else read_manifest(dataset_dir)
+
+    mirror.read_manifest = read_once_stale
+
+
+def test_concurrent_syncs_keep_each_others_version(remote_fs, tmp_path):
+    root = str(tmp_path)
+    ParquetMirror(remote_fs, root=root).fetch(_publish(remote_fs, b"first"))
+    stale = ParquetMirror(remote_fs, root=root).read_manifest(os.path.join(root, DATASET))
+    objects = _publish(remote_fs, b"second!")
+
+    # Both processes started from the same manifest; the second to promote must
+    # not remove the version the first one just promoted and returned
+    paths = []
+    for _ in range(2):
+        mirror = ParquetMirror(remote_fs, root=root)
+        _sees_stale_manifest(mirror, stale)
+        paths += mirror.fetch(objects)
+
+    assert paths[0] != paths[1]
+    assert all(open(path, "rb").read() == b"second!" for path in paths)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import result_cache
+from cache_keys import frame_token, tag_frame
+from result_cache import ResultCache, share
+
+
+def _value(nbytes):
+    """A cached value whose measured size is exactly nbytes."""
+    return np.zeros(nbytes, dtype=np.uint8)
+
+
+def _keys(cache):
+    return [key for (_, key) in cache._entries]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = ResultCache(max_bytes=300)
+    for key in "abc":
+        cache.put(f"f_{key}", key, _value(100), quota=300)
+
+    assert cache.get("f_a", "a")[0]
+    cache.put("f_d", "d", _value(100), quota=300)
+
+    assert _keys(cache) == ["c", "a", "d"]
+    assert cache.usage()["bytes"] == 300
+    assert cache.usage()["functions"]["f_b"]["evictions"] == 1
+
+
+def test_function_quota_evicts_its_own_entries_before_others():
+    cache = ResultCache(max_bytes=1000)
+    cache.put("other", "x", _value(100))
+    for key in "abc":
+        cache.put("metrics.f", key, _value(100))  # default quota: 25% of the budget
+
+    assert _keys(cache) == ["x", "b", "c"]
+    stats = cache.usage()["functions"]["metrics.f"]
+    assert (stats["entries"], stats["bytes"], stats["quota"], stats["evictions"]) == (2, 200, 250, 1)
+
+
+def test_values_larger_than_the_quota_are_not_cached():
+    cache = ResultCache(max_bytes=1000)
+    cache.put("metrics.f", "big", _value(251))
+
+    assert cache.get("metrics.f", "big") == (False, None)
+    assert cache.usage()["functions"]["metrics.f"]["too_large"] == 1
+    assert cache.usage()["bytes"] == 0
+
+
+def test_expired_entries_are_misses(clock):
+    cache = ResultCache(max_bytes=1000)
+    cache.put("metrics.f", "a", _value(10), ttl=60)
+    cache.put("metrics.f", "b", _value(10))
+
+    clock[0] += 61
+    assert cache.get("metrics.f", "a") == (False, None)
+    assert cache.get("metrics.f", "b")[0]
+    assert cache.usage()["entries"] == 1
+
+
+def test_replacing_an_entry_keeps_sizes_consistent():
+    cache = ResultCache(max_bytes=1000)
+    cache.put("metrics.f", "a", _value(100))
+    cache.put("metrics.f", "a", _value(50))
+
+    assert cache.usage()["bytes"] == 50
+    assert cache.usage()["functions"]["metrics.f"]["entries"] == 1
+    cache.clear("metrics.f")
+    assert cache.usage()["bytes"] == 0
+
+
+def test_share_copies_on_write():
+    with pd.option_context("mode.copy_on_write", True):
+        cached = tag_frame(pd.DataFrame({"LR": [1, 2]}), ("run", "df"))
+        value = {"frame": cached, "steps": ["LR"]}
+
+        shared = share(value)
+        shared["frame"].loc[0, "LR"] = 100
+        shared["steps"].append("DC")
+
+        assert cached["LR"].tolist() == [1, 2]
+        assert value["steps"] == ["LR"]
+        assert frame_token(shared["frame"]) == ("run", "df")
@@ -0,0 +1,99 @@
+import datetime as dt
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from result_store import ResultStore, SQLiteResultStore, UnsupportedValue, decode, encode
+
+
+def _round_trip(value):
+    return decode(encode(value))
+
+
+def test_frames_round_trip():
+    df = pd.DataFrame({
+        "app_language": pd.Categorical(["english", "hindi", None]),
+        "first_open": pd.to_datetime(["2024-01-01", "2024-02-01", None]),
+        "max_user_level": [1.0, np.nan, 25.0],
+        "la_flag": np.array([1, 0, 1], dtype=np.int8),
+        "country": ["India", None, "Kenya"],
+    })
+
+    pd.testing.assert_frame_equal(_round_trip(df), df)
+    pd.testing.assert_series_equal(_round_trip(df["max_user_level"]), df["max_user_level"])
+    pd.testing.assert_series_equal(_round_trip(df["la_flag"].rename(None)), df["la_flag"].rename(None))
+
+
+@pytest.mark.parametrize("value", [
+    np.int64(7),
+    np.float32(0.5),
+    np.bool_(True),
+    np.datetime64("2024-01-02T03:04:05", "ns"),
+    np.timedelta64(3, "D"),
+    7,
+    0.25,
+    "LA",
+    None,
+    dt.date(2024, 1, 2),
+    dt.datetime(2024, 1, 2, 3, 4),
+    dt.timedelta(days=1),
+])
+def test_scalars_keep_value_and_type(value):
+    decoded = _round_trip(value)
+
+    assert type(decoded) is type(value)
+    assert decoded == value
+
+
+def test_containers_and_arrays_round_trip():
+    value = {"counts": (np.int64(3), [1, 2.5]), "levels": np.arange(4, dtype=np.int32), "ids": np.array(["a", None], dtype=object)}
+
+    decoded = _round_trip(value)
+
+    assert decoded["counts"] == value["counts"]
+    np.testing.assert_array_equal(decoded["levels"], value["levels"])
+    assert decoded["levels"].dtype == np.int32
+    assert decoded["ids"].tolist() == ["a", None]
+
+
+def test_other_objects_are_not_stored():
+    class Result:
+        pass
+
+    with pytest.raises(UnsupportedValue):
+        encode(Result())
+    with pytest.raises(UnsupportedValue):
+        encode({"frame": pd.DataFrame({"mixed": [1, "x"]})})
+
+
+class _Exploit:
+    def __reduce__(self):
+        return (os.system, ("echo stored result ran code",))
+
+
+def test_decode_refuses_disallowed_globals():
+    with pytest.raises(pickle.UnpicklingError, match="not allowed"):
+        decode(pickle.dumps(_Exploit()))
+    with pytest.raises(pickle.UnpicklingError, match="not allowed"):
+        decode(pickle.dumps(pd.DataFrame({"a": [1]})))
+
+
+def test_result_store_is_abstract():
+    with pytest.raises(TypeError):
+        ResultStore()
+
+
+def test_sqlite_store(tmp_path):
+    store = SQLiteResultStore(str(tmp_path / "store" / "results.sqlite"))
+    store.put("a", "metrics.f", b"one")
+    store.put("b", "metrics.g", b"two", ttl=-1)
+
+    assert store.get("a") == b"one"
+    assert store.get("b") is None  # expired
+    assert (tmp_path / "store").stat().st_mode & 0o077 == 0
+
+    store.clear("metrics.f")
+    assert store.get("a") is None
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+class _Interrupt(BaseException):
+    """Stands in for Streamlit's StopException / RerunException."""
+
+
+def _wait_for_follower(flights):
+    while flights.stats["followers"] == 0:
+        threading.Event().wait(0.001)
+
+
+def test_follower_computes_after_leader_is_interrupted():
+    flights = SingleFlight()
+    leader_started = threading.Event()
+    results = {}
+
+    def interrupted():
+        leader_started.set()
+        _wait_for_follower(flights)
+        raise _Interrupt()
+
+    def leader():
+        with pytest.raises(_Interrupt):
+            flights.do("key", interrupted)
+
+    def follower():
+        leader_started.wait(5)
+        results["value"] = flights.do("key", lambda: 42)
+
+    threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # The follower was not interrupted: it called again, led and computed the value
+    assert results["value"] == 42
+    assert flights.stats == {"leaders": 2, "followers": 1}
+
+
+def test_followers_share_the_leaders_error():
+    flights = SingleFlight()
+    leader_started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        leader_started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    def call(fn):
+        try:
+            flights.do("key", fn)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call, args=(failing,))
+    leader.start()
+    leader_started.wait(5)
+    follower = threading.Thread(target=call, args=(lambda: 1,))
+    follower.start()
+    _wait_for_follower(flights)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(errors) == 2 and errors[0] is errors[1]
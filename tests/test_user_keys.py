@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+from result_cache import sizeof
+from result_store import decode, encode
+from user_keys import encode_user_keys, is_shared_dictionary, shares_keys
+
+N_USERS = 200_000
+
+
+def _dataset():
+    """A user frame whose cr_user_id is encoded over a large shared dictionary."""
+    users = pd.DataFrame({"cr_user_id": [f"u{i:07d}" for i in range(N_USERS)], "level": np.arange(N_USERS)})
+    encode_user_keys({"df_cr_users": users})
+    return users
+
+
+def test_small_result_is_not_charged_for_the_dictionary():
+    users = _dataset()
+    result = users.take([5, 10, 15])
+
+    assert is_shared_dictionary(result["cr_user_id"].dtype)
+    assert sizeof(result) < 1_000
+    # The dataset frame itself still counts its dictionary once
+    assert sizeof(users) > N_USERS * 8
+
+
+def test_stored_result_drops_and_restores_the_dictionary():
+    users = _dataset()
+    result = users.take([5, 10, 15])
+
+    data = encode(result)
+    assert len(data) < 10_000
+
+    restored = decode(data)
+    pd.testing.assert_frame_equal(restored, result)
+    assert shares_keys(restored["cr_user_id"], users["cr_user_id"])
+
+    series = decode(encode(result["cr_user_id"]))
+    pd.testing.assert_series_equal(series, result["cr_user_id"])
+    assert shares_keys(series, users["cr_user_id"])
+
+
+def test_ids_outside_the_dictionary_keep_their_own_categories():
+    users = _dataset()
+    other = pd.DataFrame({"cr_user_id": pd.Categorical(["u0000001", "not-a-user"])})
+
+    restored = decode(encode(other))
+
+    pd.testing.assert_frame_equal(restored, other)
+    assert not shares_keys(restored["cr_user_id"], users["cr_user_id"])
@@ -9,35 +9,51 @@ from millify import prettify
 import numpy as np
 from ui_widgets import derive_ftm_outcome
 from colors import CHART_METRIC_COLORS,TILE_METRIC_COLORS
+from cache_keys import cache_frames
+from result_cache import cache_result
+from filtered_cohort import FilterSpec, FilteredCohort
 
 
 default_daterange = [dt.datetime(2021, 1, 1).date(), dt.date.today()]
 
-@st.cache_data(ttl="1d", show_spinner=False)
-def LR_LA_line_chart_over_time(
-    user_cohort_df,option="LR",  display_category="Country", aggregate=True
-):
+@cache_result(ttl="1d", show_spinner=False)
+def get_learners_reached_over_time(user_cohort_df, display_category="Country", aggregate=True):
+    """Daily LR counts (cumulative when aggregate) with a 14-day rolling mean, plotted by LR_LA_line_chart_over_time."""
     option = "LR"
     groupby = "LR Date"
-    title = "Daily Learners Reached"
-    user_cohort_df.rename({"first_open": "LR Date"}, axis=1, inplace=True)
+    user_cohort_df = user_cohort_df.rename({"first_open": "LR Date"}, axis=1)
 
     # Group by date and display_type, then count the users
     if display_category == "Country":
         display_group = "country"
     elif display_category == "Language":
         display_group = "app_language"
-        
-    color = display_group
 
     if aggregate:
         grouped_df = user_cohort_df.groupby(groupby).size().reset_index(name=option)
         grouped_df[option] = grouped_df[option].cumsum()
         grouped_df["7 Day Rolling Mean"] = grouped_df[option].rolling(14).mean()
-        color = None
     else:
-        grouped_df = user_cohort_df.groupby([groupby, display_group]).size().reset_index(name=option)
+        grouped_df = user_cohort_df.groupby([groupby, display_group], observed=True).size().reset_index(name=option)
         grouped_df["7 Day Rolling Mean"] = grouped_df[option].rolling(14).mean()
+    return grouped_df
+
+
+@cache_frames(ttl="1d", show_spinner=False)
+def LR_LA_line_chart_over_time(
+    user_cohort_df,option="LR",  display_category="Country", aggregate=True
+):
+    option = "LR"
+    groupby = "LR Date"
+    title = "Daily Learners Reached"
+
+    grouped_df = get_learners_reached_over_time(user_cohort_df, display_category=display_category, aggregate=aggregate)
+    if aggregate:
+        color = None
+    elif display_category == "Country":
+        color = "country"
+    else:
+        color = "app_language"
 
     # Plotly line graph
     fig = px.line(
@@ -54,7 +70,7 @@ def LR_LA_line_chart_over_time(
     return grouped_df
 
 
-@st.cache_data(ttl="1d", show_spinner=True)
+@cache_frames(ttl="1d", show_spinner=True)
 def lrc_scatter_chart(option, display_category, df_campaigns, daterange, session_df, languages, countries_list):
     """
     option: "LRC" or "LAC"
@@ -92,7 +108,7 @@ def lrc_scatter_chart(option, display_category, df_campaigns, daterange, session
         LA = metrics.get_metric_user_count(user_df=cohort_df, stat="LA")
         group_counts.append({"group": group, "LR": LR, "LA": LA})
 
-    df_counts = pd.DataFrame(group_counts)
+    df_counts = pd.DataFrame(group_counts, columns=["group", "LR", "LA"])
     df_counts.rename(columns={"group": group_col}, inplace=True)
 
     # Sum cost by group
@@ -136,7 +152,7 @@ def lrc_scatter_chart(option, display_category, df_campaigns, daterange, session
     return scatter_df
 
 
-@st.cache_data(ttl="1d", show_spinner=False)
+@cache_frames(ttl="1d", show_spinner=False)
 def spend_by_country_map(df_campaigns,source):
 
     if source == 'Both':
@@ -267,7 +283,13 @@ def levels_reached_chart(
     return fig
 
 
-def _build_level_trace(user_df, label, max_plot_level):
+@cache_result(ttl="1d", show_spinner=False)
+def get_level_survival(user_df, max_plot_level=80):
+    """
+    Percent of users (max_user_level >= 1) reaching at least each level up to
+    max_plot_level, with the change from the previous level; None if there are
+    no such users.
+    """
     filtered = user_df.loc[
         user_df["max_user_level"].notnull()
         & (user_df["max_user_level"] >= 1)
@@ -300,6 +322,13 @@ def _build_level_trace(user_df, label, max_plot_level):
         return None
 
     df["percent_drop"] = df["percent_reached"].diff().fillna(0.0)
+    return df
+
+
+def _build_level_trace(user_df, label, max_plot_level):
+    df = get_level_survival(user_df, max_plot_level=max_plot_level)
+    if df is None:
+        return None
 
     return go.Scatter(
         x=df["max_user_level"],
@@ -316,12 +345,17 @@ def _build_level_trace(user_df, label, max_plot_level):
         ),
     )
 def create_engagement_funnel(
-    user_df,
+    user_df=None,
     key_prefix="",
     funnel_size="medium",
     cr_df_LR=None,
     app=None,
+    cohort=None,
 ):
+    """
+    Funnel chart of cohort (a FilteredCohort), or of the already-filtered
+    user_df with cr_df_LR as the LR rows.
+    """
 
     funnel_variants = {
         "compact": {
@@ -356,18 +390,10 @@ def create_engagement_funnel(
     else:
         user_key = "cr_user_id"
 
-    funnel_step_counts = []
-    for stat in stats:
-        if stat == "LR":
-            if cr_df_LR is not None and user_key in cr_df_LR.columns:
-                count = cr_df_LR[user_key].nunique()
-            else:
-            # Cohort mode or no LR data — total users in filtered set is the LR count
-                count = user_df[user_key].nunique()
-        else:
-            count = metrics.get_metric_user_count(user_df, stat=stat)
-            
-        funnel_step_counts.append(count)
+    if cohort is None:
+        cohort = FilteredCohort(FilterSpec(), user_df, cr_df_LR)
+    # Cohort mode or no LR data — total users in filtered set is the LR count
+    funnel_step_counts = cohort.funnel_counts(stats, user_key)
 
     # --- Percentages ---
     percent_of_previous = [None]
@@ -404,7 +430,7 @@ def create_engagement_funnel(
     st.plotly_chart(fig, use_container_width=True, key=f"{key_prefix}-6")
 
 
-@st.cache_data(ttl="1d", show_spinner="Computing chart")    
+@cache_frames(ttl="1d", show_spinner="Computing chart")    
 def lr_lrc_bar_chart(df_totals_per_month):
 
     # Create bar chart for Total Learners Reached
@@ -462,7 +488,7 @@ def lr_lrc_bar_chart(df_totals_per_month):
     # Show the figure
     st.plotly_chart(fig, use_container_width=True)
 
-@st.cache_data(ttl="1d", show_spinner="Computing chart")    
+@cache_frames(ttl="1d", show_spinner="Computing chart")    
 def engagement_over_time_chart(df_list_with_labels, metric="Avg Total Time (minutes)"):
     all_data = []
 
@@ -528,8 +554,9 @@ def days_to_ra_chart(df_ra,by_months):
 
     df_ra['months_to_ra'] = df_ra['days_to_ra'] / 30.44
 
-    top_langs = df_ra['app_language'].value_counts().nlargest(20).index.tolist()
-    df_ra['lang_grouped'] = df_ra['app_language'].where(df_ra['app_language'].isin(top_langs), 'Other')
+    app_language = df_ra['app_language'].astype(object)  # 'Other' is not one of the categories
+    top_langs = app_language.value_counts().nlargest(20).index.tolist()
+    df_ra['lang_grouped'] = app_language.where(app_language.isin(top_langs), 'Other')
 
 
 
@@ -640,7 +667,7 @@ def avg_days_to_ra_by_dim_chart(df_ra,app=["CR"]):
         index_col = "user_pseudo_id"
 
     stats = (
-        df_ra.groupby(group_col)
+        df_ra.groupby(group_col, observed=True)
         .agg(
             avg_days_to_ra=('days_to_ra', 'mean'),
             avg_months_to_ra=('days_to_ra', lambda x: x.mean() / 30.44),
@@ -729,7 +756,7 @@ def show_dual_metric_table(title, home_metrics):
     
 
 
-@st.cache_data(ttl="1d", show_spinner="Calculating")
+@cache_frames(ttl="1d", show_spinner="Calculating")
 def funnel_chart(
     cohort_df,
     cr_df_LR=None,
@@ -880,7 +907,7 @@ def funnel_chart(
     st.plotly_chart(fig, use_container_width=True)
     return df
 
-@st.cache_data(ttl="1d", show_spinner="Calculating")
+@cache_result(ttl="1d", show_spinner="Calculating")
 def get_sorted_funnel_df(
     cohort_df,
     cr_df_LR=None,
@@ -918,7 +945,7 @@ def get_sorted_funnel_df(
 
     return df, funnel_steps
 
-@st.cache_data(ttl="1d", show_spinner="Calculating")
+@cache_frames(ttl="1d", show_spinner="Calculating")
 def funnel_chart(
     cohort_df,
     cr_df_LR=None,
@@ -1313,7 +1340,7 @@ def show_dual_metric_tiles(title, home_metrics, colors=None, size="small", forma
     )
 
 
-@st.cache_data(show_spinner=False)
+@cache_result(show_spinner=False)
 def build_survival_curve_by_tier(
     df_ftm_base: pd.DataFrame,
     max_level: int = 40,
@@ -0,0 +1,228 @@
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# Row-id index over the shared user frames, built once per dataset version when it
+# is loaded.  For every value of the filter columns (language, country, app) and
+# every cohort in df_cr_cohorts it keeps the sorted row positions holding it, so
+# apply_user_filters selects rows by combining a few position arrays instead of
+# copying the frame and running isin over whole columns.  Rows are only
+# materialized (DataFrame.take) once all filters are applied.
+#
+# The user frames are stored sorted by first_open (NaT last, see
+# users.sort_by_first_open), so the index also keeps first_open as int64
+# nanoseconds and a date range becomes two searchsorted bounds: a contiguous
+# slice of the frame, or of any sorted row positions.
+#
+# Cohort membership comes from df_cr_cohorts: its CohortIndex holds each cohort's
+# sorted cr_user_ids, and every user frame's RowIndex its members' row positions,
+# so neither the cohort filters nor the cohort pages query BigQuery or scan
+# df_cr_cohorts.
+#
+# Like cache tokens, an index belongs to one frame object and is dropped with it.
+
+INDEXED_COLUMNS = ["app_language", "language", "country", "app"]
+
+_indexes = {}  # id(df) -> (weakref to df, RowIndex)
+_cohort_indexes = {}  # id(df_cr_cohorts) -> (weakref to it, CohortIndex)
+_lock = threading.Lock()
+
+
+class RowIndex:
+    """
+    Sorted int32 row positions of one frame per value of INDEXED_COLUMNS and,
+    when the frame has cr_user_id, per cohort of a CohortIndex.
+    first_open holds the frame's non-null first_open values as int64
+    nanoseconds when the frame is sorted by it, else None.
+    """
+
+    def __init__(self, df, cohorts=None):
+        self.n_rows = len(df)
+        self.first_open = _sorted_epochs(df["first_open"]) if "first_open" in df.columns else None
+        self.columns = {
+            column: _positions_by_value(df[column]) for column in INDEXED_COLUMNS if column in df.columns
+        }
+        self.cohorts = None
+        if cohorts is not None and "cr_user_id" in df.columns:
+            self.cohorts = _positions_by_cohort(df["cr_user_id"], cohorts)
+
+    def select(self, rows, column, values):
+        """rows (None for all rows) narrowed to those whose column is one of values."""
+        return self._narrow(rows, [self.columns[column].get(value) for value in values])
+
+    def select_cohorts(self, rows, cohort_names):
+        """rows (None for all rows) narrowed to users in any of cohort_names."""
+        return self._narrow(rows, [self.cohorts.get(name) for name in cohort_names])
+
+    def date_bounds(self, start, end):
+        """(lo, hi) such that rows lo..hi-1 are exactly those with start <= first_open <= end."""
+        return date_bounds(self.first_open, start, end)
+
+    def nbytes(self):
+        groups = list(self.columns.values()) + ([self.cohorts] if self.cohorts else [])
+        total = sum(positions.nbytes for group in groups for positions in group.values())
+        return total + (self.first_open.nbytes if self.first_open is not None else 0)
+
+    def _narrow(self, rows, position_arrays):
+        position_arrays = [p for p in position_arrays if p is not None and len(p)]
+        if not position_arrays:
+            return np.empty(0, dtype=np.int32)
+        if len(position_arrays) == 1:
+            selected = position_arrays[0]
+            if rows is None:
+                return selected
+            member = np.zeros(self.n_rows, dtype=bool)
+            member[selected] = True
+            return rows[member[rows]]
+
+        # Union as a bitmap over all rows, then keep the rows already selected
+        member = np.zeros(self.n_rows, dtype=bool)
+        for positions in position_arrays:
+            member[positions] = True
+        if rows is None:
+            return np.flatnonzero(member).astype(np.int32)
+        return rows[member[rows]]
+
+
+def _positions_by_value(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        values = series.cat.categories
+    else:
+        codes, values = pd.factorize(series)
+
+    # A stable sort by code keeps each value's positions in row order; nulls (-1) come first
+    order = np.argsort(codes, kind="stable").astype(np.int32)
+    counts = np.bincount(codes[codes >= 0], minlength=len(values))
+    first = len(codes) - int(counts.sum())
+    groups = np.split(order[first:], np.cumsum(counts)[:-1]) if len(values) else []
+    return {value: positions for value, positions in zip(values, groups) if len(positions)}
+
+
+def _sorted_epochs(dates):
+    """dates as int64 nanoseconds without the trailing NaTs, or None unless sorted with NaT last."""
+    if not pd.api.types.is_datetime64_dtype(dates.dtype):
+        return None
+    values = dates.to_numpy().astype("datetime64[ns]", copy=False)
+    n_valid = len(values) - int(np.isnat(values).sum())
+    if n_valid and np.isnat(values[:n_valid]).any():
+        return None
+    epochs = values[:n_valid].view(np.int64)
+    if n_valid > 1 and not (epochs[1:] >= epochs[:-1]).all():
+        return None
+    return epochs
+
+
+def _ns(value):
+    return pd.Timestamp(value).as_unit("ns").value
+
+
+def date_bounds(epochs, start, end):
+    """searchsorted bounds of start <= date <= end over sorted int64 nanosecond epochs."""
+    return (
+        int(np.searchsorted(epochs, _ns(start), side="left")),
+        int(np.searchsorted(epochs, _ns(end), side="right")),
+    )
+
+
+def sort_by_date(df, column="first_open"):
+    """
+    (df sorted by column with NaT last, its non-null dates as int64 nanoseconds).
+    A frame already indexed with first_open epochs is returned as is; any other
+    frame is sorted once here (it is not modified).
+    """
+    index = frame_index(df)
+    if column == "first_open" and index is not None and index.first_open is not None:
+        return df, index.first_open
+    values = pd.to_datetime(df[column]).to_numpy().astype("datetime64[ns]", copy=False)
+    order = np.argsort(values, kind="stable")  # numpy sorts NaT last
+    values = values[order]
+    n_valid = len(values) - int(np.isnat(values).sum())
+    return df.take(order), values[:n_valid].view(np.int64)
+
+
+def select_date_range(df, start, end, column="first_open"):
+    """Rows of df with start <= column <= end: a slice for first_open-sorted indexed frames, else a mask."""
+    index = frame_index(df)
+    if column == "first_open" and index is not None and index.first_open is not None:
+        lo, hi = index.date_bounds(start, end)
+        return df.iloc[lo:hi]
+    return df[(df[column] >= start) & (df[column] <= end)]
+
+
+class CohortIndex:
+    """
+    Members of every cohort of a df_cr_cohorts frame: cohort_name -> sorted,
+    unique cr_user_ids (user keys, see user_keys).
+    """
+
+    def __init__(self, cohorts):
+        self.members = cohorts[["cohort_name", "cr_user_id"]].dropna().drop_duplicates()
+        self.user_ids = {
+            name: group["cr_user_id"].sort_values().array
+            for name, group in self.members.groupby("cohort_name", observed=True, sort=False)
+        }
+        # Every named cohort, including any without a known member
+        self._names = cohorts["cohort_name"].dropna().unique().tolist()
+
+    def names(self):
+        return list(self._names)
+
+    def members_of(self, cohort_names):
+        """Sorted cr_user_ids in any of cohort_names (unknown names have none)."""
+        arrays = [self.user_ids[name] for name in cohort_names if name in self.user_ids]
+        if not arrays:
+            return self.members["cr_user_id"].array[:0]
+        if len(arrays) == 1:
+            return arrays[0]
+        return pd.concat([pd.Series(a) for a in arrays]).drop_duplicates().sort_values().array
+
+    def nbytes(self):
+        return int(self.members.memory_usage(deep=True).sum())
+
+
+def _positions_by_cohort(user_ids, cohorts):
+    rows = pd.DataFrame({"cr_user_id": user_ids.array, "row": np.arange(len(user_ids), dtype=np.int32)})
+    # A join on the integer user keys: every (row, cohort) pair at once instead of one isin per cohort
+    joined = rows.merge(cohorts.members, on="cr_user_id")
+    return {
+        name: np.unique(group["row"].to_numpy())
+        for name, group in joined.groupby("cohort_name", observed=True, sort=False)
+    }
+
+
+def _register(registry, df, index):
+    key = id(df)
+    with _lock:
+        registry[key] = (weakref.ref(df, lambda _, key=key: registry.pop(key, None)), index)
+    return index
+
+
+def _lookup(registry, df):
+    entry = registry.get(id(df))
+    if entry is None or entry[0]() is not df:
+        return None
+    return entry[1]
+
+
+def index_frame(df, cohorts=None):
+    """Build df's RowIndex (cohorts: the CohortIndex of the same version) and return it."""
+    return _register(_indexes, df, RowIndex(df, cohorts))
+
+
+def frame_index(df):
+    """Return df's RowIndex, or None if it has none."""
+    return _lookup(_indexes, df)
+
+
+def index_cohorts(df_cr_cohorts):
+    """Build the CohortIndex of a df_cr_cohorts frame and return it."""
+    return _register(_cohort_indexes, df_cr_cohorts, CohortIndex(df_cr_cohorts))
+
+
+def cohort_index(df_cr_cohorts):
+    """Return the CohortIndex of df_cr_cohorts, building it if it has none."""
+    index = _lookup(_cohort_indexes, df_cr_cohorts)
+    return index if index is not None else index_cohorts(df_cr_cohorts)
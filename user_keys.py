@@ -0,0 +1,187 @@
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# User identifiers as integer keys.  When a run_date is loaded, every frame with
+# cr_user_id or user_pseudo_id (CR users, app launch, Unity users, cohorts, book
+# cohorts, book summary) gets that column encoded over one global, sorted id
+# dictionary per column: a categorical whose int32 codes are the user keys.
+# Merges, drop_duplicates and sort_values between frames then compare integers,
+# and isin_keys / map_keys do the same for membership tests and lookups, which
+# pandas would otherwise run by hashing the dictionary's strings.  The strings are
+# only looked up when a column is displayed, exported or compared with ids from
+# outside the dataset (BigQuery results, a typed-in cr_user_id).
+#
+# Categories are sorted, so sorting by a key orders users as the strings did.
+# These are high-cardinality: any groupby on a key column needs observed=True.
+
+#
+# The dictionaries are registered (weakly, per column) so cached results that
+# carry a key column are not charged for, or stored with, the whole shared
+# dictionary: memory_usage counts only their codes, and compact_keys /
+# restore_keys swap it for the ids actually used and back.
+
+USER_KEY_COLUMNS = ["cr_user_id", "user_pseudo_id"]
+
+# id(categories) -> (weakref to the categories Index, column) of every loaded dictionary
+_dictionaries = {}
+# column -> weakref to its most recently loaded dictionary
+_latest = {}
+
+
+def encode_user_keys(frames):
+    """
+    Encode USER_KEY_COLUMNS in place across frames ({name: DataFrame}) over one
+    shared dictionary per column.  Frames already encoded over equal
+    dictionaries (an Arrow snapshot) keep their codes and only get the same
+    dtype.  Returns {column: CategoricalDtype}.
+    """
+    dtypes = {}
+    for column in USER_KEY_COLUMNS:
+        names = [name for name, df in frames.items() if column in df.columns]
+        if not names:
+            continue
+
+        series = [frames[name][column] for name in names]
+        dtype = _common_dtype(series)
+        if dtype is not None:
+            codes = [s.cat.codes.to_numpy() for s in series]
+        else:
+            dtype, codes = _build_dictionary(series)
+
+        for name, s, c in zip(names, series, codes):
+            frames[name][column] = pd.Series(pd.Categorical.from_codes(c, dtype=dtype), index=s.index, name=column)
+        _register(column, dtype.categories)
+        dtypes[column] = dtype
+    return dtypes
+
+
+def _register(column, categories):
+    key = id(categories)
+    _dictionaries[key] = (weakref.ref(categories, lambda _, key=key: _dictionaries.pop(key, None)), column)
+    _latest[column] = weakref.ref(categories)
+
+
+def is_shared_dictionary(dtype):
+    """True if dtype is categorical over one of the loaded datasets' user key dictionaries."""
+    if not isinstance(dtype, pd.CategoricalDtype):
+        return False
+    entry = _dictionaries.get(id(dtype.categories))
+    return entry is not None and entry[0]() is dtype.categories
+
+
+def memory_usage(value):
+    """
+    memory_usage(deep=True) of a DataFrame, Series or Index, except that key
+    columns over a shared dictionary count only their codes: the dictionary is
+    held once by the dataset, not by every frame that has the column.
+    """
+    if isinstance(value, pd.DataFrame):
+        return memory_usage(value.index) + sum(memory_usage(value.iloc[:, i]) for i in range(value.shape[1]))
+    if is_shared_dictionary(value.dtype):
+        codes = value.codes if isinstance(value, pd.CategoricalIndex) else value.cat.codes
+        return int(codes.nbytes)
+    return int(value.memory_usage(deep=True))
+
+
+def compact_keys(value):
+    """
+    value (DataFrame or Series) with its key columns over a shared dictionary
+    reduced to the ids they use, e.g. before it is serialized.
+    """
+    if isinstance(value, pd.Series):
+        return value.cat.remove_unused_categories() if is_shared_dictionary(value.dtype) else value
+    shared = [column for column in value.columns if is_shared_dictionary(value[column].dtype)]
+    if not shared:
+        return value
+    return value.assign(**{column: value[column].cat.remove_unused_categories() for column in shared})
+
+
+def restore_keys(value):
+    """
+    Undo compact_keys: key columns (by name) go back onto the loaded dataset's
+    dictionary when it holds every id they use, so they share keys with the
+    dataset frames again.  Others are returned as they are.
+    """
+    if isinstance(value, pd.Series):
+        return _restore(value.name, value)
+    restored = {column: _restore(column, value[column]) for column in value.columns if column in USER_KEY_COLUMNS}
+    restored = {column: s for column, s in restored.items() if s is not value[column]}
+    return value.assign(**restored) if restored else value
+
+
+def _restore(column, s):
+    ref = _latest.get(column) if isinstance(s.dtype, pd.CategoricalDtype) else None
+    dictionary = ref() if ref is not None else None
+    if dictionary is None:
+        return s
+    positions = dictionary.get_indexer(s.cat.categories)
+    if (positions < 0).any():
+        return s
+    # Code -> code in the dictionary; the extra last slot is the null key (code -1)
+    lookup = np.append(positions, -1)
+    codes = lookup[s.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(dictionary)), index=s.index, name=s.name)
+
+
+def _common_dtype(series):
+    """The dtype of the first series if every one is categorical over equal categories, else None."""
+    first = series[0].dtype
+    if not isinstance(first, pd.CategoricalDtype):
+        return None
+    for s in series[1:]:
+        dtype = s.dtype
+        if not isinstance(dtype, pd.CategoricalDtype) or not (
+            dtype.categories is first.categories or dtype.categories.equals(first.categories)
+        ):
+            return None
+    return first
+
+
+def _build_dictionary(series):
+    """(sorted dictionary of every id in series, codes of each series into it), hashing each id once."""
+    codes, uniques = pd.factorize(pd.concat(series, ignore_index=True))
+    # Sorting as fixed-width unicode is several times faster than sorting Python strings
+    order = np.argsort(np.asarray(uniques, dtype=str))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    codes = np.where(codes >= 0, rank[codes], -1)
+    dtype = pd.CategoricalDtype(np.asarray(uniques, dtype=object)[order])
+    bounds = np.cumsum([0] + [len(s) for s in series])
+    return dtype, [codes[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def _codes(keys):
+    return np.asarray(keys.cat.codes if isinstance(keys, pd.Series) else keys.codes)
+
+
+def shares_keys(a, b):
+    """True if a and b (Series, Categorical or CategoricalIndex) hold keys of the same dictionary."""
+    da, db = getattr(a, "dtype", None), getattr(b, "dtype", None)
+    return (
+        isinstance(da, pd.CategoricalDtype)
+        and isinstance(db, pd.CategoricalDtype)
+        and (da is db or da.categories is db.categories)
+    )
+
+
+def isin_keys(keys, values):
+    """keys.isin(values) as a boolean Series, on the integer codes when both share a dictionary."""
+    if not shares_keys(keys, values):
+        return keys.isin(values)
+    return pd.Series(np.isin(_codes(keys), _codes(values), kind="table"), index=keys.index, name=keys.name)
+
+
+def map_keys(keys, mapping):
+    """
+    keys.map(mapping) for a Series mapping indexed by unique keys, looked up by
+    integer code when both share a dictionary.
+    """
+    if not shares_keys(keys, mapping.index):
+        return keys.map(mapping)
+    # Row of mapping per code; the extra last slot is the null key (code -1)
+    rows = np.full(len(keys.dtype.categories) + 1, -1, dtype=np.int64)
+    rows[_codes(mapping.index)] = np.arange(len(mapping))
+    values = mapping.array.take(rows[_codes(keys)], allow_fill=True)
+    return pd.Series(values, index=keys.index, name=keys.name)
@@ -3,20 +3,88 @@ import pandas as pd
 from rich import print as print
 import numpy as np
 import gcsfs
-from settings import get_gcp_credentials
+from settings import get_gcp_credentials, run_bq_query
+from gcs_mirror import MIRROR_DIR, ParquetMirror
+from arrow_snapshot import SNAPSHOT_DIR, ArrowSnapshot
+from dataset_store import DatasetStore
+from cache_keys import cache_frames, tag_frame
+from funnel_engine import add_funnel_columns
+from user_index import cohort_index, frame_index, index_cohorts, index_frame
+from user_keys import encode_user_keys, isin_keys, map_keys
+from cache_stats import observed_cache_data, record_source
+from dataset_schema import FULL_LOAD, apply_dtypes, dataset_columns, dataset_dtypes, encode_categoricals
+import pyarrow.parquet as pq
 from ui_widgets import derive_ftm_outcome
 from google.cloud import bigquery
+import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from types import MappingProxyType
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 
 RUN_DATE_RE = re.compile(r"/run_date=\d{4}-\d{2}-\d{2}/")
+RUN_DATE_VALUE_RE = re.compile(r"run_date=(\d{4}-\d{2}-\d{2})")
 
-@st.cache_data(ttl="1d", show_spinner=False)
-def load_parquet_from_gcs(file_pattern: str) -> pd.DataFrame:
+# Upper bound on concurrent GCS downloads / BigQuery queries while loading data
+LOADER_MAX_WORKERS = int(os.environ.get("DATA_LOADER_WORKERS", "8"))
+
+# Frames apply_user_filters is called on, indexed by user_index when loaded
+INDEXED_USER_FRAMES = ["df_cr_users", "df_unity_users", "df_cr_app_launch"]
+
+# Unions of every app's user frame (metrics.build_all_apps_frame), one per stat
+# whose frames differ, built and indexed with each version (not snapshotted)
+ALL_APPS_STATS = [None, "LR"]
+
+# Cleaned user frames written by derive.py, one parquet file per frame and run_date.
+# Bump DERIVED_VERSION when the clean-up steps change so old outputs are not read.
+DERIVED_VERSION = 5
+DERIVED_PATH = f"user_data_parquet_cache/derived_v{DERIVED_VERSION}"
+
+
+def get_gcs_filesystem():
     credentials, _ = get_gcp_credentials()
-    fs = gcsfs.GCSFileSystem(project="dataexploration-193817", token=credentials)
+    return gcsfs.GCSFileSystem(project="dataexploration-193817", token=credentials)
+
+
+@st.cache_resource(show_spinner=False)
+def get_parquet_mirror():
+    """Process-wide local mirror of the parquet exports, or None when PARQUET_MIRROR_DIR is empty."""
+    if not MIRROR_DIR:
+        return None
+    import settings
+    return ParquetMirror(get_gcs_filesystem(), root=MIRROR_DIR, logger=settings.get_logger())
 
-    files = fs.glob(file_pattern)
+
+@st.cache_resource(show_spinner=False)
+def get_user_snapshot():
+    """Process-wide Arrow snapshot store of the processed user frames, or None when USER_SNAPSHOT_DIR is empty."""
+    if not SNAPSHOT_DIR:
+        return None
+    import settings
+    return ArrowSnapshot(root=SNAPSHOT_DIR, variant="-full" if FULL_LOAD else "", logger=settings.get_logger())
+
+
+def load_parquet_from_gcs(file_pattern: str, run_date: str = None, columns: list = None, dtypes: dict = None) -> pd.DataFrame:
+    """
+    Read the parquet files matching file_pattern.  When the pattern contains
+    run_date=* only one run is read: run_date if given (or the newest run at or
+    before it, in case this dataset's export has not landed yet), otherwise the
+    latest run available.  That run is served from the local parquet mirror,
+    which downloads only objects it does not already hold.
+
+    columns projects the read to that allowlist (see dataset_schema); names
+    missing from the export are skipped.  None reads every column.  dtypes
+    casts declared columns while the data is still an Arrow table; anything in
+    the export that does not match the declaration is logged as schema drift.
+
+    Not cached here - the shared user dataset holds the processed result once
+    per run_date, so caching the raw frame would only duplicate it in memory.
+    """
+    fs = get_gcs_filesystem()
+
+    files = fs.glob(file_pattern, detail=True)
     if not files:
         raise FileNotFoundError(f"No files matching pattern: {file_pattern}")
 
@@ -25,106 +93,452 @@ def load_parquet_from_gcs(file_pattern: str) -> pd.DataFrame:
         if not run_dirs:
             raise FileNotFoundError(f"Pattern included run_date=* but no run_date folders found: {file_pattern}")
 
+        if run_date is not None:
+            run_dirs = [d for d in run_dirs if d <= f"/run_date={run_date}/"]
+            if not run_dirs:
+                raise FileNotFoundError(f"No run_date at or before {run_date} for pattern: {file_pattern}")
+
         latest_run_dir = max(set(run_dirs))  # YYYY-MM-DD sorts correctly
-        files = [f for f in files if latest_run_dir in f]
+        files = {f: info for f, info in files.items() if latest_run_dir in f}
 
-    df = pd.read_parquet(files, filesystem=fs).copy()
-    return df
+        mirror = get_parquet_mirror()
+        if mirror is not None:
+            local_files = mirror.fetch(files)
+            return read_parquet_files(local_files, columns, dtypes, file_pattern)
+
+    return read_parquet_files(list(files), columns, dtypes, file_pattern, filesystem=fs)
+
+
+def read_parquet_files(files, columns, dtypes, label, filesystem=None):
+    table = pq.read_table(
+        files,
+        columns=project_columns(files, columns, filesystem=filesystem),
+        filesystem=filesystem,
+        use_pandas_metadata=True,
+    )
+    if dtypes:
+        table, drift = apply_dtypes(table, dtypes)
+        if drift:
+            import settings
+            settings.get_logger().warning(f"Schema drift in {label}:\n  " + "\n  ".join(drift))
+    return table.to_pandas()
+
+
+def project_columns(files, columns, filesystem=None):
+    """Keep the allowlisted columns that exist in the parquet schema, in allowlist order."""
+    if columns is None:
+        return None
+    available = set(pq.read_schema(files[0], filesystem=filesystem).names)
+    return [c for c in columns if c in available]
 
-def load_unity_user_progress_from_gcs():
+
+def get_latest_run_date() -> str:
+    """
+    Latest nightly export, taken from the cr_user_progress run_date folders.
+    Lists GCS on every call; pages read the run_date of the shared dataset instead.
+    """
+    fs = get_gcs_filesystem()
+    run_dirs = fs.glob("user_data_parquet_cache/cr_user_progress/run_date=*")
+    run_dates = [m.group(1) for d in run_dirs if (m := RUN_DATE_VALUE_RE.search(d))]
+    if not run_dates:
+        raise FileNotFoundError("No run_date folders found for cr_user_progress")
+    return max(run_dates)
+
+
+def load_unity_user_progress_from_gcs(run_date=None):
     return load_parquet_from_gcs(
-        "user_data_parquet_cache/unity_user_progress/run_date=*/unity_user_progress_*.parquet"
+        "user_data_parquet_cache/unity_user_progress/run_date=*/unity_user_progress_*.parquet",
+        run_date=run_date,
+        columns=dataset_columns("unity_user_progress"),
+        dtypes=dataset_dtypes("unity_user_progress"),
     )
 
-def load_cr_user_progress_from_gcs():
+def load_cr_user_progress_from_gcs(run_date=None):
     return load_parquet_from_gcs(
-        "user_data_parquet_cache/cr_user_progress/run_date=*/cr_user_progress_*.parquet"
+        "user_data_parquet_cache/cr_user_progress/run_date=*/cr_user_progress_*.parquet",
+        run_date=run_date,
+        columns=dataset_columns("cr_user_progress"),
+        dtypes=dataset_dtypes("cr_user_progress"),
     )
 
-def load_cr_app_launch_from_gcs():
+def load_cr_app_launch_from_gcs(run_date=None):
     return load_parquet_from_gcs(
-        "user_data_parquet_cache/cr_app_launch/run_date=*/cr_app_launch_*.parquet"
+        "user_data_parquet_cache/cr_app_launch/run_date=*/cr_app_launch_*.parquet",
+        run_date=run_date,
+        columns=dataset_columns("cr_app_launch"),
+        dtypes=dataset_dtypes("cr_app_launch"),
     )
 
-def load_cr_book_user_cohorts_from_gcs():
+def load_cr_book_user_cohorts_from_gcs(run_date=None):
     return load_parquet_from_gcs(
-        "user_data_parquet_cache/cr_book_user_cohorts/run_date=*/cr_book_user_cohorts_*.parquet"
+        "user_data_parquet_cache/cr_book_user_cohorts/run_date=*/cr_book_user_cohorts_*.parquet",
+        run_date=run_date,
+        columns=dataset_columns("cr_book_user_cohorts"),
+        dtypes=dataset_dtypes("cr_book_user_cohorts"),
     )
 
-def load_cr_cohorts_from_gcs():
+def load_cr_cohorts_from_gcs(run_date=None):
     return load_parquet_from_gcs(
-        "user_data_parquet_cache/cr_cohorts/run_date=*/cr_cohorts_*.parquet"
+        "user_data_parquet_cache/cr_cohorts/run_date=*/cr_cohorts_*.parquet",
+        run_date=run_date,
+        columns=dataset_columns("cr_cohorts"),
+        dtypes=dataset_dtypes("cr_cohorts"),
     )
     
-def load_cr_book_user_book_summary_from_gcs():
+def load_cr_book_user_book_summary_from_gcs(run_date=None):
     return load_parquet_from_gcs(
-        "user_data_parquet_cache/cr_book_user_book_summary/run_date=*/cr_book_user_book_summary_*.parquet"
+        "user_data_parquet_cache/cr_book_user_book_summary/run_date=*/cr_book_user_book_summary_*.parquet",
+        run_date=run_date,
+        columns=dataset_columns("cr_book_user_book_summary"),
+        dtypes=dataset_dtypes("cr_book_user_book_summary"),
     )
 
+
 def ensure_user_data_initialized():
     import traceback
-    """Run init_user_data once per session, with error handling."""
-    if "user_data_initialized" not in st.session_state:
+    """
+    Make sure the shared user dataset is loaded, with error handling, and pin
+    this script run to its current version.  Pages call this first on every
+    rerun, so a session moves to a new run_date on its next rerun.
+    """
+    try:
+        with st.spinner("Loading User Data", show_time=True):
+            run_date, _ = get_dataset_store().current()
+        st.session_state["user_data_run_date"] = run_date
+    except Exception as e:
+        st.error(f"❌ Failed to initialize user data: {e}")
+        st.text(traceback.format_exc())
+        st.stop()
+
+
+def get_user_data():
+    """
+    Return the process-wide user dataset: the version this script run pinned in
+    ensure_user_data_initialized, or the current one outside a session.
+
+    Every session gets the same read-only mapping of DataFrames by reference,
+    so memory no longer grows with the number of open sessions.  Callers must
+    not modify these frames in place - take a copy (or filter) first.
+    """
+    store = get_dataset_store()
+    if get_script_run_ctx() is not None and "user_data_run_date" in st.session_state:
+        return store.get(st.session_state["user_data_run_date"])
+    return store.current()[1]
+
+
+def get_user_df(name):
+    """Shortcut for a single frame of the shared user dataset, e.g. get_user_df("df_cr_users")."""
+    return get_user_data()[name]
+
+
+@st.cache_resource(show_spinner=False)
+def get_dataset_store():
+    """
+    Process-wide version pointer for the user dataset.  A watcher thread builds
+    each new nightly run_date in the background and swaps it in, so no request
+    waits on a reload.  Each published version has its pages' default views
+    precomputed in the background (see precompute).
+    """
+    import settings
+    import precompute
+    store = DatasetStore(
+        find_latest=get_latest_run_date,
+        build=load_user_dataset,
+        logger=settings.get_logger(),
+        on_publish=precompute.start_precompute,
+    )
+    store.start_watcher()
+    return store
+
+
+def load_user_dataset(run_date):
+    """
+    Load and post-process all user datasets for run_date as one read-only mapping.
+    Each frame is tagged with (run_date, name) as its cache key (see cache_keys),
+    df_cr_cohorts gets its cohort membership index and the user frames the
+    row-id index apply_user_filters selects with (see user_index).
+
+    The all-apps unions of the marketing page (ALL_APPS_STATS) are built here
+    too, once per version rather than on every call, and every user frame gets
+    its funnel_rank / funnel_flags columns (see funnel_engine).
+    """
+    import metrics
+    import settings
+
+    frames = init_user_data(run_date)
+
+    started = time.perf_counter()
+    all_apps_frames = [metrics.all_apps_frame_name(stat) for stat in ALL_APPS_STATS]
+    for name, stat in zip(all_apps_frames, ALL_APPS_STATS):
+        frames[name] = metrics.build_all_apps_frame(frames, stat)
+    # After the unions, so app-launch rows in them (no furthest_event) still get rank 0
+    add_funnel_columns({name: frames[name] for name in INDEXED_USER_FRAMES + all_apps_frames if name in frames})
+    settings.get_logger().info(
+        f"All-apps frames and funnel columns for run_date={run_date} built in {time.perf_counter() - started:.2f}s"
+    )
+
+    for name, df in frames.items():
+        tag_frame(df, ("dataset", run_date, name))
+
+    started = time.perf_counter()
+    cohorts = index_cohorts(frames["df_cr_cohorts"]) if "df_cr_cohorts" in frames else None
+    index_bytes = (cohorts.nbytes() if cohorts is not None else 0) + sum(
+        index_frame(frames[name], cohorts).nbytes()
+        for name in INDEXED_USER_FRAMES + all_apps_frames if name in frames
+    )
+    settings.get_logger().info(
+        f"Row indexes for run_date={run_date} built in {time.perf_counter() - started:.2f}s "
+        f"({index_bytes / 1e6:.1f} MB)"
+    )
+    return MappingProxyType(frames)
+
+
+def init_user_data(run_date=None):
+    """
+    Load every user dataset for run_date and return the post-processed frames
+    keyed by name.  (Campaign data is loaded separately, see
+    campaigns.get_campaign_data.)
+
+    All downloads run concurrently on a bounded thread pool.  Each
+    dataset's own clean-up (date columns, language names, Unity dedupe) runs in
+    its worker as soon as its download finishes; only the CR users / app launch
+    reconciliation has to wait for both frames.  Cold-start wall time is then
+    roughly the slowest single download.
+
+    When derive.py has already written the cleaned frames for run_date, those
+    are downloaded instead of the raw exports and no clean-up runs here.
+
+    The processed user frames are saved as an Arrow snapshot for run_date; when
+    one already exists they are memory-mapped from it and nothing is downloaded.
+    """
+    import settings
+
+    get_gcp_credentials()  # resolve the shared credentials once, before the workers need them
+
+    snapshot = get_user_snapshot()
+    started = time.perf_counter()
+    snapshot_frames = read_user_snapshot(snapshot, run_date) if snapshot and run_date else None
+    timings = []
+    if snapshot and run_date:
+        record_source("arrow snapshot", hits=int(snapshot_frames is not None), misses=int(snapshot_frames is None))
+    if snapshot_frames is not None:
+        timings.append({
+            "dataset": "arrow snapshot",
+            "rows": sum(len(df) for df in snapshot_frames.values()),
+            "load_s": time.perf_counter() - started,
+            "prepare_s": 0.0,
+        })
+
+    tasks = {}
+    derived = snapshot_frames is None and derived_frames_available(run_date)
+    if snapshot_frames is None and run_date and not FULL_LOAD:
+        record_source("derived parquet", hits=int(derived), misses=int(not derived))
+    if derived:
+        tasks.update({
+            name: (lambda name=name: load_derived_frame(name, run_date), None)
+            for name in USER_DATASET_LOADERS
+        })
+    elif snapshot_frames is None:
+        tasks.update({
+            name: (lambda load=load: load(run_date), prepare)
+            for name, (load, prepare) in USER_DATASET_LOADERS.items()
+        })
+
+    frames = {}
+    if tasks:
+        with ThreadPoolExecutor(max_workers=min(LOADER_MAX_WORKERS, len(tasks)), thread_name_prefix="data-loader") as pool:
+            futures = {pool.submit(_load_and_prepare, load, prepare): name for name, (load, prepare) in tasks.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                frames[name], load_s, prepare_s = future.result()
+                timings.append({"dataset": name, "rows": len(frames[name]), "load_s": load_s, "prepare_s": prepare_s})
+
+    if snapshot_frames is not None:
+        frames = snapshot_frames
+        # Each Arrow file carries its own copy of the user id dictionary; share one
+        encode_user_keys(frames)
+    else:
+        if derived:
+            # Parquet keeps only the categories each file uses; re-share them across frames
+            encode_started = time.perf_counter()
+            encode_user_keys(frames)
+            encode_categoricals(frames)
+            timings.append({
+                "dataset": "encode_categoricals",
+                "rows": sum(len(df) for df in frames.values()),
+                "load_s": 0.0,
+                "prepare_s": time.perf_counter() - encode_started,
+            })
+        else:
+            process_user_frames(frames, timings)
+        if snapshot and run_date:
+            snapshot_started = time.perf_counter()
+            try:
+                snapshot.write(run_date, frames)
+            except Exception as e:
+                settings.get_logger().warning(f"Arrow snapshot for run_date={run_date} not written: {e}")
+            timings.append({
+                "dataset": "write arrow snapshot",
+                "rows": 0,
+                "load_s": 0.0,
+                "prepare_s": time.perf_counter() - snapshot_started,
+            })
+
+    settings.get_logger().info(
+        f"User data for run_date={run_date} loaded in {time.perf_counter() - started:.1f}s\n"
+        + pd.DataFrame(timings).round(2).to_string(index=False)
+    )
+    return frames
+
+
+def read_user_snapshot(snapshot, run_date):
+    """
+    The snapshot's frames for run_date, or None if there is none or it cannot be
+    read (truncated or corrupt file, removed by another process meanwhile): a bad
+    snapshot is logged and discarded, and the frames are rebuilt from parquet.
+    """
+    import settings
+    try:
+        return snapshot.read(run_date)
+    except Exception:
+        settings.get_logger().exception(f"Arrow snapshot for run_date={run_date} cannot be read; rebuilding it")
         try:
-            init_user_data()
-            st.session_state["user_data_initialized"] = True
-        except Exception as e:
-            st.error(f"❌ Failed to initialize user data: {e}")
-            st.text(traceback.format_exc())
-            st.stop()
-
-def init_user_data():
-    if st.session_state.get("user_data_initialized"):
-        return
-    with st.spinner("Loading User Data", show_time=True):
-        from pyinstrument import Profiler
-        from pyinstrument.renderers.console import ConsoleRenderer
-        import settings
-
-        profiler = Profiler(async_mode="disabled")
-        with profiler:
-            df_cr_users = load_cr_user_progress_from_gcs()
-            df_unity_users = load_unity_user_progress_from_gcs()
-            df_cr_app_launch = load_cr_app_launch_from_gcs()
-            df_cr_book_user_cohorts = load_cr_book_user_cohorts_from_gcs()
-            df_cr_cohorts = load_cr_cohorts_from_gcs()
-            df_cr_book_user_book_summary = load_cr_book_user_book_summary_from_gcs()  # NEW
-
-            if df_cr_users.empty or df_unity_users.empty or df_cr_app_launch.empty:
-                raise ValueError("❌ One or more dataframes were empty after loading.")
-
-            df_cr_users = fix_date_columns(df_cr_users, ["first_open", "last_event_date"])
-            df_unity_users = fix_date_columns(df_unity_users, ["first_open", "la_date", "last_event_date"])
-            df_cr_app_launch = fix_date_columns(df_cr_app_launch, ["first_open"])
-            df_cr_book_user_cohorts = fix_date_columns(df_cr_book_user_cohorts, ["first_access_date", "last_access_date"])
-            df_cr_book_user_book_summary = fix_date_columns(  # NEW
-                df_cr_book_user_book_summary,
-                ["first_access_date", "last_access_date"]
-            )
+            snapshot.discard(run_date)
+        except OSError:
+            settings.get_logger().warning(f"Arrow snapshot for run_date={run_date} not discarded", exc_info=True)
+        return None
+
+
+def derived_object_path(name, run_date):
+    return f"{DERIVED_PATH}/{name}/run_date={run_date}/{name}.parquet"
+
+
+def derived_frames_available(run_date):
+    """
+    True when derive.py has written every user frame for run_date.  Derived
+    frames are projected to the dataset_schema allowlists, so they are not used
+    in full-load mode.
+    """
+    if run_date is None or FULL_LOAD:
+        return False
+    fs = get_gcs_filesystem()
+    return all(fs.exists(derived_object_path(name, run_date)) for name in USER_DATASET_LOADERS)
 
-            max_level_indices = df_unity_users.groupby("user_pseudo_id")["max_user_level"].idxmax()
-            df_unity_users = df_unity_users.loc[max_level_indices].reset_index(drop=True)
 
-            df_cr_app_launch["app_language"] = clean_language_column(df_cr_app_launch)
-            df_cr_users["app_language"] = clean_language_column(df_cr_users)
+def load_derived_frame(name, run_date):
+    df = load_parquet_from_gcs(f"{DERIVED_PATH}/{name}/run_date=*/*.parquet", run_date=run_date)
+    return df.drop(columns="run_date", errors="ignore")  # hive partition column, not part of the frame
 
-            df_cr_app_launch, df_cr_users = clean_cr_users_to_single_language(df_cr_app_launch, df_cr_users)
 
-            df_cr_users["active_span"] = df_cr_users["active_span"].clip(lower=0)
+def derive_user_frames(raw_frames):
+    """
+    The complete clean-up from raw exports to the frames the pages use, with no
+    I/O: raw_frames maps the USER_DATASET_LOADERS names to frames as read from
+    GCS.  derive.py runs this offline; init_user_data runs the same steps but
+    overlaps the per-dataset ones with the downloads.
+    """
+    frames = {}
+    for name, df in raw_frames.items():
+        prepare = USER_DATASET_LOADERS[name][1]
+        frames[name] = prepare(df) if prepare is not None else df
+    return process_user_frames(frames)
+
+
+def process_user_frames(frames, timings=None):
+    """Cross-frame post-processing of the prepared user frames, in place.  Returns frames."""
+    if timings is None:
+        timings = []
+    if frames["df_cr_users"].empty or frames["df_unity_users"].empty or frames["df_cr_app_launch"].empty:
+        raise ValueError("❌ One or more dataframes were empty after loading.")
+
+    # Integer user keys first, so the reconciliation below joins on them
+    keys_started = time.perf_counter()
+    encode_user_keys(frames)
+    timings.append({
+        "dataset": "encode_user_keys",
+        "rows": sum(len(df) for df in frames.values()),
+        "load_s": 0.0,
+        "prepare_s": time.perf_counter() - keys_started,
+    })
+
+    reconcile_started = time.perf_counter()
+    df_cr_app_launch, df_cr_users = clean_cr_users_to_single_language(frames["df_cr_app_launch"], frames["df_cr_users"])
+    df_cr_users["active_span"] = df_cr_users["active_span"].clip(lower=0)
+    frames["df_cr_users"] = df_cr_users
+    frames["df_cr_app_launch"] = df_cr_app_launch
+    timings.append({
+        "dataset": "clean_cr_users_to_single_language",
+        "rows": len(df_cr_users),
+        "load_s": 0.0,
+        "prepare_s": time.perf_counter() - reconcile_started,
+    })
+
+    encode_started = time.perf_counter()
+    encode_categoricals(frames)
+    timings.append({
+        "dataset": "encode_categoricals",
+        "rows": sum(len(df) for df in frames.values()),
+        "load_s": 0.0,
+        "prepare_s": time.perf_counter() - encode_started,
+    })
+
+    sort_started = time.perf_counter()
+    sort_by_first_open(frames)
+    timings.append({
+        "dataset": "sort_by_first_open",
+        "rows": sum(len(frames[name]) for name in INDEXED_USER_FRAMES),
+        "load_s": 0.0,
+        "prepare_s": time.perf_counter() - sort_started,
+    })
+    return frames
+
+
+def sort_by_first_open(frames):
+    """
+    Sort the INDEXED_USER_FRAMES in frames by first_open (stable, NaT last), in
+    place, so user_index can turn date ranges into slices.  The derived parquet
+    and the Arrow snapshot keep this order, so it is only paid once per run_date.
+    """
+    for name in INDEXED_USER_FRAMES:
+        df = frames.get(name)
+        if df is not None and "first_open" in df.columns:
+            frames[name] = df.sort_values("first_open", kind="stable", na_position="last", ignore_index=True)
+    return frames
+
+
+def _load_and_prepare(load, prepare):
+    started = time.perf_counter()
+    df = load()
+    loaded = time.perf_counter()
+    if prepare is not None:
+        df = prepare(df)
+    return df, loaded - started, time.perf_counter() - loaded
+
+
+# Per-dataset post-processing, run as soon as that dataset's download finishes
+
+def prepare_cr_users(df):
+    df = fix_date_columns(df, ["first_open", "last_event_date"])
+    df["app_language"] = clean_language_column(df)
+    return df
+
+
+def prepare_cr_app_launch(df):
+    df = fix_date_columns(df, ["first_open"])
+    df["app_language"] = clean_language_column(df)
+    return df
+
+
+def prepare_unity_users(df):
+    df = fix_date_columns(df, ["first_open", "la_date", "last_event_date"])
+    max_level_indices = df.groupby("user_pseudo_id")["max_user_level"].idxmax()
+    return df.loc[max_level_indices].reset_index(drop=True)
+
+
+def prepare_book_dates(df):
+    return fix_date_columns(df, ["first_access_date", "last_access_date"])
 
-            st.session_state["df_cr_users"] = df_cr_users
-            st.session_state["df_unity_users"] = df_unity_users
-            st.session_state["df_cr_app_launch"] = df_cr_app_launch
-            st.session_state["df_cr_book_user_cohorts"] = df_cr_book_user_cohorts
-            st.session_state["df_cr_cohorts"] = df_cr_cohorts
-            st.session_state["df_cr_book_user_book_summary"] = df_cr_book_user_book_summary  # NEW
-            st.session_state["user_data_initialized"] = True
 
-        settings.get_logger().debug(
-            profiler.output(ConsoleRenderer(show_all=False, timeline=True, color=True, unicode=True, short_mode=False))
-        )
-        
-        
 # Language cleanup
 def clean_language_column(df):
     return df["app_language"].replace({
@@ -134,32 +548,26 @@ def clean_language_column(df):
         "farsitest": "farsi"
     })
 
-@st.cache_data(ttl="1d", show_spinner=False)
+@observed_cache_data(ttl="1d", show_spinner=False)
 def get_language_list():
-
-    _, bq_client = get_gcp_credentials()
-
     sql_query = f"""
                 SELECT display_language
                 FROM `dataexploration-193817.user_data.language_max_level`
                 ;
                 """
-    rows_raw = bq_client.query(sql_query)
-    rows = [dict(row) for row in rows_raw]
-    if len(rows) == 0:
+    df = run_bq_query(sql_query)
+    if len(df) == 0:
         return pd.DataFrame()
 
-    df = pd.DataFrame(rows)
     df.drop_duplicates(inplace=True)
     lang_list = np.array(df.values).flatten().tolist()
     lang_list = [x.strip(" ") for x in lang_list]
     return lang_list
 
 
-@st.cache_data(ttl="1d", show_spinner=False)
+@observed_cache_data(ttl="1d", show_spinner=False)
 def get_country_list():
     countries_list = []
-    _, bq_client = get_gcp_credentials()
 
     sql_query = f"""
                 SELECT country
@@ -167,12 +575,10 @@ def get_country_list():
                 order by country asc
                 ;
                 """
-    rows_raw = bq_client.query(sql_query)
-    rows = [dict(row) for row in rows_raw]
-    if len(rows) == 0:
+    df = run_bq_query(sql_query)
+    if len(df) == 0:
         return pd.DataFrame()
 
-    df = pd.DataFrame(rows)
     countries_list = np.array(df.values).flatten().tolist()
     return countries_list
 
@@ -181,16 +587,13 @@ def get_country_list():
 # to a single entry based on which combination took them the furthest in the game.
 # If its a tie, will take the first entry. The reference to duplicates are users
 # with multiple entries because of variations in these combinations
+# Runs once per run_date inside load_user_dataset, so it is not cached separately.
 
-@st.cache_data(ttl="1d", show_spinner=False)
 def clean_cr_users_to_single_language(df_app_launch, df_cr_users):
 
     # ✅  Identify and remove all duplicates from df_app_launch, but SAVE them for later
     duplicate_user_ids = df_app_launch[df_app_launch.duplicated(subset='user_pseudo_id', keep=False)]
-    df_app_launch = df_app_launch[~df_app_launch["cr_user_id"].isin(duplicate_user_ids["cr_user_id"])]
-
-    # ✅  Get list of users that had duplicates
-    unique_duplicate_ids = duplicate_user_ids['cr_user_id'].unique().tolist()
+    df_app_launch = df_app_launch[~isin_keys(df_app_launch["cr_user_id"], duplicate_user_ids["cr_user_id"])]
 
     # ✅  Define event ranking of the funnel
     event_order = ["download_completed", "tapped_start", "selected_level", "puzzle_completed", "level_completed"]
@@ -225,11 +628,8 @@ def clean_cr_users_to_single_language(df_app_launch, df_cr_users):
     if not language_mismatch.empty:
 
         # ✅ Update df_app_launch to reflect the correct `app_language` from df_cr_users
-        df_app_launch.loc[df_app_launch["cr_user_id"].isin(language_mismatch["cr_user_id"]), "app_language"] = \
-            df_app_launch["cr_user_id"].map(df_cr_users.set_index("cr_user_id")["app_language"])
-
-    # ✅ Ensure all users with duplicates exist in df_cr_users
-    missing_users = set(unique_duplicate_ids) - set(df_cr_users["cr_user_id"])
+        df_app_launch.loc[isin_keys(df_app_launch["cr_user_id"], language_mismatch["cr_user_id"]), "app_language"] = \
+            map_keys(df_app_launch["cr_user_id"], df_cr_users.set_index("cr_user_id")["app_language"])
 
     # ✅ Add back the correct user rows in df_app_launch, ensuring **matching language & country**
     users_to_add_back = duplicate_user_ids.merge(
@@ -241,8 +641,8 @@ def clean_cr_users_to_single_language(df_app_launch, df_cr_users):
     # ✅ Drop NaN values to ensure only valid rows are added back
     users_to_add_back = users_to_add_back.dropna(subset=["app_language"])
 
-    # ✅ If any users are still missing, add a fallback row for them
-    fallback_users = duplicate_user_ids[duplicate_user_ids["cr_user_id"].isin(missing_users)]
+    # ✅ If any users with duplicates are missing from df_cr_users, add a fallback row for them
+    fallback_users = duplicate_user_ids[~isin_keys(duplicate_user_ids["cr_user_id"], df_cr_users["cr_user_id"])]
     fallback_users = fallback_users.drop_duplicates(subset="cr_user_id", keep="first")
 
     # Append the fallback users
@@ -261,8 +661,8 @@ def clean_cr_users_to_single_language(df_app_launch, df_cr_users):
     # This is a fix for a nasty bug where a user can have a different first_open in one dataframe vs the other.
     # Its because cr_app_launch is Curious Reader first open but cr_user_progress is FTM first_open
     mask_cr = df_cr_users["app"] == "CR"
-    df_cr_users.loc[mask_cr, "first_open"] = df_cr_users.loc[mask_cr, "cr_user_id"].map(
-        df_app_launch.set_index("cr_user_id")["first_open"]
+    df_cr_users.loc[mask_cr, "first_open"] = map_keys(
+        df_cr_users.loc[mask_cr, "cr_user_id"], df_app_launch.set_index("cr_user_id")["first_open"]
     )
     
     return df_app_launch, df_cr_users
@@ -275,7 +675,18 @@ def fix_date_columns(df, columns):
     return df
 
 
-@st.cache_data(ttl="1d", show_spinner="Getting timeline")
+# Name in the shared dataset -> (GCS loader, post-processing step)
+USER_DATASET_LOADERS = {
+    "df_cr_users": (load_cr_user_progress_from_gcs, prepare_cr_users),
+    "df_unity_users": (load_unity_user_progress_from_gcs, prepare_unity_users),
+    "df_cr_app_launch": (load_cr_app_launch_from_gcs, prepare_cr_app_launch),
+    "df_cr_book_user_cohorts": (load_cr_book_user_cohorts_from_gcs, prepare_book_dates),
+    "df_cr_cohorts": (load_cr_cohorts_from_gcs, None),
+    "df_cr_book_user_book_summary": (load_cr_book_user_book_summary_from_gcs, prepare_book_dates),
+}
+
+
+@observed_cache_data(ttl="1d", show_spinner="Getting timeline")
 def get_users_ftm_event_timeline(cr_user_id_list):
     if isinstance(cr_user_id_list, str):
         cr_user_id_list = [cr_user_id_list]
@@ -283,8 +694,6 @@ def get_users_ftm_event_timeline(cr_user_id_list):
     if not cr_user_id_list:
         raise ValueError("cr_user_id_list must be a non-empty list of user IDs.")
 
-    _, bq_client = get_gcp_credentials()
-
     user_list = ', '.join([f"'{u}'" for u in cr_user_id_list])
 
     sql = f"""
@@ -312,34 +721,42 @@ def get_users_ftm_event_timeline(cr_user_id_list):
             puzzle_number
     """
 
-    df = bq_client.query(sql).to_dataframe()
+    df = run_bq_query(sql)
     return df
 
-@st.cache_data(ttl="1d",show_spinner=False)
 def get_cohort_list():
-    df = st.session_state.get("df_cr_cohorts")
-    if df is None or df.empty:
-        return []
-    return sorted(df["cohort_name"].dropna().unique().tolist(), key=str.lower, reverse=True)
+    """Cohort names of the loaded df_cr_cohorts, cached per dataset version."""
+    return cohort_names(get_user_df("df_cr_cohorts"))
+
+
+@cache_frames(ttl="1d", show_spinner=False)
+def cohort_names(df_cohorts):
+    # Keyed by the frame's dataset token, so a new run_date lists its own cohorts
+    return sorted(cohort_index(df_cohorts).names(), key=str.lower, reverse=True)
 
 
-@st.cache_data(ttl="1d",show_spinner=False)
 def get_cohort_user_ids(cohort_name):
     """
-    Returns a list of cr_user_id from your cohort table.
-    """
-    _, bq_client = get_gcp_credentials()
-    sql = f"""
-        SELECT cr_user_id
-        FROM `dataexploration-193817.user_data.cr_cohorts`
-        where cohort_name = '{cohort_name}'
+    Returns the sorted list of cr_user_id in the cohort, from the cohort index
+    of the loaded df_cr_cohorts.
     """
+    return cohort_index(get_user_df("df_cr_cohorts")).members_of([cohort_name]).tolist()
+
 
-    df = bq_client.query(sql).to_dataframe()
-    return df["cr_user_id"].dropna().unique().tolist()
+def get_cohort_users(cohort_name, name="df_cr_users"):
+    """
+    The rows of the user frame name (one of INDEXED_USER_FRAMES) whose user is
+    in the cohort, in the frame's order.
+    """
+    df = get_user_df(name)
+    index = frame_index(df)
+    if index is None or index.cohorts is None:
+        user_ids = cohort_index(get_user_df("df_cr_cohorts")).members_of([cohort_name])
+        return df[isin_keys(df["cr_user_id"], user_ids)]
+    return df.take(index.select_cohorts(None, [cohort_name]))
 
 
-@st.cache_data(ttl="1d", show_spinner=False)
+@observed_cache_data(ttl="1d", show_spinner=False)
 def get_book_summary_for_cohort(cohort_ids):
     if not cohort_ids:
         return pd.DataFrame()
@@ -366,8 +783,6 @@ def get_book_summary_for_cohort(cohort_ids):
       c.distinct_books_accessed DESC
     """
 
-    _, bq_client = get_gcp_credentials()
-
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
             bigquery.ArrayQueryParameter(
@@ -378,10 +793,10 @@ def get_book_summary_for_cohort(cohort_ids):
         ]
     )
 
-    return bq_client.query(sql, job_config=job_config).to_dataframe()
+    return run_bq_query(sql, job_config=job_config)
 
 
-@st.cache_data(ttl="1d", show_spinner=False)
+@observed_cache_data(ttl="1d", show_spinner=False)
 def get_books_for_user(cr_user_id: str) -> pd.DataFrame:
     """
     Return a per-book summary for a single cr_user_id using the new canonical
@@ -423,6 +838,5 @@ def get_books_for_user(cr_user_id: str) -> pd.DataFrame:
       book_id
     """
 
-    _, bq_client = get_gcp_credentials()
-    return bq_client.query(sql).to_dataframe()
+    return run_bq_query(sql)
 
@@ -0,0 +1,78 @@
+import sys
+import threading
+import time
+
+import streamlit as st
+
+# Builds everything the first page view would otherwise wait for: GCP credentials,
+# the latest run_date, the shared user dataset, the campaign data, the
+# language/country lists and the default view of every page (precompute).
+#
+# Run as a CLI from entrypoint.sh before `streamlit run`, so the server only starts
+# listening (and the health check only passes) once the on-disk parquet mirror and
+# Arrow snapshot for the latest run_date exist; the server process then memory-maps
+# the snapshot instead of downloading.  main.py also starts the same stages in a
+# background thread once per server process, to fill that process's in-memory caches
+# before the first analyst needs them.
+
+
+def warmup_stages():
+    import campaigns
+    import precompute
+    import settings
+    import users
+
+    return [
+        ("gcp credentials", settings.get_gcp_credentials),
+        ("latest run_date", users.get_latest_run_date),
+        ("user dataset", users.get_user_data),
+        ("campaign data", campaigns.get_campaign_data),
+        ("language list", users.get_language_list),
+        ("country list", users.get_country_list),
+        ("default page views", precompute.precompute_default_views),
+    ]
+
+
+def run_warmup():
+    """Run every warm-up stage, log how long each took, and return True if all succeeded."""
+    import settings
+
+    settings.initialize()
+    logger = settings.get_logger()
+
+    ok = True
+    timings = []
+    started = time.perf_counter()
+    for name, stage in warmup_stages():
+        stage_started = time.perf_counter()
+        try:
+            stage()
+            status = "ok"
+        except Exception as e:
+            # Best effort: a failed stage is simply rebuilt on the first page view
+            logger.exception(f"Warm-up stage '{name}' failed")
+            status = f"failed: {e}"
+            ok = False
+        timings.append(f"  {name:<32} {time.perf_counter() - stage_started:7.2f}s  {status}")
+
+    logger.info(
+        f"Warm-up finished in {time.perf_counter() - started:.2f}s\n" + "\n".join(timings)
+    )
+    return ok
+
+
+@st.cache_resource(show_spinner=False)
+def start_background_warmup():
+    """Start run_warmup on a daemon thread, once per server process."""
+    thread = threading.Thread(target=run_warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    # Outside `streamlit run` the st.cache_* decorators fall back to in-memory caches
+    # and log a "no runtime" warning on every call; keep the output to the timings
+    from streamlit.logger import set_log_level
+    set_log_level("error")
+
+    sys.exit(0 if run_warmup() else 1)